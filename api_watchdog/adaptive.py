@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import statistics
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# server responses meaning it is overloaded, as opposed to the test failing
+OVERLOAD_STATUS_CODES = frozenset({429, 502, 503, 504})
+
+
+class Decision(NamedTuple):
+    """A change of the concurrency limit, and why it was made."""
+
+    time: float
+    limit: int
+    reason: str
+    latency: float
+    error_rate: float
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD controller for the number of requests in flight.
+
+    Requests are observed in windows of as many requests as the current
+    limit. After each window the limit is cut by decrease when more than
+    max_error_rate of its requests failed to reach the host or were refused
+    as overload, or when its median latency exceeds tolerance times the
+    lowest median latency seen so far. Otherwise the limit grows: doubling
+    until the first cut (slow start), by one request afterwards. The limit
+    always stays within [minimum, maximum].
+    """
+
+    def __init__(
+        self,
+        maximum: int,
+        minimum: int = 1,
+        initial: Optional[int] = None,
+        tolerance: float = 2.0,
+        max_error_rate: float = 0.1,
+        decrease: float = 0.5,
+    ):
+        self.maximum = max(maximum, 1)
+        self.minimum = min(max(minimum, 1), self.maximum)
+        self.tolerance = tolerance
+        self.max_error_rate = max_error_rate
+        self.decrease = decrease
+        self._limit = min(max(initial or self.minimum, self.minimum), self.maximum)
+        self._slow_start = True
+        self._baseline: Optional[float] = None
+        self._latencies: List[float] = []
+        self._errors = 0
+        self._lock = threading.Lock()
+        self.decisions: List[Decision] = []
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @staticmethod
+    def failed(status_code: int, reached: bool) -> bool:
+        """Whether a response says the host is struggling."""
+        return not reached or status_code in OVERLOAD_STATUS_CODES
+
+    def observe(self, latency: float, failed: bool):
+        """Record a completed request, adjusting the limit after each window."""
+        with self._lock:
+            self._latencies.append(latency)
+            self._errors += failed
+            if len(self._latencies) >= self._limit:
+                self._decide()
+
+    def _decide(self):
+        samples = len(self._latencies)
+        error_rate = self._errors / samples
+        latency = statistics.median(self._latencies)
+        self._latencies = []
+        self._errors = 0
+
+        if error_rate > self.max_error_rate:
+            reason = f"{error_rate:.0%} of requests failed"
+            limit = int(self._limit * self.decrease)
+        elif self._baseline is not None and latency > self.tolerance * self._baseline:
+            reason = (
+                f"median latency {latency:.3f}s is over {self.tolerance:g} times"
+                f" the baseline {self._baseline:.3f}s"
+            )
+            limit = int(self._limit * self.decrease)
+        else:
+            reason = f"stable, median latency {latency:.3f}s"
+            limit = self._limit * 2 if self._slow_start else self._limit + 1
+        if limit < self._limit:
+            self._slow_start = False
+        if error_rate <= self.max_error_rate:
+            self._baseline = latency if self._baseline is None else min(self._baseline, latency)
+
+        limit = min(max(limit, self.minimum), self.maximum)
+        if limit == self._limit:
+            return
+        logger.info(f"Concurrency {self._limit} -> {limit}: {reason}")
+        self._limit = limit
+        self.decisions.append(Decision(time.monotonic(), limit, reason, latency, error_rate))
+
+
+class AdaptiveSemaphore:
+    """
+    Async counterpart of a semaphore whose size follows an
+    AdaptiveConcurrency controller.
+    """
+
+    def __init__(self, controller: AdaptiveConcurrency):
+        self.controller = controller
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self._in_flight < self.controller.limit
+            )
+            self._in_flight += 1
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
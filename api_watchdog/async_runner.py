@@ -0,0 +1,403 @@
+import asyncio
+import concurrent.futures
+import logging
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+try:
+    import aiohttp
+    from aiohttp.helpers import get_env_proxy_for_url
+    from aiohttp.tracing import Trace
+    from yarl import URL
+except ImportError:
+    aiohttp = None
+
+from api_watchdog.adaptive import AdaptiveSemaphore
+from api_watchdog.core import (
+    RateLimit,
+    RetentionPolicy,
+    RetryPolicy,
+    Timings,
+    WatchdogTest,
+    WatchdogResult,
+)
+from api_watchdog.history import LatencyHistory
+from api_watchdog.limits import AsyncHostLimiter
+from api_watchdog.retry import parse_retry_after
+from api_watchdog.runner import (
+    STREAM_CHUNK_SIZE,
+    ByteCounter,
+    Fetched,
+    ResponseTooLargeError,
+    Timer,
+    WatchdogRunner,
+    evaluate_fetched,
+)
+from api_watchdog.stream import StreamProjector
+from api_watchdog.timing import AIOHTTP_UNMEASURED, Phases, trace_config
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncWatchdogRunner(WatchdogRunner):
+    """
+    Runner that issues requests from a single asyncio event loop.
+
+    Unlike WatchdogRunner, concurrency is not bound to a number of threads;
+    up to max_in_flight requests may be outstanding at once. Expectations are
+    evaluated exactly as in WatchdogRunner, off the event loop in the default
+    thread pool (or the process pool of eval_workers). With adaptive,
+    max_in_flight is the ceiling of the adaptive limit.
+    """
+
+    unmeasured = AIOHTTP_UNMEASURED
+
+    def __init__(
+        self,
+        max_in_flight: int = 1000,
+        fast_path: bool = False,
+        stream: bool = False,
+        max_response_bytes: Optional[int] = None,
+        retention: Optional[RetentionPolicy] = None,
+        eval_workers: Optional[int] = None,
+        coalesce: bool = False,
+        rate_limit: Optional[RateLimit] = None,
+        limit_per_proxy: bool = False,
+        retry: Optional[RetryPolicy] = None,
+        retry_budget: Optional[int] = None,
+        breaker_threshold: Optional[int] = None,
+        breaker_reset: float = 30.0,
+        connect_timeout: float = 120.0,
+        read_timeout: float = 120.0,
+        deadline: Optional[float] = None,
+        history: Optional[LatencyHistory] = None,
+        adaptive: bool = False,
+        warm_up: bool = False,
+    ):
+        if aiohttp is None:
+            raise ImportError(
+                "AsyncWatchdogRunner requires aiohttp to be installed."
+            )
+        super().__init__(
+            fast_path=fast_path,
+            stream=stream,
+            max_response_bytes=max_response_bytes,
+            retention=retention,
+            eval_workers=eval_workers,
+            coalesce=coalesce,
+            rate_limit=rate_limit,
+            limit_per_proxy=limit_per_proxy,
+            retry=retry,
+            retry_budget=retry_budget,
+            breaker_threshold=breaker_threshold,
+            breaker_reset=breaker_reset,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            deadline=deadline,
+            history=history,
+            adaptive=adaptive,
+            warm_up=warm_up,
+        )
+        self.max_in_flight = max_in_flight
+
+    def _concurrency(self) -> int:
+        return self.max_in_flight
+
+    def run_test(self, test: WatchdogTest) -> WatchdogResult:
+        return asyncio.run(self.run_tests_async([test]))[0]
+
+    def run_tests(
+        self, tests: Iterable[WatchdogTest]
+    ) -> Iterator[WatchdogResult]:
+        return iter(asyncio.run(self.run_tests_async(tests)))
+
+    async def run_test_async(
+        self,
+        test: WatchdogTest,
+        session: "aiohttp.ClientSession",
+        semaphore: asyncio.Semaphore,
+        evaluation_pool: Optional[concurrent.futures.Executor] = None,
+    ) -> WatchdogResult:
+        fetched = await self._fetch_with_retries_async(test, session, semaphore)
+        return await self._evaluate_async(test, fetched, evaluation_pool)
+
+    async def _run_group_async(
+        self,
+        tests: List[WatchdogTest],
+        indexes: List[int],
+        session: "aiohttp.ClientSession",
+        semaphore: asyncio.Semaphore,
+        limiter: AsyncHostLimiter,
+        evaluation_pool: Optional[concurrent.futures.Executor] = None,
+    ) -> List[WatchdogResult]:
+        # wait for the host before taking one of the max_in_flight slots
+        async with limiter.slot(self._limit_key(tests[indexes[0]])):
+            fetched = await self._fetch_with_retries_async(
+                tests[indexes[0]], session, semaphore, limiter
+            )
+        if len(indexes) > 1:
+            fetched.shared_request = self.request_key(tests[indexes[0]])
+        return [
+            await self._evaluate_async(tests[i], fetched, evaluation_pool)
+            for i in indexes
+        ]
+
+    async def _evaluate_async(
+        self,
+        test: WatchdogTest,
+        fetched: Fetched,
+        evaluation_pool: Optional[concurrent.futures.Executor] = None,
+    ) -> WatchdogResult:
+        if evaluation_pool is None:
+            # parsing, jq and validation of a large response would otherwise
+            # hold up the event loop, and with it every request in flight
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self._evaluate, test, fetched
+            )
+        return await asyncio.get_running_loop().run_in_executor(
+            evaluation_pool,
+            evaluate_fetched,
+            self._evaluation_settings(),
+            test,
+            fetched,
+        )
+
+    async def _fetch_with_retries_async(
+        self,
+        test: WatchdogTest,
+        session: "aiohttp.ClientSession",
+        semaphore: asyncio.Semaphore,
+        limiter: Optional[AsyncHostLimiter] = None,
+    ) -> Fetched:
+        attempts = []
+        while True:
+            # the breaker is asked once the request can be sent, so that the
+            # requests queued behind a failing host see its circuit open
+            async with semaphore:
+                if not self._breaker_allows(test):
+                    if not attempts:
+                        return self._skipped(test)
+                    break
+                fetched = None
+                try:
+                    fetched = await self._fetch_async(test, session)
+                finally:
+                    if fetched is None:
+                        # cancelled, eg. at the deadline
+                        self._breaker_release(test)
+            self._breaker_record(test, fetched)
+            self._observe(fetched)
+            attempts.append(self._attempt(fetched))
+            delay = self._retry_delay(test, fetched, len(attempts))
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+            if limiter is not None:
+                # the slot took a token for the first attempt only
+                await limiter.token(self._limit_key(test))
+        if len(attempts) > 1:
+            fetched.attempts = attempts
+        return fetched
+
+    async def _fetch_async(
+        self,
+        test: WatchdogTest,
+        session: "aiohttp.ClientSession",
+    ) -> Fetched:
+        logger.info(f"[{test.target}]: Running {test.name}...")
+        body = self._request_body(test)
+        proxy = (self._proxies(test) or {}).get(urlparse(test.target).scheme)
+        stream_paths = self._stream_paths(test)
+        max_response_bytes = self._max_response_bytes(test)
+        counter = ByteCounter(max_response_bytes)
+        content = None
+        document = None
+        retry_after = None
+        reached = True
+
+        connect_timeout, read_timeout = self._timeouts(test)
+        request_kwargs = {
+            "proxy": proxy,
+            "timeout": aiohttp.ClientTimeout(
+                sock_connect=connect_timeout, sock_read=read_timeout
+            ),
+        }
+        if body is not None:
+            assert type(body) == dict, 'test.payload must be a dict.'
+            request_kwargs["json"] = body
+
+        timer = Timer()
+
+        with timer:
+            phases = request_kwargs["trace_request_ctx"] = Phases(AIOHTTP_UNMEASURED)
+            try:
+                response = await session.request(test.method, test.target, **request_kwargs)
+
+                async with response:
+                    status_code = response.status
+                    if 400 <= status_code <= 599:
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    else:
+                        counter.check_declared(response.headers.get("Content-Length"))
+                        projector = StreamProjector(stream_paths) if stream_paths is not None else None
+                        chunks = []
+                        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                            counter.add(chunk)
+                            if projector is not None:
+                                projector.feed(chunk)
+                            else:
+                                chunks.append(chunk)
+                        if projector is not None:
+                            document = projector.close()
+                        else:
+                            content = b"".join(chunks)
+            except ResponseTooLargeError:
+                logger.error(
+                    f'{test.name} Response larger than {max_response_bytes} bytes,'
+                    f' aborted after {counter.received} bytes'
+                )
+                status_code = 413
+            except asyncio.TimeoutError as e:
+                logger.error(f'{test.name} Timeout: {e}')
+                status_code = 408
+                reached = False
+            except aiohttp.ClientError as e:
+                logger.error(f'{test.name} Request Error: {e}')
+                status_code = 503
+                reached = False
+            except Exception as e:
+                logger.error(f'{test.name} Exception: {e}')
+                status_code = 500
+            phases.finish()
+
+        latency = timer.time
+        logger.info(f"[{test.target}]: {test.name} took {latency} with status code {status_code}")
+
+        return Fetched(
+            status_code=status_code,
+            latency=latency,
+            response_bytes=counter.received,
+            content=content,
+            document=document,
+            stream_paths=stream_paths,
+            retry_after=retry_after,
+            reached=reached,
+            timings=phases.timings(),
+        )
+
+    async def run_tests_async(
+        self, tests: Iterable[WatchdogTest]
+    ) -> List[WatchdogResult]:
+        tests = list(tests)
+        self._check_metrics(tests)
+        groups = self._request_groups(tests)
+        results: List[Optional[WatchdogResult]] = [None] * len(tests)
+        limiter = AsyncHostLimiter(self._host_limits(tests))
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight)
+        evaluation_pool = self._evaluation_pool()
+        try:
+            # trust_env picks up HTTP(S)_PROXY, like requests does
+            async with aiohttp.ClientSession(
+                connector=connector, trace_configs=[trace_config()], trust_env=True
+            ) as session:
+                if self.warm_up:
+                    await self._warm_up_async(tests, groups, session)
+                self._start_run()
+                semaphore = (
+                    AdaptiveSemaphore(self.concurrency)
+                    if self.concurrency is not None
+                    else asyncio.Semaphore(self.max_in_flight)
+                )
+                tasks = [
+                    asyncio.ensure_future(self._run_group_async(
+                        tests, indexes, session, semaphore, limiter, evaluation_pool
+                    ))
+                    for indexes in groups
+                ]
+                if tasks:
+                    _, pending = await asyncio.wait(
+                        tasks, timeout=self._until_deadline(None)
+                    )
+                    # past the deadline, requests in flight are aborted
+                    for task in pending:
+                        task.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            if evaluation_pool is not None:
+                evaluation_pool.shutdown(wait=not self._expired(), cancel_futures=True)
+        for indexes, task in zip(groups, tasks):
+            if not task.cancelled():
+                for i, result in zip(indexes, task.result()):
+                    results[i] = result
+        return self._finish_run(tests, results)
+
+    async def _warm_up_async(
+        self,
+        tests: List[WatchdogTest],
+        groups: List[List[int]],
+        session: "aiohttp.ClientSession",
+    ):
+        """Open the connections of the run ahead of it, see warm_up."""
+        self._start_warm_up()
+        plan = self._warm_up_plan(tests, groups)
+        timer = Timer()
+        with timer:
+            opened = await asyncio.gather(*(
+                asyncio.gather(*(
+                    self._open_connection_async(test, session)
+                    for _ in range(connections)
+                ), return_exceptions=True)
+                for test, connections in plan
+            ))
+        # connections only go back to the pool once all are open, so that
+        # none is handed out twice
+        warm_ups = []
+        for (test, _), host_opened in zip(plan, opened):
+            timings, errors = [], []
+            for outcome in host_opened:
+                if isinstance(outcome, BaseException):
+                    errors.append(outcome)
+                    continue
+                connection, connection_timings = outcome
+                connection.release()
+                timings.append(connection_timings)
+            warm_ups.append(self._host_warm_up(test, timings, errors))
+        self._report_warm_up(warm_ups, timer.time)
+
+    async def _open_connection_async(
+        self, test: WatchdogTest, session: "aiohttp.ClientSession"
+    ) -> Tuple[Any, Timings]:
+        """Open a connection of the pool a test will use, without using it."""
+        url = URL(test.target)
+        proxy = (self._proxies(test) or {}).get(url.scheme)
+        proxy_auth = None
+        if proxy:
+            proxy = URL(proxy)
+        elif session.trust_env:
+            # resolved like ClientSession does, so the connection is pooled
+            # under the same key as the requests of the test
+            try:
+                proxy, proxy_auth = get_env_proxy_for_url(url)
+            except LookupError:
+                proxy = None
+        request = aiohttp.ClientRequest(
+            test.method or "GET",
+            url,
+            proxy=proxy,
+            proxy_auth=proxy_auth,
+            loop=asyncio.get_running_loop(),
+            session=session,
+        )
+        phases = Phases(AIOHTTP_UNMEASURED)
+        traces = [
+            Trace(session, config, config.trace_config_ctx(trace_request_ctx=phases))
+            for config in session.trace_configs
+        ]
+        # aiohttp has no public way to open a connection without a request
+        connection = await session.connector.connect(
+            request,
+            traces=traces,
+            timeout=aiohttp.ClientTimeout(sock_connect=self._warm_up_timeout(test)),
+        )
+        phases.finish()
+        return connection, phases.timings()
@@ -0,0 +1,236 @@
+import concurrent.futures
+import itertools
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, StrictStr
+
+from api_watchdog.collect import WatchdogResultGroup, collect_results
+from api_watchdog.core import WatchdogResult, WatchdogTest
+from api_watchdog.histogram import LatencyHistogram
+from api_watchdog.limits import TokenBucket
+from api_watchdog.runner import WatchdogRunner
+
+PERCENTILES = (50, 90, 99)
+
+
+class BenchStats(BaseModel):
+    name: StrictStr
+    requests: int
+    errors: int
+    checked: int
+    failed: int
+    throughput: float
+    mean: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p99: Optional[float] = None
+    max: Optional[float] = None
+
+
+class BenchReport(BaseModel):
+    name: StrictStr
+    duration: float
+    stats: BenchStats
+    tests: List[BenchStats]
+    groups: List["BenchReport"]
+
+
+BenchReport.update_forward_refs()
+
+
+class _TestSamples:
+    """Everything measured for one test during a bench."""
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.requests = 0
+        self.errors = 0
+        self.checked = 0
+        self.failed = 0
+        self.result: Optional[WatchdogResult] = None
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        latency: Optional[float],
+        error: bool,
+        result: Optional[WatchdogResult],
+    ):
+        with self._lock:
+            if latency is not None:
+                self.histogram.record(latency)
+            self.requests += 1
+            self.errors += error
+            if result is not None:
+                self.checked += 1
+                self.failed += not result.success
+                if self.result is None:
+                    self.result = result
+
+    def merge(self, other: "_TestSamples"):
+        self.histogram.merge(other.histogram)
+        self.requests += other.requests
+        self.errors += other.errors
+        self.checked += other.checked
+        self.failed += other.failed
+
+    def stats(self, name: str, duration: float) -> BenchStats:
+        histogram = self.histogram
+        return BenchStats(
+            name=name,
+            requests=self.requests,
+            errors=self.errors,
+            checked=self.checked,
+            failed=self.failed,
+            throughput=self.requests / duration if duration > 0 else 0.0,
+            mean=histogram.mean,
+            max=histogram.max,
+            **{f"p{p}": histogram.percentile(p) for p in PERCENTILES},
+        )
+
+
+class Bench:
+    """
+    Replays tests many times to measure the distribution of their latency.
+
+    Every test is sent iterations times (or, with duration, round robin until
+    that many seconds have passed), with at most concurrency requests in
+    flight and, with rps, at most that many requests started per second.
+    Requests go through the runner, with its sessions, timeouts, retries and
+    circuit breaker. The expectations of a test are checked on one in
+    1 / sample_rate of its responses, always including the first.
+
+    Latencies are kept in a LatencyHistogram per test, so memory does not
+    grow with the number of requests.
+    """
+
+    def __init__(
+        self,
+        runner: WatchdogRunner,
+        iterations: int = 10,
+        duration: Optional[float] = None,
+        rps: Optional[float] = None,
+        concurrency: int = 16,
+        sample_rate: float = 0.1,
+    ):
+        self.runner = runner
+        self.iterations = iterations
+        self.duration = duration
+        self.rps = rps
+        self.concurrency = concurrency
+        self.sample_every = max(round(1 / sample_rate), 1) if sample_rate > 0 else None
+
+    def _replays(self, count: int, started: float) -> Iterator[Tuple[int, int]]:
+        """(replay, test index) of every request to send, in order."""
+        for replay in itertools.count():
+            if self.duration is None and replay >= self.iterations:
+                return
+            for i in range(count):
+                if self.duration is not None and time.monotonic() - started >= self.duration:
+                    return
+                yield replay, i
+
+    def _replay(self, test: WatchdogTest, samples: _TestSamples, replay: int):
+        fetched = self.runner._fetch_with_retries(test)
+        error = (
+            fetched.skipped is not None
+            or not fetched.reached
+            or 400 <= fetched.status_code <= 599
+        )
+        result = None
+        if self.sample_every is not None and replay % self.sample_every == 0:
+            result = self.runner._evaluate(test, fetched)
+        samples.add(None if fetched.skipped else fetched.latency, error, result)
+
+    def run(self, tests: List[WatchdogTest]) -> BenchReport:
+        samples = [_TestSamples() for _ in tests]
+        bucket = TokenBucket(self.rps) if self.rps else None
+        started = time.monotonic()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.concurrency
+            ) as executor:
+                in_flight: Set[concurrent.futures.Future] = set()
+                for replay, i in self._replays(len(tests), started):
+                    while bucket is not None:
+                        delay = bucket.try_acquire()
+                        if not delay:
+                            break
+                        time.sleep(delay)
+                    # requests are submitted as workers free up, so that the
+                    # rate is kept and the queue stays short
+                    while len(in_flight) >= self.concurrency:
+                        done, in_flight = concurrent.futures.wait(
+                            in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+                        )
+                        for future in done:
+                            future.result()
+                    in_flight.add(
+                        executor.submit(self._replay, tests[i], samples[i], replay)
+                    )
+                for future in concurrent.futures.as_completed(in_flight):
+                    future.result()
+        finally:
+            self.runner.close()
+        duration = time.monotonic() - started
+        return self._report(tests, samples, duration)
+
+    def _report(
+        self,
+        tests: List[WatchdogTest],
+        samples: List[_TestSamples],
+        duration: float,
+    ) -> BenchReport:
+        """Summarize the samples per test and per group of collect_results."""
+        by_test: Dict[Tuple[str, str], _TestSamples] = {}
+        results = []
+        for test, test_samples in zip(tests, samples):
+            key = (test.name, str(test.target))
+            if key in by_test:
+                by_test[key].merge(test_samples)
+                continue
+            by_test[key] = test_samples
+            if test_samples.result is not None:
+                results.append(test_samples.result)
+            else:
+                # no response was checked, group the test by its target alone
+                results.append(
+                    WatchdogResult(
+                        test_name=test.name,
+                        target=test.target,
+                        success=False,
+                        latency=0.0,
+                        timestamp=time.time(),
+                        email_to=test.email_to,
+                        payload=None,
+                        response=None,
+                        results=[],
+                    )
+                )
+
+        def report(group: WatchdogResultGroup) -> Tuple[BenchReport, _TestSamples]:
+            total = _TestSamples()
+            test_stats = []
+            for result in sorted(group.results, key=lambda r: r.test_name):
+                test_samples = by_test[(result.test_name, str(result.target))]
+                total.merge(test_samples)
+                test_stats.append(test_samples.stats(result.test_name, duration))
+            subgroups = []
+            for subgroup in sorted(group.groups, key=lambda g: g.name):
+                subgroup_report, subgroup_samples = report(subgroup)
+                total.merge(subgroup_samples)
+                subgroups.append(subgroup_report)
+            return (
+                BenchReport(
+                    name=group.name,
+                    duration=duration,
+                    stats=total.stats(group.name, duration),
+                    tests=test_stats,
+                    groups=subgroups,
+                ),
+                total,
+            )
+
+        return report(collect_results(results))[0]
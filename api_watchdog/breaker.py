@@ -0,0 +1,69 @@
+import threading
+import time
+from typing import Dict, Hashable
+
+
+class _Circuit:
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+
+class CircuitBreaker:
+    """
+    Per key (host) circuit breaker.
+
+    After threshold consecutive failures to reach a host (connection errors
+    or timeouts) its circuit opens and allow() refuses further requests to
+    it. Once reset_timeout seconds have passed, a single probe request is
+    allowed through: if it reaches the host the circuit closes again,
+    otherwise it stays open for another reset_timeout.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float = 30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._circuits: Dict[Hashable, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: Hashable) -> bool:
+        """Whether a request to key may be sent now."""
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.opened_at is None:
+                return True
+            if circuit.probing:
+                return False
+            if time.monotonic() - circuit.opened_at < self.reset_timeout:
+                return False
+            circuit.probing = True
+            return True
+
+    def record(self, key: Hashable, reached: bool):
+        """Record whether a request reached the host."""
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            circuit.probing = False
+            if reached:
+                circuit.failures = 0
+                circuit.opened_at = None
+                return
+            circuit.failures += 1
+            if circuit.opened_at is not None or circuit.failures >= self.threshold:
+                circuit.opened_at = time.monotonic()
+
+    def release(self, key: Hashable):
+        """
+        Give back the probe of key when its request ended without an outcome,
+        eg. when it was cancelled, so that the host can be probed again.
+        """
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is not None:
+                circuit.probing = False
+
+    def is_open(self, key: Hashable) -> bool:
+        with self._lock:
+            circuit = self._circuits.get(key)
+            return circuit is not None and circuit.opened_at is not None
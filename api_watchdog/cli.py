@@ -1,12 +1,29 @@
 from argparse import ArgumentParser
+from fnmatch import fnmatch
 import logging
 from pathlib import Path
 import sys
 
-from api_watchdog.collect import collect_results
-from api_watchdog.core import WatchdogTest
+from api_watchdog.async_runner import AsyncWatchdogRunner
+from api_watchdog.bench import Bench
+from api_watchdog.collect import WatchdogResultGroup, collect_results, flatten_results
+from api_watchdog.compare import compare_runs
+from api_watchdog.history import LatencyHistory, RunHistory
+from api_watchdog.core import (
+    RateLimit,
+    RetentionMode,
+    RetentionPolicy,
+    RetryPolicy,
+    WatchdogTest,
+)
 from api_watchdog.runner import WatchdogRunner
+from api_watchdog.shard import parse_shard, shard
 from api_watchdog.hooks.result_group.mailgun import ResultGroupHookMailgun
+from api_watchdog.validate import (
+    enable_validation_cache,
+    set_validation_backend,
+    ValidationBackend,
+)
 
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s: %(levelname)s/%(name)s]: %(message)s')
 logger = logging.getLogger(__name__)
@@ -15,19 +32,192 @@ logger = logging.getLogger(__name__)
 def topological_print(result_group, file=None):
     file = file or sys.stdout
     for result in sorted(result_group.results, key=lambda g: g.test_name):
+        if result.skipped:
+            logger.info(f"[{result_group.name}]: {result.test_name:<20} skipped: {result.skipped}")
+            continue
         logger.info(f"[{result_group.name}]: {result.test_name:<20} {'passed' if result.success else 'failed'} in {result.latency:<12.3f}")
     for group in sorted(result_group.groups, key=lambda g: g.name):
         topological_print(group, file=file)
 
 
-def discover(args):
-    runner = WatchdogRunner()
+def bench_print(report, file=None):
+    file = file or sys.stdout
+    for stats in [report.stats] + report.tests:
+        percentiles = " ".join(
+            f"{p}={getattr(stats, p):.3f}" if getattr(stats, p) is not None else f"{p}=-"
+            for p in ("p50", "p90", "p99", "max")
+        )
+        logger.info(
+            f"[{report.name}]: {stats.name:<20} {stats.requests} requests"
+            f" ({stats.throughput:.1f}/s, {stats.errors} errors) {percentiles},"
+            f" {stats.checked - stats.failed}/{stats.checked} checked passed"
+        )
+    for group in report.groups:
+        bench_print(group, file=file)
+
+
+def bench(args):
+    runner = WatchdogRunner(
+        max_workers=args.concurrency,
+        fast_path=args.fast_path,
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+    )
     tests = [
-        WatchdogTest.parse_file(p)
-        for p in vars(args)['search-directory'].rglob(args.pattern)
+        test
+        for test in (
+            WatchdogTest.parse_file(p)
+            for p in vars(args)['search-directory'].rglob(args.pattern)
+        )
+        if fnmatch(test.name, args.test)
     ]
-    results = runner.run_tests(tests)
-    grouped_results = collect_results(results)
+    report = Bench(
+        runner,
+        iterations=args.iterations,
+        duration=args.duration,
+        rps=args.rps,
+        concurrency=args.concurrency,
+        sample_rate=args.sample_rate,
+    ).run(tests)
+    if args.output_path:
+        with open(args.output_path, "w") as fp:
+            fp.write(report.json())
+    else:
+        bench_print(report)
+
+
+def compare(args):
+    with RunHistory(args.history) as history:
+        comparison = compare_runs(
+            history,
+            run=args.run,
+            window=args.window,
+            threshold=args.threshold,
+            min_change=args.min_change,
+            alpha=args.alpha,
+            min_samples=args.min_samples,
+        )
+    if args.output_path:
+        with open(args.output_path, "w") as fp:
+            fp.write(comparison.json())
+        return
+    logger.info(
+        f"Run {comparison.run} against {len(comparison.baseline_runs)} baseline runs:"
+        f" {len(comparison.tests)} tests and {len(comparison.groups)} groups regressed"
+    )
+    for change in comparison.groups + comparison.tests:
+        logger.warning(
+            f"[{change.target or change.name}]: {change.name:<20} {change.baseline:.3f}s"
+            f" -> {change.current:.3f}s ({change.change:+.0%},"
+            f" significance {change.significance:.3g})"
+        )
+
+
+def discover(args):
+    if args.validation_cache:
+        enable_validation_cache(args.validation_cache)
+    set_validation_backend(args.validation_backend)
+    retention = RetentionPolicy(
+        mode=args.retain,
+        max_bytes=args.retain_bytes,
+        directory=args.spill_directory,
+    )
+    rate_limit = RateLimit(
+        max_concurrency=args.host_concurrency,
+        requests_per_second=args.host_rps,
+        burst=args.host_burst,
+    )
+    retry = RetryPolicy(
+        max_attempts=args.max_attempts,
+        backoff=args.retry_backoff,
+        max_backoff=args.retry_max_backoff,
+    )
+    history = LatencyHistory(args.history) if args.history else None
+    if args.engine == "async":
+        runner = AsyncWatchdogRunner(
+            max_in_flight=args.max_in_flight,
+            fast_path=args.fast_path,
+            stream=args.stream,
+            max_response_bytes=args.max_response_bytes,
+            retention=retention,
+            eval_workers=args.eval_workers,
+            coalesce=args.coalesce,
+            rate_limit=rate_limit,
+            limit_per_proxy=args.limit_per_proxy,
+            retry=retry,
+            retry_budget=args.retry_budget,
+            breaker_threshold=args.breaker_threshold,
+            breaker_reset=args.breaker_reset,
+            connect_timeout=args.connect_timeout,
+            read_timeout=args.read_timeout,
+            deadline=args.deadline,
+            history=history,
+            adaptive=args.adaptive_concurrency,
+            warm_up=args.warm_up,
+        )
+    else:
+        runner = WatchdogRunner(
+            max_workers=args.max_workers,
+            fast_path=args.fast_path,
+            stream=args.stream,
+            max_response_bytes=args.max_response_bytes,
+            retention=retention,
+            eval_workers=args.eval_workers,
+            coalesce=args.coalesce,
+            rate_limit=rate_limit,
+            limit_per_proxy=args.limit_per_proxy,
+            retry=retry,
+            retry_budget=args.retry_budget,
+            breaker_threshold=args.breaker_threshold,
+            breaker_reset=args.breaker_reset,
+            connect_timeout=args.connect_timeout,
+            read_timeout=args.read_timeout,
+            deadline=args.deadline,
+            history=history,
+            adaptive=args.adaptive_concurrency,
+            warm_up=args.warm_up,
+        )
+    search_directory = vars(args)['search-directory']
+    paths = sorted(search_directory.rglob(args.pattern))
+    tests = [WatchdogTest.parse_file(p) for p in paths]
+    if args.shard:
+        index, count = args.shard
+        weights = None
+        if args.shard_weights and not args.shard_weights.exists():
+            logger.warning(f"{args.shard_weights} does not exist, tests are sharded by hash")
+        elif args.shard_weights:
+            with LatencyHistory(args.shard_weights) as shard_history:
+                weights = shard_history.expected(tests)
+        tests = shard(
+            tests,
+            [p.relative_to(search_directory).as_posix() for p in paths],
+            index,
+            count,
+            weights=weights,
+        )
+        logger.info(f"Running {len(tests)} of {len(paths)} tests in shard {index}/{count}")
+    results = list(runner.run_tests(tests))
+    if history is not None:
+        history.close()
+        with RunHistory(args.history) as runs:
+            runs.record(results)
+    report_results(collect_results(results), args)
+
+
+def merge(args):
+    results = []
+    seen = set()
+    for path in args.results:
+        for result in flatten_results(WatchdogResultGroup.parse_file(path)):
+            key = (result.test_name, str(result.target))
+            if key in seen:
+                logger.warning(f"[{result.target}]: {result.test_name} is in more than one results file")
+            seen.add(key)
+            results.append(result)
+    report_results(collect_results(results), args)
+
+
+def report_results(grouped_results, args):
     if args.email:
         email_hook = ResultGroupHookMailgun()
         email_hook(grouped_results)
@@ -69,7 +259,384 @@ def cli():
         "--email",
         action="store_true"
     )
+    parser_discover.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        help="Only run the i-th of n shards of the tests, given as i/n. Tests"
+        " are assigned by a stable hash of their path relative to the search"
+        " directory; combine the results of the shards with merge",
+    )
+    parser_discover.add_argument(
+        "--shard-weights",
+        type=Path,
+        default=None,
+        help="SQLite file written by --history. Shards are balanced on the"
+        " expected latency of their tests instead of hashed. Every shard must"
+        " be given the same file",
+    )
+    parser_discover.add_argument(
+        "--engine",
+        choices=["thread", "async"],
+        default="thread",
+        help="Request engine. 'thread' uses a thread pool, 'async' uses a"
+        " single asyncio event loop (requires aiohttp)",
+    )
+    parser_discover.add_argument(
+        "--max-workers",
+        type=int,
+        default=16,
+        help="Number of request threads for the thread engine",
+    )
+    parser_discover.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=1000,
+        help="Maximum number of concurrent requests for the async engine",
+    )
+    parser_discover.add_argument(
+        "--warm-up",
+        action="store_true",
+        help="Open the connections to every host before the tests are run and"
+        " timed, and log what opening them cost",
+    )
+    parser_discover.add_argument(
+        "--adaptive-concurrency",
+        action="store_true",
+        help="Adapt the number of concurrent requests to the latency and error"
+        " rate of the responses, up to --max-workers (or --max-in-flight)",
+    )
+    parser_discover.add_argument(
+        "--host-concurrency",
+        type=int,
+        default=None,
+        help="Maximum number of concurrent requests to any one host",
+    )
+    parser_discover.add_argument(
+        "--host-rps",
+        type=float,
+        default=None,
+        help="Maximum requests per second to any one host",
+    )
+    parser_discover.add_argument(
+        "--host-burst",
+        type=int,
+        default=None,
+        help="Number of requests that may be sent to a host at once before"
+        " --host-rps applies (default 1)",
+    )
+    parser_discover.add_argument(
+        "--limit-per-proxy",
+        action="store_true",
+        help="Apply host limits separately to each proxy used to reach a host",
+    )
+    parser_discover.add_argument(
+        "--max-attempts",
+        type=int,
+        default=1,
+        help="Send a request up to this many times when it times out, fails to"
+        " connect or gets a 429, 502, 503 or 504 response. Tests may override"
+        " this with retry",
+    )
+    parser_discover.add_argument(
+        "--retry-backoff",
+        type=float,
+        default=1.0,
+        help="Seconds to wait before the first retry, doubled for each further"
+        " retry (with jitter)",
+    )
+    parser_discover.add_argument(
+        "--retry-max-backoff",
+        type=float,
+        default=60.0,
+        help="Longest wait before a retry, including waits asked for by"
+        " Retry-After",
+    )
+    parser_discover.add_argument(
+        "--retry-budget",
+        type=int,
+        default=None,
+        help="Maximum number of retries in the whole run",
+    )
+    parser_discover.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=120.0,
+        help="Seconds to wait for a connection. Tests may override this with"
+        " connect_timeout",
+    )
+    parser_discover.add_argument(
+        "--read-timeout",
+        type=float,
+        default=120.0,
+        help="Seconds to wait for data from the server. Tests may override this"
+        " with read_timeout",
+    )
+    parser_discover.add_argument(
+        "--deadline",
+        type=float,
+        default=None,
+        help="Stop the run after this many seconds. Tests that have not"
+        " finished by then fail with RequestTimeout",
+    )
+    parser_discover.add_argument(
+        "--history",
+        type=Path,
+        default=None,
+        help="SQLite file with the latency history of the tests. Tests expected"
+        " to take longest are started first, and the results of this run are"
+        " recorded in the file, see compare",
+    )
+    parser_discover.add_argument(
+        "--breaker-threshold",
+        type=int,
+        default=None,
+        help="Skip the remaining tests against a host after this many"
+        " consecutive connection errors or timeouts",
+    )
+    parser_discover.add_argument(
+        "--breaker-reset",
+        type=float,
+        default=30.0,
+        help="Seconds after which a probe request is sent to a host whose tests"
+        " are being skipped, to check whether it has recovered",
+    )
+    parser_discover.add_argument(
+        "--fast-path",
+        action="store_true",
+        help="Evaluate plain path selectors (eg. .a.b[0]) in python instead"
+        " of jq",
+    )
+    parser_discover.add_argument(
+        "--stream",
+        action="store_true",
+        help="Parse responses incrementally, keeping only the data selected by"
+        " expectations (requires ijson). Applies to tests whose selectors are"
+        " all plain paths; responses are then not kept in the results",
+    )
+    parser_discover.add_argument(
+        "--max-response-bytes",
+        type=int,
+        default=None,
+        help="Abort any response larger than this many bytes and fail the"
+        " test with PayloadTooLarge. Tests may set a stricter limit with"
+        " max_response_bytes",
+    )
+    parser_discover.add_argument(
+        "--eval-workers",
+        type=int,
+        default=None,
+        help="Evaluate expectations in a pool of this many processes instead"
+        " of in the request threads",
+    )
+    parser_discover.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="Send identical requests (same method, target, proxy and payload)"
+        " only once and evaluate every test that makes them against the same"
+        " response",
+    )
+    parser_discover.add_argument(
+        "--validation-cache",
+        type=int,
+        default=None,
+        help="Memoize up to this many validated values, so identical values"
+        " are only validated once",
+    )
+    parser_discover.add_argument(
+        "--validation-backend",
+        choices=[b.value for b in ValidationBackend],
+        default=ValidationBackend.Pydantic.value,
+        help="Validate trapi.* values by building reasoner_pydantic models"
+        " (pydantic) or against their compiled JSON Schema (schema)",
+    )
+    parser_discover.add_argument(
+        "--retain",
+        choices=[mode.value for mode in RetentionMode],
+        default=RetentionMode.ALL.value,
+        help="Which payloads and responses to keep in the results: all, none,"
+        " failure (failed tests only), truncate (to --retain-bytes) or spill"
+        " (to files in --spill-directory). Tests may override this with"
+        " retention",
+    )
+    parser_discover.add_argument(
+        "--retain-bytes",
+        type=int,
+        default=None,
+        help="Maximum size of each kept payload and response for --retain truncate",
+    )
+    parser_discover.add_argument(
+        "--spill-directory",
+        type=Path,
+        default=None,
+        help="Directory that payloads and responses are written to for"
+        " --retain spill",
+    )
     parser_discover.set_defaults(func=discover)
 
+    parser_merge = subparsers.add_parser(
+        "merge", help="Combine the results files of several discover runs"
+    )
+    parser_merge.add_argument(
+        "results",
+        type=Path,
+        nargs="+",
+        help="Results files written by discover -o",
+    )
+    parser_merge.add_argument(
+        "--output_path",
+        "-o",
+        type=Path,
+        default=None,
+        help="Path to output the combined results file. When not provided,"
+        " results are sent to stdout",
+    )
+    parser_merge.add_argument(
+        "--email",
+        action="store_true"
+    )
+    parser_merge.set_defaults(func=merge)
+
+    parser_compare = subparsers.add_parser(
+        "compare", help="Find latency regressions in the last run of a history"
+    )
+    parser_compare.add_argument(
+        "history",
+        type=Path,
+        help="SQLite file written by discover --history",
+    )
+    parser_compare.add_argument(
+        "--run",
+        type=int,
+        default=None,
+        help="Id of the run to check. Defaults to the last run",
+    )
+    parser_compare.add_argument(
+        "--window",
+        type=int,
+        default=20,
+        help="Number of runs before it that make up the baseline",
+    )
+    parser_compare.add_argument(
+        "--threshold",
+        type=float,
+        default=3.0,
+        help="Robust z-score from which a slower test counts as regressed",
+    )
+    parser_compare.add_argument(
+        "--min-change",
+        type=float,
+        default=0.2,
+        help="Smallest relative slowdown reported, eg. 0.2 for 20%%",
+    )
+    parser_compare.add_argument(
+        "--alpha",
+        type=float,
+        default=0.05,
+        help="Significance level of the sign test for groups of tests",
+    )
+    parser_compare.add_argument(
+        "--min-samples",
+        type=int,
+        default=5,
+        help="Baseline runs a test needs before it is judged",
+    )
+    parser_compare.add_argument(
+        "--output_path",
+        "-o",
+        type=Path,
+        default=None,
+        help="Path to output the comparison file. When not provided, regressions"
+        " are logged",
+    )
+    parser_compare.set_defaults(func=compare)
+
+    parser_bench = subparsers.add_parser(
+        "bench", help="Replay tests many times and report latency percentiles"
+    )
+    parser_bench.add_argument(
+        "search-directory",
+        type=Path,
+        help="Directory to recursively search for tests",
+    )
+    parser_bench.add_argument(
+        "--pattern",
+        "-p",
+        type=str,
+        default="*.watchdog.json",
+        help="glob style pattern to match against for tests",
+    )
+    parser_bench.add_argument(
+        "--test",
+        "-t",
+        type=str,
+        default="*",
+        help="glob style pattern to match against test names",
+    )
+    parser_bench.add_argument(
+        "--output_path",
+        "-o",
+        type=Path,
+        default=None,
+        help="Path to output the report file. When not provided, the report is"
+        " sent to stdout",
+    )
+    parser_bench.add_argument(
+        "--iterations",
+        "-n",
+        type=int,
+        default=10,
+        help="Number of times to send every test",
+    )
+    parser_bench.add_argument(
+        "--duration",
+        type=float,
+        default=None,
+        help="Send the tests round robin for this many seconds instead of"
+        " --iterations times",
+    )
+    parser_bench.add_argument(
+        "--rps",
+        type=float,
+        default=None,
+        help="Maximum number of requests started per second",
+    )
+    parser_bench.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        default=16,
+        help="Maximum number of requests in flight",
+    )
+    parser_bench.add_argument(
+        "--sample-rate",
+        type=float,
+        default=0.1,
+        help="Fraction of the responses to check the expectations against",
+    )
+    parser_bench.add_argument(
+        "--fast-path",
+        action="store_true",
+        help="Evaluate plain path selectors in python, see discover --fast-path",
+    )
+    parser_bench.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=120.0,
+        help="Seconds to wait for a connection to a host",
+    )
+    parser_bench.add_argument(
+        "--read-timeout",
+        type=float,
+        default=120.0,
+        help="Seconds to wait for data from a host",
+    )
+    parser_bench.set_defaults(func=bench)
+
     args = parser.parse_args()
+    if getattr(args, "func", None) is discover:
+        if args.retain == RetentionMode.TRUNCATE.value and args.retain_bytes is None:
+            parser_discover.error("--retain truncate requires --retain-bytes")
+        if args.retain == RetentionMode.SPILL.value and args.spill_directory is None:
+            parser_discover.error("--retain spill requires --spill-directory")
     args.func(args)
@@ -100,3 +100,14 @@ def group_results_by_target(
     )
 
     return result_group
+
+
+def flatten_results(result_group: WatchdogResultGroup) -> List[WatchdogResult]:
+    """
+    All the results of a WatchdogResultGroup and of its groups, the inverse
+    of collect_results.
+    """
+    results = list(result_group.results)
+    for group in result_group.groups:
+        results.extend(flatten_results(group))
+    return results
@@ -0,0 +1,144 @@
+import math
+import statistics
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, StrictStr
+
+from api_watchdog.collect import WatchdogResultGroup, collect_results
+from api_watchdog.core import WatchdogResult
+from api_watchdog.history import RunHistory
+
+# scales the median absolute deviation to the standard deviation of a normal
+MAD_SCALE = 1.4826
+
+
+class LatencyChange(BaseModel):
+    """
+    Latency of a test, or of a group of tests, in a run against its baseline.
+
+    For a test, baseline is its median latency over the baseline runs and
+    significance the robust z-score of the run (how many scaled median
+    absolute deviations it is above the baseline). For a group, baseline and
+    current are geometric means over its tests, and significance the p-value
+    of a sign test on how many of its tests got slower.
+    """
+    name: StrictStr
+    target: Optional[StrictStr] = None
+    baseline: float
+    current: float
+    change: float
+    significance: float
+    samples: int
+
+
+class Comparison(BaseModel):
+    run: int
+    baseline_runs: List[int]
+    tests: List[LatencyChange]
+    groups: List[LatencyChange]
+
+
+def sign_test(slower: int, tests: int) -> float:
+    """
+    Probability of at least slower of tests being slower by chance, when
+    each is as likely to be slower as faster.
+    """
+    return sum(math.comb(tests, k) for k in range(slower, tests + 1)) / 2 ** tests
+
+
+def compare_runs(
+    history: RunHistory,
+    run: Optional[int] = None,
+    window: int = 20,
+    threshold: float = 3.0,
+    min_change: float = 0.2,
+    alpha: float = 0.05,
+    min_samples: int = 5,
+) -> Comparison:
+    """
+    Find the tests and groups of tests (grouped like collect_results) whose
+    latency regressed in a run (the last one by default), against a rolling
+    baseline of the window runs before it.
+
+    A test regressed when its latency is at least min_change slower than its
+    baseline and its robust z-score is at least threshold; tests with fewer
+    than min_samples baseline runs are not judged. A group regressed when its
+    tests are min_change slower on (geometric) average and the sign test
+    gives a p-value under alpha.
+    """
+    run_ids = history.runs(window + 1, before=run)
+    if not run_ids:
+        raise ValueError("No runs in the history")
+    current_run, baseline_runs = run_ids[-1], run_ids[:-1]
+    latencies = history.latencies(run_ids)
+
+    tests: List[LatencyChange] = []
+    # (baseline median, current) of every test that can be judged
+    judged: Dict[Tuple[str, str], Tuple[float, float]] = {}
+    for (name, target), by_run in latencies.items():
+        current = by_run.get(current_run)
+        baseline = [by_run[r] for r in baseline_runs if r in by_run]
+        if current is None or len(baseline) < min_samples:
+            continue
+        median = statistics.median(baseline)
+        judged[(name, target)] = (median, current)
+        deviation = MAD_SCALE * statistics.median(abs(b - median) for b in baseline)
+        score = (current - median) / max(deviation, 1e-6)
+        change = current / median - 1 if median > 0 else math.inf
+        if change >= min_change and score >= threshold:
+            tests.append(LatencyChange(
+                name=name,
+                target=target,
+                baseline=median,
+                current=current,
+                change=change,
+                significance=score,
+                samples=len(baseline),
+            ))
+
+    groups: List[LatencyChange] = []
+
+    def judge(group: WatchdogResultGroup) -> List[Tuple[float, float]]:
+        """Collect the judged tests of a group, adding it if it regressed."""
+        pairs = [judged[(r.test_name, str(r.target))] for r in group.results]
+        for subgroup in group.groups:
+            pairs.extend(judge(subgroup))
+        measured = [(b, c) for b, c in pairs if b > 0 and c > 0]
+        if measured:
+            baseline = math.exp(statistics.fmean(math.log(b) for b, _ in measured))
+            current = math.exp(statistics.fmean(math.log(c) for _, c in measured))
+            change = current / baseline - 1
+            p_value = sign_test(sum(c > b for b, c in measured), len(measured))
+            if change >= min_change and p_value < alpha:
+                groups.append(LatencyChange(
+                    name=group.name,
+                    baseline=baseline,
+                    current=current,
+                    change=change,
+                    significance=p_value,
+                    samples=len(measured),
+                ))
+        return pairs
+
+    judge(collect_results(
+        WatchdogResult(
+            test_name=name,
+            target=target,
+            success=True,
+            latency=current,
+            timestamp=time.time(),
+            email_to=None,
+            payload=None,
+            response=None,
+            results=[],
+        )
+        for (name, target), (_, current) in judged.items()
+    ))
+
+    return Comparison(
+        run=current_run,
+        baseline_runs=baseline_runs,
+        tests=sorted(tests, key=lambda t: -t.change),
+        groups=sorted(groups, key=lambda g: g.name),
+    )
@@ -1,12 +1,15 @@
+import re
 from datetime import datetime
 from enum import Enum
+from pathlib import Path
 from typing import Any, List, Literal, Union, Optional
 
 from api_watchdog.result_error import ResultError
+from api_watchdog.selector import compile_selector
 from api_watchdog.validate import ValidationType
 from api_watchdog.validate import validate as _validate
 
-from pydantic import BaseModel, StrictStr, AnyUrl
+from pydantic import BaseModel, StrictStr, AnyUrl, validator, root_validator
 
 class ExpectationLevel(Enum):
     CRITICAL = "critical"
@@ -23,12 +26,176 @@ class Expectation(BaseModel):
         super().__init__(selector=selector, value=value, validation_type=validation_type, level=level)
         self.value = _validate(self.value, self.validation_type)
 
+    @validator("selector")
+    def selector_must_compile(cls, selector):
+        try:
+            compile_selector(selector)
+        except ValueError as e:
+            raise ValueError(f"invalid jq selector: {e}") from e
+        return selector
+
+
+class Metric(Enum):
+    LATENCY = "latency"
+    RESPONSE_BYTES = "response_bytes"
+    DNS = "dns"
+    CONNECT = "connect"
+    TLS = "tls"
+    TTFB = "ttfb"
+    DOWNLOAD = "download"
+
+DURATION_UNITS = {"s": 1.0, "ms": 1e-3, "us": 1e-6}
+SIZE_UNITS = {
+    "b": 1, "kb": 10 ** 3, "mb": 10 ** 6, "gb": 10 ** 9,
+    "kib": 2 ** 10, "mib": 2 ** 20, "gib": 2 ** 30,
+}
+
+class MetricExpectation(BaseModel):
+    """
+    A threshold on how the request went rather than on the response: the
+    expectation fails unless metric is below max. latency and the phases of
+    Timings are in seconds and response_bytes in bytes, but max may also be
+    given with a unit, eg. "500ms" or "50MB". A phase that did not happen
+    (connect on a reused connection) passes.
+    """
+    metric: Metric
+    max: float
+    level: ExpectationLevel = ExpectationLevel.CRITICAL
+
+    @validator("max", pre=True)
+    def parse_unit(cls, v, values):
+        if not isinstance(v, str):
+            return v
+        match = re.fullmatch(r"\s*([0-9]*\.?[0-9]+)\s*([a-zA-Z]*)\s*", v)
+        if match is None:
+            raise ValueError(f"invalid threshold {v!r}")
+        number, unit = float(match.group(1)), match.group(2).lower()
+        metric = values.get("metric")
+        units = SIZE_UNITS if metric == Metric.RESPONSE_BYTES else DURATION_UNITS
+        if not unit:
+            return number
+        if unit not in units:
+            raise ValueError(
+                f"unit {unit!r} does not apply to {metric.value if metric else 'metric'}"
+            )
+        return number * units[unit]
+
 
 class ExpectationResult(BaseModel):
-    expectation: Expectation
-    result: Union[Literal["success", "value", "validate", "jq-error"], ResultError]
+    expectation: Union[Expectation, MetricExpectation]
+    result: Union[Literal["success", "value", "validate", "jq-error", "skipped"], ResultError]
     actual: Any
 
+class RetentionMode(Enum):
+    ALL = "all"
+    NONE = "none"
+    FAILURE = "failure"
+    TRUNCATE = "truncate"
+    SPILL = "spill"
+
+class RetentionPolicy(BaseModel):
+    """
+    Which payloads and responses are kept on a WatchdogResult.
+
+    all: keep everything, none: keep nothing, failure: keep only for failed
+    tests, truncate: keep at most max_bytes of each (longer ones are kept as
+    truncated JSON text), spill: write them to a file in directory and keep
+    its path as response_ref.
+    """
+    mode: RetentionMode = RetentionMode.ALL
+    max_bytes: Optional[int] = None
+    directory: Optional[Path] = None
+
+    @root_validator
+    def mode_settings_present(cls, values):
+        if values.get("mode") == RetentionMode.TRUNCATE and values.get("max_bytes") is None:
+            raise ValueError("truncate retention requires max_bytes")
+        if values.get("mode") == RetentionMode.SPILL and values.get("directory") is None:
+            raise ValueError("spill retention requires directory")
+        return values
+
+class RateLimit(BaseModel):
+    """
+    Limits on the requests sent to one host during a run.
+
+    max_concurrency caps the requests in flight at once, requests_per_second
+    and burst configure a token bucket (burst requests may be sent at once,
+    refilled at requests_per_second).
+    """
+    max_concurrency: Optional[int] = None
+    requests_per_second: Optional[float] = None
+    burst: Optional[int] = None
+
+    @validator("max_concurrency", "burst")
+    def at_least_one(cls, v):
+        if v is not None and v < 1:
+            raise ValueError("must be at least 1")
+        return v
+
+    @validator("requests_per_second")
+    def positive(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError("must be positive")
+        return v
+
+class RetryPolicy(BaseModel):
+    """
+    When to send the request of a test again.
+
+    A request that ends with a status code in retry_on (timeouts are 408,
+    connection errors 503) is retried up to max_attempts in total. The n-th
+    retry waits backoff * 2 ** (n - 1) seconds, at most max_backoff, drawn
+    uniformly from zero to that with jitter. A Retry-After header replaces the
+    backoff; if it asks for more than max_backoff the request is not retried.
+    """
+    max_attempts: int = 1
+    backoff: float = 1.0
+    max_backoff: float = 60.0
+    jitter: bool = True
+    retry_on: List[int] = [408, 429, 502, 503, 504]
+
+    @validator("max_attempts")
+    def at_least_one_attempt(cls, v):
+        if v < 1:
+            raise ValueError("must be at least 1")
+        return v
+
+class Attempt(BaseModel):
+    status_code: int
+    latency: float
+    response_bytes: Optional[int] = None
+
+class Timings(BaseModel):
+    """
+    Where the time of a test went, in seconds. dns, connect and tls are only
+    set when the request opened a new connection; ttfb is the wait for the
+    response headers once connected, download the time to read the body.
+    parse, select and validation are the local time spent decoding the
+    response, evaluating the selectors and checking the values. unmeasured
+    lists the phases the engine could not measure apart (dns is part of
+    connect with threads, tls with asyncio): those are None even when they
+    happened.
+    """
+    dns: Optional[float] = None
+    connect: Optional[float] = None
+    tls: Optional[float] = None
+    ttfb: Optional[float] = None
+    download: Optional[float] = None
+    parse: Optional[float] = None
+    select: Optional[float] = None
+    validation: Optional[float] = None
+    unmeasured: List[StrictStr] = []
+
+class WarmUp(BaseModel):
+    """
+    Connections opened to a host before a run. timings is the average cold
+    cost (dns, connect, tls) of opening one of them.
+    """
+    target: StrictStr
+    connections: int
+    timings: Timings
+    error: Optional[StrictStr] = None
+
 class WatchdogTest(BaseModel):
     name: StrictStr
     target: AnyUrl
@@ -37,15 +204,30 @@ class WatchdogTest(BaseModel):
     email_to: Optional[List[StrictStr]]
     payload: Any
     expectations: List[Expectation]
+    metric_expectations: List[MetricExpectation] = []
+    stream: Optional[bool] = None
+    max_response_bytes: Optional[int] = None
+    retention: Optional[RetentionPolicy] = None
+    rate_limit: Optional[RateLimit] = None
+    retry: Optional[RetryPolicy] = None
+    connect_timeout: Optional[float] = None
+    read_timeout: Optional[float] = None
 
 class WatchdogResult(BaseModel):
     test_name: StrictStr
     target: AnyUrl
     success: bool
     latency: float
+    response_bytes: Optional[int] = None
+    shared_request: Optional[StrictStr] = None
+    attempts: Optional[List[Attempt]] = None
+    skipped: Optional[StrictStr] = None
+    timings: Optional[Timings] = None
     timestamp: datetime
     payload: Any
     response: Any
+    response_ref: Optional[StrictStr] = None
+    retention: Optional[RetentionMode] = None
     results: List[ExpectationResult]
     email_to: Optional[List[StrictStr]]
 
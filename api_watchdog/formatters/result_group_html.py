@@ -1,5 +1,5 @@
 from api_watchdog.collect import WatchdogResultGroup
-from api_watchdog.core import WatchdogResult, ExpectationResult
+from api_watchdog.core import WatchdogResult, ExpectationResult, MetricExpectation
 
 
 def html_from_result_group(result_group: WatchdogResultGroup) -> str:
@@ -17,12 +17,16 @@ def html_from_result_group(result_group: WatchdogResultGroup) -> str:
 
     def result_format(result: WatchdogResult) -> str:
         passed = "Pass" if result.success else "Fail"
+        if result.skipped:
+            passed = f"Skipped: {result.skipped}"
         html = (
             f'<h3>{result.test_name}: {passed} ({result.latency:.3f}s)</h3>\n'
             f'<div class="expectations">\n'
         )
         for expectation_result in result.results:
             html += expectation_result_format(expectation_result)
+        if result.response_ref:
+            html += f'<p>Response: <code>{result.response_ref}</code></p>\n'
         html += (
             f'</div>\n'
         )
@@ -32,10 +36,20 @@ def html_from_result_group(result_group: WatchdogResultGroup) -> str:
         success_class_name = "passed" if expectation_result.result == "success" else "failed"
         level_class_name = expectation_result.expectation.level.value
         class_name = success_class_name + "-" + level_class_name # outlook and some other renderers do not support AND style selectors
+        expectation = expectation_result.expectation
+        if isinstance(expectation, MetricExpectation):
+            description = (
+                f'  <p>{expectation.metric.value}</p>\n'
+                f'  <p>&lt;= {expectation.max:g}</p>\n'
+            )
+        else:
+            description = (
+                f'  <p>{expectation.selector}</p>\n'
+                f'  <p>({expectation.validation_type.value}){expectation.value}</p>\n'
+            )
         html = (
             f'<div class="result {class_name}">\n'
-            f'  <p>{expectation_result.expectation.selector}</p>\n'
-            f'  <p>({expectation_result.expectation.validation_type.value}){expectation_result.expectation.value}</p>\n'
+            + description +
             f'  <p>{expectation_result.actual} ({level_class_name.upper()})</p>\n'
             f'</div>'
         )
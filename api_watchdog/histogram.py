@@ -0,0 +1,77 @@
+import math
+from typing import Dict, Optional
+
+
+class LatencyHistogram:
+    """
+    Memory bounded latency histogram in the style of HdrHistogram.
+
+    Latencies are recorded in microseconds into log-linear buckets: values
+    below 2 * 10 ** digits microseconds are kept exactly, larger ones with a
+    relative error under 10 ** -digits. The number of buckets grows with the
+    logarithm of the largest latency, not with the number of samples.
+    """
+
+    def __init__(self, digits: int = 2):
+        self.digits = digits
+        self._sub_bits = math.ceil(math.log2(2 * 10 ** digits))
+        self._sub_count = 1 << self._sub_bits
+        self._half = self._sub_count >> 1
+        self._counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _bucket(self, value: int) -> int:
+        if value < self._sub_count:
+            return value
+        shift = value.bit_length() - self._sub_bits
+        return self._sub_count + (shift - 1) * self._half + (value >> shift) - self._half
+
+    def _highest(self, bucket: int) -> int:
+        """Largest value recorded into a bucket."""
+        if bucket < self._sub_count:
+            return bucket
+        shift, offset = divmod(bucket - self._sub_count, self._half)
+        return ((self._half + offset + 1) << (shift + 1)) - 1
+
+    def record(self, seconds: float):
+        bucket = self._bucket(max(int(seconds * 1e6), 0))
+        self._counts[bucket] = self._counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram"):
+        """Add the samples of another histogram with the same digits."""
+        if other.digits != self.digits:
+            raise ValueError("Cannot merge histograms of different precision")
+        for bucket, count in other._counts.items():
+            self._counts[bucket] = self._counts.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        Latency in seconds that percentile percent of the samples do not
+        exceed, or None without samples.
+        """
+        if not self.count:
+            return None
+        rank = max(math.ceil(percentile / 100 * self.count), 1)
+        seen = 0
+        for bucket in sorted(self._counts):
+            seen += self._counts[bucket]
+            if seen >= rank:
+                break
+        return min(self._highest(bucket) / 1e6, self.max)
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
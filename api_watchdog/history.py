@@ -0,0 +1,220 @@
+import heapq
+import sqlite3
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlparse
+
+from api_watchdog.core import WatchdogResult, WatchdogTest
+from api_watchdog.result_error import ResultError
+
+
+class LatencyHistory:
+    """
+    Expected latency of each test, kept in a small SQLite database.
+
+    Every recorded latency updates an exponentially weighted moving average
+    (weight alpha for the newest sample) per test name and target.
+    """
+
+    def __init__(self, path: Union[str, Path], alpha: float = 0.3):
+        self.path = Path(path)
+        self.alpha = alpha
+        self._connection = sqlite3.connect(str(self.path))
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS latency ("
+            " test_name TEXT NOT NULL,"
+            " target TEXT NOT NULL,"
+            " expected REAL NOT NULL,"
+            " samples INTEGER NOT NULL,"
+            " updated REAL NOT NULL,"
+            " PRIMARY KEY (test_name, target))"
+        )
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def known(self) -> Dict[Tuple[str, str], float]:
+        """Expected latency of every test with history, by (name, target)."""
+        rows = self._connection.execute(
+            "SELECT test_name, target, expected FROM latency"
+        )
+        return {(name, target): expected for name, target, expected in rows}
+
+    def expected(self, tests: Sequence[WatchdogTest]) -> List[float]:
+        """
+        Expected latency of each test.
+
+        Tests without history are expected to take as long as the average of
+        the known tests against the same host, or else the median of all known
+        tests (0 when there is no history at all).
+        """
+        known = self.known()
+        by_host: Dict[str, List[float]] = {}
+        for (_, target), expected in known.items():
+            by_host.setdefault(urlparse(target).netloc, []).append(expected)
+        fallback = statistics.median(known.values()) if known else 0.0
+
+        expected = []
+        for test in tests:
+            latency = known.get((test.name, str(test.target)))
+            if latency is None:
+                host = by_host.get(urlparse(test.target).netloc)
+                latency = statistics.mean(host) if host else fallback
+            expected.append(latency)
+        return expected
+
+    def record(self, results: Iterable[WatchdogResult]):
+        """Add the latencies of the tests that were actually sent."""
+        now = time.time()
+        with self._connection:
+            for result in results:
+                if result.skipped is not None:
+                    continue
+                self._connection.execute(
+                    "INSERT INTO latency VALUES (?, ?, ?, 1, ?)"
+                    " ON CONFLICT (test_name, target) DO UPDATE SET"
+                    " expected = ? * excluded.expected + (1 - ?) * expected,"
+                    " samples = samples + 1,"
+                    " updated = excluded.updated",
+                    (
+                        result.test_name,
+                        str(result.target),
+                        result.latency,
+                        now,
+                        self.alpha,
+                        self.alpha,
+                    ),
+                )
+
+
+class RunHistory:
+    """
+    Every result of every run, kept compactly in a SQLite database.
+
+    A run is a row of runs; each of its results a row of results with the
+    latency, success, error status code (None when the request succeeded),
+    whether it was skipped and its timestamp, referring to its test by id.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._connection = sqlite3.connect(str(self.path))
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " id INTEGER PRIMARY KEY,"
+                " started REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS tests ("
+                " id INTEGER PRIMARY KEY,"
+                " test_name TEXT NOT NULL,"
+                " target TEXT NOT NULL,"
+                " UNIQUE (test_name, target))"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " run_id INTEGER NOT NULL REFERENCES runs (id),"
+                " test_id INTEGER NOT NULL REFERENCES tests (id),"
+                " latency REAL NOT NULL,"
+                " success INTEGER NOT NULL,"
+                " error INTEGER,"
+                " skipped INTEGER NOT NULL,"
+                " timestamp REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_run ON results (run_id)"
+            )
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _error(result: WatchdogResult) -> Optional[int]:
+        for expectation_result in result.results:
+            if isinstance(expectation_result.result, ResultError):
+                return expectation_result.result.value
+        return None
+
+    def record(self, results: Iterable[WatchdogResult]) -> int:
+        """Add the results of a run, returning the id of the run."""
+        with self._connection:
+            run_id = self._connection.execute(
+                "INSERT INTO runs (started) VALUES (?)", (time.time(),)
+            ).lastrowid
+            rows = []
+            for result in results:
+                self._connection.execute(
+                    "INSERT OR IGNORE INTO tests (test_name, target) VALUES (?, ?)",
+                    (result.test_name, str(result.target)),
+                )
+                (test_id,) = self._connection.execute(
+                    "SELECT id FROM tests WHERE test_name = ? AND target = ?",
+                    (result.test_name, str(result.target)),
+                ).fetchone()
+                rows.append((
+                    run_id,
+                    test_id,
+                    result.latency,
+                    result.success,
+                    self._error(result),
+                    result.skipped is not None,
+                    result.timestamp.timestamp(),
+                ))
+            self._connection.executemany(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+        return run_id
+
+    def runs(self, last: int, before: Optional[int] = None) -> List[int]:
+        """Ids of the last runs, oldest first, up to (and including) before."""
+        rows = self._connection.execute(
+            "SELECT id FROM runs WHERE id <= coalesce(?, id) ORDER BY id DESC LIMIT ?",
+            (before, last),
+        )
+        return [run_id for (run_id,) in rows][::-1]
+
+    def latencies(
+        self, run_ids: Sequence[int]
+    ) -> Dict[Tuple[str, str], Dict[int, float]]:
+        """
+        Latency of every test in the given runs, by (name, target) and run id.
+        Skipped tests and failed requests are left out.
+        """
+        latencies: Dict[Tuple[str, str], Dict[int, float]] = {}
+        rows = self._connection.execute(
+            "SELECT test_name, target, run_id, latency FROM results"
+            " JOIN tests ON tests.id = results.test_id"
+            f" WHERE run_id IN ({', '.join('?' * len(run_ids))})"
+            " AND NOT skipped AND error IS NULL",
+            tuple(run_ids),
+        )
+        for name, target, run_id, latency in rows:
+            latencies.setdefault((name, target), {})[run_id] = latency
+        return latencies
+
+
+def predicted_makespan(durations: Iterable[float], workers: int) -> float:
+    """
+    Time to run jobs of the given durations, in the given order, each
+    starting on the first of workers to become free.
+    """
+    free_at = [0.0] * max(workers, 1)
+    for duration in durations:
+        heapq.heapreplace(free_at, free_at[0] + duration)
+    return max(free_at)
@@ -0,0 +1,151 @@
+import asyncio
+import collections
+import contextlib
+import threading
+import time
+from typing import Any, Deque, Dict, Hashable, Iterable, Optional, Tuple
+
+from api_watchdog.core import RateLimit
+
+
+class TokenBucket:
+    """
+    Token bucket allowing burst requests at once, refilled at rate per second.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """
+        Take a token if one is available and return 0, otherwise return how
+        many seconds until one will be.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    @classmethod
+    def from_limit(cls, limit: RateLimit) -> Optional["TokenBucket"]:
+        if limit.requests_per_second is None:
+            return None
+        return cls(limit.requests_per_second, limit.burst or 1)
+
+
+def merge_limits(limits: Iterable[Optional[RateLimit]]) -> RateLimit:
+    """The strictest combination of several limits."""
+    merged = {}
+    for limit in limits:
+        if limit is None:
+            continue
+        for field, value in limit.dict().items():
+            if value is not None:
+                merged[field] = min(value, merged.get(field, value))
+    return RateLimit(**merged)
+
+
+class HostScheduler:
+    """
+    Hands out queued work in submission order, while keeping each key (a
+    host, or host and proxy) within its RateLimit.
+
+    Work whose key is at its concurrency cap or out of tokens waits, without
+    holding back work for other keys.
+    """
+
+    def __init__(self, limits: Dict[Hashable, RateLimit]):
+        self._limits = limits
+        self._buckets = {key: TokenBucket.from_limit(limit) for key, limit in limits.items()}
+        self._queues: Dict[Hashable, Deque[Tuple[int, Any]]] = {}
+        self._in_flight: Dict[Hashable, int] = collections.Counter()
+        self._sequence = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def add(self, key: Hashable, item: Any):
+        self._queues.setdefault(key, collections.deque()).append(
+            (self._sequence, item)
+        )
+        self._sequence += 1
+
+    def next(self) -> Tuple[Optional[Tuple[Hashable, Any]], Optional[float]]:
+        """
+        Return the oldest (key, item) that may start now, or None and the
+        number of seconds until a token frees up (None when only a finished
+        request can free a slot).
+        """
+        delay = None
+        heads = sorted(
+            (queue[0][0], key) for key, queue in self._queues.items() if queue
+        )
+        for _, key in heads:
+            limit = self._limits.get(key)
+            cap = limit.max_concurrency if limit is not None else None
+            if cap is not None and self._in_flight[key] >= cap:
+                continue
+            bucket = self._buckets.get(key)
+            wait = bucket.try_acquire() if bucket is not None else 0.0
+            if wait:
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            _, item = self._queues[key].popleft()
+            self._in_flight[key] += 1
+            return (key, item), None
+        return None, delay
+
+    def done(self, key: Hashable):
+        self._in_flight[key] -= 1
+
+    def take_token(self, key: Hashable) -> float:
+        """
+        Take a token of a key for work that was already handed out, such as
+        a retry, and return 0, or return the seconds until one is available.
+        """
+        bucket = self._buckets.get(key)
+        return bucket.try_acquire() if bucket is not None else 0.0
+
+
+class AsyncHostLimiter:
+    """Keeps the coroutines sending requests to each key within its RateLimit."""
+
+    def __init__(self, limits: Dict[Hashable, RateLimit]):
+        self._semaphores = {
+            key: asyncio.Semaphore(limit.max_concurrency)
+            for key, limit in limits.items()
+            if limit.max_concurrency is not None
+        }
+        self._buckets = {key: TokenBucket.from_limit(limit) for key, limit in limits.items()}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, key: Hashable):
+        semaphore = self._semaphores.get(key)
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            await self.token(key)
+            yield
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    async def token(self, key: Hashable):
+        """Wait for a token of a key, taken for every request sent."""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            delay = bucket.try_acquire()
+            while delay:
+                await asyncio.sleep(delay)
+                delay = bucket.try_acquire()
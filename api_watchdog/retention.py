@@ -0,0 +1,84 @@
+import json
+import re
+import uuid
+from typing import Any, Optional
+
+from api_watchdog.core import (
+    RetentionMode,
+    RetentionPolicy,
+    WatchdogResult,
+    WatchdogTest,
+)
+
+
+def keeps_response(policy: RetentionPolicy, success: bool) -> bool:
+    """Whether the full parsed response is kept on a result."""
+    return policy.mode == RetentionMode.ALL or (
+        policy.mode == RetentionMode.FAILURE and not success
+    )
+
+
+def apply_retention(
+    policy: RetentionPolicy,
+    test: WatchdogTest,
+    result: WatchdogResult,
+    response_text: Optional[str],
+) -> WatchdogResult:
+    """
+    Trim the payload and response of a result according to a retention policy.
+
+    result.response is expected to already hold the parsed response when
+    keeps_response() is true; response_text is the raw response, or None if
+    the test did not produce one that can be retained (failed or streamed).
+    """
+    if policy.mode == RetentionMode.ALL:
+        return result
+
+    result.retention = policy.mode
+    if keeps_response(policy, result.success):
+        return result
+
+    result.payload = None
+    result.response = None
+    if policy.mode == RetentionMode.TRUNCATE:
+        payload_text = _truncated(_serialize(test.payload), policy.max_bytes)
+        result.payload = test.payload if payload_text is None else payload_text
+        if response_text is not None:
+            truncated = _truncated(response_text, policy.max_bytes)
+            result.response = json.loads(response_text) if truncated is None else truncated
+    elif policy.mode == RetentionMode.SPILL:
+        result.response_ref = _spill(policy, test, response_text)
+    return result
+
+
+def _serialize(x: Any) -> str:
+    try:
+        # pydantic .json() returns a string
+        return x.json()
+    except AttributeError:  # we got a plain python object and not a pydantic model
+        return json.dumps(x)
+
+
+def _truncated(text: str, max_bytes: int) -> Optional[str]:
+    """Return the first max_bytes of text, or None if it already fits."""
+    encoded = text.encode()
+    if len(encoded) <= max_bytes:
+        return None
+    return encoded[:max_bytes].decode(errors="ignore")
+
+
+def _spill(
+    policy: RetentionPolicy, test: WatchdogTest, response_text: Optional[str]
+) -> str:
+    """Write the payload and response of a test to a side file, returning its path."""
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "_", test.name)
+    path = policy.directory / f"{name}-{uuid.uuid4().hex}.json"
+    policy.directory.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as fp:
+        # the raw response is written as is rather than re-serialized
+        fp.write('{"payload": ')
+        fp.write(_serialize(test.payload))
+        fp.write(', "response": ')
+        fp.write(response_text if response_text is not None else "null")
+        fp.write("}")
+    return str(path)
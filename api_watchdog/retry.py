@@ -0,0 +1,63 @@
+import email.utils
+import random
+import threading
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from api_watchdog.core import RetryPolicy
+
+
+def parse_retry_after(value: Any) -> Optional[float]:
+    """
+    Seconds to wait according to a Retry-After header, given either as
+    delay-seconds or as an HTTP date. None if the header is missing or invalid.
+    """
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+def retry_delay(
+    policy: RetryPolicy, attempt: int, retry_after: Optional[float] = None
+) -> Optional[float]:
+    """
+    Seconds to wait after the given (1 based) attempt before the next one, or
+    None if the server asked to wait longer than the policy allows.
+    """
+    if retry_after is not None:
+        return retry_after if retry_after <= policy.max_backoff else None
+    delay = min(policy.max_backoff, policy.backoff * 2 ** (attempt - 1))
+    if policy.jitter:
+        delay = random.uniform(0, delay)
+    return delay
+
+
+class RetryBudget:
+    """Caps the number of retries in a run; None allows any number."""
+
+    def __init__(self, retries: Optional[int] = None):
+        self.retries = retries
+        self.remaining = retries
+        self._lock = threading.Lock()
+
+    def reset(self):
+        self.remaining = self.retries
+
+    def take(self) -> bool:
+        """Use up one retry, returning False if none are left."""
+        if self.remaining is None:
+            return True
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
@@ -1,36 +1,448 @@
 import concurrent.futures
+import contextlib
+import hashlib
 import json
 import logging
+import multiprocessing
+import socket
+import threading
 import time
-from typing import Iterable, Iterator, Any
-import requests
+from typing import Iterable, Iterator, Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 
-import jq
+import requests
+from requests.utils import guess_json_utf
+from urllib3.util.proxy import connection_requires_http_tunnel
 
 from api_watchdog.core import (
+    Attempt,
+    RateLimit,
+    RetentionPolicy,
+    RetryPolicy,
+    Timings,
+    WarmUp,
     WatchdogTest,
     WatchdogResult,
     Expectation,
     ExpectationResult,
     ExpectationLevel,
+    Metric,
+    MetricExpectation,
 )
+from api_watchdog.adaptive import AdaptiveConcurrency
+from api_watchdog.breaker import CircuitBreaker
+from api_watchdog.history import LatencyHistory, predicted_makespan
+from api_watchdog.limits import HostScheduler, merge_limits
 from api_watchdog.result_error import ResultError
-from api_watchdog.validate import validate, ValidationError
+from api_watchdog.retention import apply_retention, keeps_response
+from api_watchdog.retry import RetryBudget, parse_retry_after, retry_delay
+from api_watchdog.selector import (
+    PathStep,
+    compile_combined,
+    compile_selector,
+    evaluate_path,
+    evaluate_selectors,
+    parse_path,
+)
+from api_watchdog.stream import ijson, project_stream
+from api_watchdog.timing import (
+    REQUESTS_UNMEASURED,
+    TimedHTTPAdapter,
+    measure,
+    record_headers,
+    recording,
+)
+from api_watchdog.validate import (
+    enable_validation_cache,
+    set_validation_backend,
+    validate,
+    validation_backend,
+    validation_cache,
+    ValidationBackend,
+    ValidationError,
+)
 
 logger = logging.getLogger(__name__)
 
 
 class Timer:
     def __enter__(self):
-        self.start = time.time()
+        self.start = time.perf_counter()
+        return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.time = time.time() - self.start
+        self.time = time.perf_counter() - self.start
+
+
+SessionKey = Tuple[str, str, Optional[str]]
+LimitKey = Tuple[str, Optional[str]]
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# an unreachable host should not hold up the start of the run for long, its
+# tests will still try to connect
+WARM_UP_CONNECT_TIMEOUT = 10.0
+
+HOST_UNAVAILABLE = "host unavailable"
+
+
+class Fetched:
+    """
+    Outcome of sending the request of a test, before its expectations are
+    evaluated.
+
+    content holds the raw body, or for streamed tests document holds the
+    projection of the body for stream_paths. shared_request is the request key
+    when the response is shared by several tests (see WatchdogRunner.coalesce).
+    retry_after is the delay asked for by an error response, and attempts
+    records every attempt when the request was retried. reached is False
+    when the host could not be reached at all (connection error or timeout),
+    and skipped gives the reason when the request was not sent.
+    """
+
+    def __init__(
+        self,
+        status_code: int,
+        latency: float,
+        response_bytes: Optional[int] = None,
+        content: Optional[bytes] = None,
+        document: Any = None,
+        stream_paths: Optional[List[Tuple[PathStep, ...]]] = None,
+        retry_after: Optional[float] = None,
+        reached: bool = True,
+        skipped: Optional[str] = None,
+        timings: Optional[Timings] = None,
+    ):
+        self.status_code = status_code
+        self.latency = latency
+        self.response_bytes = response_bytes
+        self.content = content
+        self.document = document
+        self.stream_paths = stream_paths
+        self.retry_after = retry_after
+        self.reached = reached
+        self.skipped = skipped
+        self.timings = timings
+        self.shared_request: Optional[str] = None
+        self.attempts: Optional[List[Attempt]] = None
+
+
+class ResponseTooLargeError(Exception):
+    """Raised when a response exceeds its size limit."""
+
+
+class DeadlineExceededError(Exception):
+    """Raised when the run deadline passes while a response is read."""
+
+
+class ByteCounter:
+    """Counts the bytes of a response body as it is read, enforcing a limit."""
+
+    def __init__(self, limit: Optional[int]):
+        self.limit = limit
+        self.received = 0
+
+    def check_declared(self, content_length: Optional[str]):
+        """Abort before reading if the declared length is already too large."""
+        if self.limit is not None and content_length is not None \
+                and int(content_length) > self.limit:
+            raise ResponseTooLargeError
+
+    def add(self, chunk: bytes):
+        self.received += len(chunk)
+        if self.limit is not None and self.received > self.limit:
+            raise ResponseTooLargeError
+
+    def count(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            self.add(chunk)
+            yield chunk
 
 
 class WatchdogRunner:
-    def __init__(self, max_workers: int = 16):
+    """
+    Runs WatchdogTests from a thread pool.
+
+    Requests are sent through pooled keep-alive sessions, one per
+    scheme + host + proxy, so that tests against the same service reuse
+    connections for the duration of a run. Sessions are closed at the end of
+    run_tests, or by close() when run_test is called directly.
+
+    With eval_workers, run_tests evaluates expectations (jq and validation)
+    in a process pool, so the threads only wait on sockets and evaluation is
+    not serialized on the GIL. Responses are passed to the pool as raw bytes.
+
+    With coalesce, run_tests sends each distinct request (see request_key)
+    only once, and evaluates every test that makes it against the same
+    response.
+
+    rate_limit applies to every host (or host and proxy, with
+    limit_per_proxy) separately, combined with the rate_limit of the tests
+    against it. Requests that would exceed the limit of their host wait in
+    run_tests without taking up a worker, so other hosts keep being served.
+
+    Failed requests are retried according to the retry policy of the test, or
+    retry when it has none, with at most retry_budget retries per run.
+
+    With breaker_threshold, a host that could not be reached that many times
+    in a row is considered down: the remaining tests against it are skipped
+    until a probe request, sent every breaker_reset seconds, reaches it again.
+
+    connect_timeout and read_timeout apply to tests that do not set their
+    own. With deadline, run_tests stops after that many seconds: tests that
+    have not finished by then fail with RequestTimeout.
+
+    With a LatencyHistory, run_tests starts the tests expected to take longest
+    first, logs the predicted and actual makespan of the run (also kept as
+    predicted_makespan and actual_makespan), and records the new latencies.
+
+    With adaptive, max_workers is only the ceiling: run_tests starts with one
+    request in flight and lets an AdaptiveConcurrency controller (kept as
+    concurrency, with its decisions) raise the limit while latency and
+    errors stay stable, and cut it when they rise.
+
+    With warm_up, run_tests first opens in parallel the connections the run
+    will use, as many per host as will be in flight at once, so that the
+    tests are measured on warm connections. The cold cost of each host is
+    kept in warm_ups and the time the warm-up took in warm_up_time. The
+    warm-up is bounded by a deadline of its own, as long as the one of the
+    run, and its connects by WARM_UP_CONNECT_TIMEOUT.
+
+    Tests with a MetricExpectation on a phase the engine does not measure
+    (see unmeasured) are rejected with a ValueError.
+    """
+
+    # phases of Timings this engine cannot measure
+    unmeasured = REQUESTS_UNMEASURED
+
+    def __init__(
+        self,
+        max_workers: int = 16,
+        pool_connections: int = 10,
+        pool_maxsize: Optional[int] = None,
+        fast_path: bool = False,
+        stream: bool = False,
+        max_response_bytes: Optional[int] = None,
+        retention: Optional[RetentionPolicy] = None,
+        eval_workers: Optional[int] = None,
+        coalesce: bool = False,
+        rate_limit: Optional[RateLimit] = None,
+        limit_per_proxy: bool = False,
+        retry: Optional[RetryPolicy] = None,
+        retry_budget: Optional[int] = None,
+        breaker_threshold: Optional[int] = None,
+        breaker_reset: float = 30.0,
+        connect_timeout: float = 120.0,
+        read_timeout: float = 120.0,
+        deadline: Optional[float] = None,
+        history: Optional[LatencyHistory] = None,
+        adaptive: bool = False,
+        warm_up: bool = False,
+    ):
+        if stream and ijson is None:
+            raise ImportError("Streaming responses requires ijson to be installed.")
         self.max_workers = max_workers
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize or max_workers
+        self.fast_path = fast_path
+        self.stream = stream
+        self.max_response_bytes = max_response_bytes
+        self.retention = retention or RetentionPolicy()
+        self.eval_workers = eval_workers
+        self.coalesce = coalesce
+        self.rate_limit = rate_limit
+        self.limit_per_proxy = limit_per_proxy
+        self.retry = retry or RetryPolicy()
+        self._retry_budget = RetryBudget(retry_budget)
+        self._breaker = (
+            CircuitBreaker(breaker_threshold, breaker_reset)
+            if breaker_threshold else None
+        )
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self._run_started = time.monotonic()
+        self._deadline_at: Optional[float] = None
+        # streamed responses whose body is being read, see _abort_reads
+        self._reading: set = set()
+        self._reading_lock = threading.Lock()
+        self.history = history
+        self.predicted_makespan: Optional[float] = None
+        self.actual_makespan: Optional[float] = None
+        self._expected_durations: List[float] = []
+        self.adaptive = adaptive
+        self.concurrency: Optional[AdaptiveConcurrency] = None
+        self.warm_up = warm_up
+        self.warm_ups: List[WarmUp] = []
+        self.warm_up_time: Optional[float] = None
+        self._sessions: Dict[SessionKey, requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close every pooled session and its connections."""
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    @staticmethod
+    def _proxies(test: WatchdogTest) -> Optional[Dict[str, str]]:
+        """
+        Normalize WatchdogTest.proxy into a requests style proxies mapping.
+
+        A plain string is used as the proxy for both http and https.
+        """
+        if test.proxy is None:
+            return None
+        if isinstance(test.proxy, str):
+            return {"http": test.proxy, "https": test.proxy}
+        return dict(test.proxy)
+
+    @classmethod
+    def _session_key(cls, test: WatchdogTest) -> SessionKey:
+        url_parts = urlparse(test.target)
+        proxies = cls._proxies(test)
+        proxy_key = json.dumps(proxies, sort_keys=True) if proxies else None
+        return (url_parts.scheme, url_parts.netloc, proxy_key)
+
+    def _session(self, test: WatchdogTest) -> requests.Session:
+        """Return the pooled session for a test, creating it on first use."""
+        key = self._session_key(test)
+        with self._sessions_lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = TimedHTTPAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.hooks["response"].append(record_headers)
+                proxies = self._proxies(test)
+                if proxies:
+                    session.proxies.update(proxies)
+                self._sessions[key] = session
+            return session
+
+    def _limit_key(self, test: WatchdogTest) -> LimitKey:
+        _, netloc, proxy_key = self._session_key(test)
+        return (netloc, proxy_key if self.limit_per_proxy else None)
+
+    def _host_limits(
+        self, tests: Iterable[WatchdogTest]
+    ) -> Dict[LimitKey, RateLimit]:
+        """The rate limit of every host, from the runner and test settings."""
+        limits: Dict[LimitKey, List[Optional[RateLimit]]] = {}
+        for test in tests:
+            limits.setdefault(self._limit_key(test), [self.rate_limit]).append(
+                test.rate_limit
+            )
+        return {key: merge_limits(host_limits) for key, host_limits in limits.items()}
+
+    def request_key(self, test: WatchdogTest) -> str:
+        """
+        Hash of everything that determines the response read for a test:
+        method, target, proxies, body, how the body is read, and the timeouts
+        and retry policy it is fetched with.
+        """
+        stream_paths = self._stream_paths(test)
+        canonical = json.dumps(
+            {
+                "method": (test.method or "").upper(),
+                "target": test.target,
+                "proxies": self._proxies(test),
+                "body": self._request_body(test),
+                "stream_paths": stream_paths,
+                "max_response_bytes": self._max_response_bytes(test),
+                "connect_timeout": test.connect_timeout or self.connect_timeout,
+                "read_timeout": test.read_timeout or self.read_timeout,
+                "retry": (test.retry or self.retry).dict(),
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+    def _check_metrics(self, tests: Iterable[WatchdogTest]):
+        """
+        Reject thresholds on phases this engine does not measure, which would
+        otherwise pass whatever the phase took.
+        """
+        for test in tests:
+            for expectation in test.metric_expectations:
+                if expectation.metric.value in self.unmeasured:
+                    raise ValueError(
+                        f"test {test.name!r}: {expectation.metric.value} is not "
+                        f"measured by {type(self).__name__}"
+                    )
+
+    def _request_groups(self, tests: List[WatchdogTest]) -> List[List[int]]:
+        """
+        Group the indexes of tests that can share a request, in order of first
+        appearance. Without coalesce every test is its own group.
+        """
+        if not self.coalesce:
+            return self._order_groups(tests, [[i] for i in range(len(tests))])
+        groups: Dict[str, List[int]] = {}
+        for i, test in enumerate(tests):
+            groups.setdefault(self.request_key(test), []).append(i)
+        shared = sum(len(g) - 1 for g in groups.values())
+        if shared:
+            logger.info(f"Coalesced {shared} requests shared by several tests")
+        return self._order_groups(tests, list(groups.values()))
+
+    def _order_groups(
+        self, tests: List[WatchdogTest], groups: List[List[int]]
+    ) -> List[List[int]]:
+        """
+        With a latency history, order groups longest expected first (ties keep
+        their order), so that long tests do not start last.
+        """
+        if self.history is None:
+            return groups
+        expected = self.history.expected(tests)
+        durations = [max(expected[i] for i in group) for group in groups]
+        order = sorted(range(len(groups)), key=lambda g: -durations[g])
+        self._expected_durations = [durations[g] for g in order]
+        return [groups[g] for g in order]
+
+    def _concurrency(self) -> int:
+        """Number of requests that may be in flight at once."""
+        return self.max_workers
+
+    def _in_flight_limit(self) -> int:
+        """Number of requests allowed in flight right now."""
+        if self.concurrency is not None:
+            return self.concurrency.limit
+        return self._concurrency()
+
+    def _observe(self, fetched: Fetched):
+        if self.concurrency is not None:
+            self.concurrency.observe(
+                fetched.latency,
+                AdaptiveConcurrency.failed(fetched.status_code, fetched.reached),
+            )
+
+    def _fetch_group(
+        self,
+        tests: List[WatchdogTest],
+        indexes: List[int],
+        scheduler: Optional[HostScheduler] = None,
+    ) -> Fetched:
+        """Send the request shared by a group of tests once."""
+        fetched = self._fetch_with_retries(tests[indexes[0]], scheduler)
+        if len(indexes) > 1:
+            fetched.shared_request = self.request_key(tests[indexes[0]])
+        return fetched
 
     def run_test(self, test: WatchdogTest) -> WatchdogResult:
         """
@@ -42,90 +454,455 @@ class WatchdogRunner:
         :param test:
         :return:
         """
+        self._check_metrics([test])
+        return self._evaluate(test, self._fetch_with_retries(test))
+
+    def _fetch_with_retries(
+        self, test: WatchdogTest, scheduler: Optional[HostScheduler] = None
+    ) -> Fetched:
+        """
+        Send the request of a test, retrying it according to its policy. The
+        scheduler that handed out the request took a token of its host for the
+        first attempt, every retry takes one more.
+        """
+        attempts = []
+        while True:
+            if not self._breaker_allows(test):
+                if not attempts:
+                    return self._skipped(test)
+                break
+            fetched = None
+            try:
+                fetched = self._fetch(test)
+            finally:
+                if fetched is None:
+                    self._breaker_release(test)
+            self._breaker_record(test, fetched)
+            self._observe(fetched)
+            attempts.append(self._attempt(fetched))
+            delay = self._retry_delay(test, fetched, len(attempts))
+            if delay is None:
+                break
+            time.sleep(delay)
+            if scheduler is not None:
+                self._wait_for_token(test, scheduler)
+        if len(attempts) > 1:
+            fetched.attempts = attempts
+        return fetched
+
+    def _wait_for_token(self, test: WatchdogTest, scheduler: HostScheduler):
+        """Wait for a token of the host of a test, or for the run deadline."""
+        key = self._limit_key(test)
+        while not self._expired():
+            delay = scheduler.take_token(key)
+            if not delay:
+                return
+            time.sleep(self._until_deadline(delay))
+
+    def _breaker_allows(self, test: WatchdogTest) -> bool:
+        return self._breaker is None or self._breaker.allow(self._limit_key(test))
+
+    def _breaker_record(self, test: WatchdogTest, fetched: Fetched):
+        if self._breaker is not None:
+            self._breaker.record(self._limit_key(test), fetched.reached)
+
+    def _breaker_release(self, test: WatchdogTest):
+        if self._breaker is not None:
+            self._breaker.release(self._limit_key(test))
+
+    @staticmethod
+    def _skipped(test: WatchdogTest) -> Fetched:
+        logger.warning(f"[{test.target}]: skipping {test.name}, {HOST_UNAVAILABLE}")
+        return Fetched(status_code=503, latency=0.0, skipped=HOST_UNAVAILABLE)
+
+    @staticmethod
+    def _attempt(fetched: Fetched) -> Attempt:
+        return Attempt(
+            status_code=fetched.status_code,
+            latency=fetched.latency,
+            response_bytes=fetched.response_bytes,
+        )
+
+    def _retry_delay(
+        self, test: WatchdogTest, fetched: Fetched, attempt: int
+    ) -> Optional[float]:
+        """
+        Seconds to wait before retrying the request of a test after the given
+        attempt, or None if it should not be retried.
+        """
+        policy = test.retry or self.retry
+        if fetched.status_code not in policy.retry_on or attempt >= policy.max_attempts:
+            return None
+        delay = retry_delay(policy, attempt, fetched.retry_after)
+        if delay is None:
+            logger.info(
+                f"{test.name}: not retrying, server asked to wait {fetched.retry_after}s"
+            )
+            return None
+        remaining = self._remaining()
+        if remaining is not None and delay >= remaining:
+            logger.info(f"{test.name}: not retrying, the run deadline is too close")
+            return None
+        if not self._retry_budget.take():
+            logger.warning(f"{test.name}: not retrying, retry budget exhausted")
+            return None
+        logger.info(
+            f"{test.name}: attempt {attempt} ended with status code"
+            f" {fetched.status_code}, retrying in {delay:.2f}s"
+        )
+        return delay
+
+    def _fetch(self, test: WatchdogTest) -> Fetched:
+        """Send the request of a test and read its response."""
         logger.info(f"[{test.target}]: Running {test.name}...")
         method = test.method
 
-        # init some flags for payload state
-        body = None
+        body = self._request_body(test)
+        session = self._session(test)
+        stream_paths = self._stream_paths(test)
+        max_response_bytes = self._max_response_bytes(test)
+        counter = ByteCounter(max_response_bytes)
+        content = None
+        document = None
+        retry_after = None
+        reached = True
 
-        # if we have a test payload
-        if test.payload:
-            try:
-                # pydantic .json() returns a string, need to make JSON
-                body = json.loads(test.payload.json())
-            except AttributeError:  # we got a plain python dict and not a pydantic model
-                body = test.payload
+        request_kwargs = {"timeout": self._timeouts(test)}
+        if body is not None:
+            assert type(body) == dict, 'test.payload must be a dict.'
+            request_kwargs["json"] = body
+        # else we are just sending something simple on the url. the response should still be json
+        # with a deadline, the body is read in chunks so that it can be cut off
+        if stream_paths is not None or max_response_bytes is not None \
+                or self._deadline_at is not None:
+            request_kwargs["stream"] = True
 
         timer = Timer()
 
-        with timer:
+        with timer, recording() as phases:
             try:
-                if body is not None:
-                    assert type(body) == dict, 'test.payload must be a dict.'
-                    response = requests.request(method, url=test.target, json=body, timeout=120)
-                # else we are just sending something simple on the url. the response should still be json
-                else:
-                    response = requests.request(method, url=test.target, timeout=120)
+                response = session.request(method, url=test.target, **request_kwargs)
 
                 # grab the status code for later
                 status_code = response.status_code
+
+                if 400 <= status_code <= 599:
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    response.close()
+                elif "stream" in request_kwargs:
+                    with response, self._reading_body(response):
+                        counter.check_declared(response.headers.get("Content-Length"))
+                        chunks = counter.count(self._read_chunks(response))
+                        if stream_paths is not None:
+                            document = project_stream(chunks, stream_paths)
+                        else:
+                            content = b"".join(chunks)
+                else:
+                    content = response.content
+                    counter.received = len(content)
+            except ResponseTooLargeError:
+                logger.error(
+                    f'{test.name} Response larger than {max_response_bytes} bytes,'
+                    f' aborted after {counter.received} bytes'
+                )
+                status_code = 413
+            except DeadlineExceededError:
+                logger.error(
+                    f'{test.name} Run deadline reached, aborted after {counter.received} bytes'
+                )
+                status_code = 408
+                reached = False
             except requests.Timeout as e:
                 logger.error(f'{test.name} Timeout: {e}')
-                response = None
                 status_code = 408
+                reached = False
             except requests.RequestException as e:
                 logger.error(f'{test.name} Request Error: {e}')
-                response = None
                 status_code = 503
+                reached = False
             except Exception as e:
                 logger.error(f'{test.name} Exception: {e}')
-                response = None
                 status_code = 500
 
         latency = timer.time
         logger.info(f"[{test.target}]: {test.name} took {latency} with status code {status_code}")
 
-        if 400 <= status_code <= 599:
-            expectation_results = [
-                ExpectationResult(
-                    expectation=expectation,
-                    result=ResultError(status_code),
-                    actual=None,
-                )
-                for expectation in test.expectations
-            ]
-            return WatchdogResult(
-                test_name=test.name,
-                target=test.target,
-                success=False,
-                latency=latency,
-                timestamp=time.time(),
-                email_to=test.email_to,
-                payload=test.payload,
-                response=None,
-                results=expectation_results,
+        return Fetched(
+            status_code=status_code,
+            latency=latency,
+            response_bytes=counter.received,
+            content=content,
+            document=document,
+            stream_paths=stream_paths,
+            retry_after=retry_after,
+            reached=reached,
+            timings=phases.timings(),
+        )
+
+    def _read_chunks(self, response: requests.Response) -> Iterator[bytes]:
+        """
+        The body of a streamed response in chunks, checking the run deadline
+        between chunks. A read blocked at the deadline is ended by
+        _abort_reads; either way a body still arriving at the deadline raises
+        DeadlineExceededError instead of keeping its thread alive.
+        """
+        try:
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                if self._expired():
+                    raise DeadlineExceededError
+                yield chunk
+        except (requests.RequestException, OSError) as e:
+            if self._expired():
+                raise DeadlineExceededError from e
+            raise
+
+    @contextlib.contextmanager
+    def _reading_body(self, response: requests.Response):
+        with self._reading_lock:
+            self._reading.add(response)
+        try:
+            yield
+        finally:
+            with self._reading_lock:
+                self._reading.discard(response)
+
+    def _abort_reads(self):
+        """
+        Shut down the connections of the responses still being read, waking
+        up their threads. Socket timeouts only bound each read, so a body
+        that keeps arriving would otherwise be read to its end.
+        """
+        with self._reading_lock:
+            responses = list(self._reading)
+        for response in responses:
+            sock = getattr(response.raw.connection, "sock", None)
+            if sock is None:
+                # http.client detaches the socket from a connection that
+                # closes after the response, which still reads from it
+                fp = getattr(getattr(response.raw, "_fp", None), "fp", None)
+                sock = getattr(getattr(fp, "raw", None), "_sock", None)
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _evaluate(self, test: WatchdogTest, fetched: Fetched) -> WatchdogResult:
+        """Turn the outcome of a request into the result of a test."""
+        policy = self._retention(test)
+        response_text = None
+        timings = fetched.timings.copy() if fetched.timings is not None else Timings()
+        if fetched.skipped is not None:
+            result = self._skipped_result(test, fetched)
+        elif 400 <= fetched.status_code <= 599:
+            result = self._error_result(test, fetched)
+        elif fetched.stream_paths is not None:
+            result = self._evaluate_stream(test, fetched, timings)
+        else:
+            with measure(timings, "parse"):
+                response_text = self._decode_json(fetched.content)
+            result = self._evaluate_response(
+                test, fetched, response_text, policy, timings
+            )
+        return apply_retention(policy, test, result, response_text)
+
+    def _timeouts(self, test: WatchdogTest) -> Tuple[float, float]:
+        """
+        Connect and read timeouts for the request of a test, shortened so
+        that they expire by the run deadline.
+        """
+        connect = test.connect_timeout or self.connect_timeout
+        read = test.read_timeout or self.read_timeout
+        remaining = self._remaining()
+        if remaining is not None:
+            remaining = max(remaining, 0.001)
+            connect, read = min(connect, remaining), min(read, remaining)
+        return connect, read
+
+    def _retention(self, test: WatchdogTest) -> RetentionPolicy:
+        return test.retention or self.retention
+
+    def _max_response_bytes(self, test: WatchdogTest) -> Optional[int]:
+        """The strictest of the runner wide and per test response size limits."""
+        limits = [
+            limit
+            for limit in (self.max_response_bytes, test.max_response_bytes)
+            if limit is not None
+        ]
+        return min(limits) if limits else None
+
+    def _stream_paths(
+        self, test: WatchdogTest
+    ) -> Optional[List[Tuple[PathStep, ...]]]:
+        """
+        Return the parsed selector paths if the response of a test should be
+        streamed, or None if it should be read whole.
+
+        Streaming is only possible when every selector of the test is a plain
+        path (see selector.parse_path).
+        """
+        stream = self.stream if test.stream is None else test.stream
+        if not stream:
+            return None
+        if ijson is None:
+            logger.warning(f"{test.name}: ijson is not installed, reading response whole")
+            return None
+        paths = [parse_path(expectation.selector) for expectation in test.expectations]
+        if any(path is None for path in paths):
+            logger.info(
+                f"{test.name}: not every selector is a plain path, reading response whole"
             )
+            return None
+        return paths
+
+    @staticmethod
+    def _request_body(test: WatchdogTest) -> Any:
+        """
+        Return the JSON body to send for a test, or None if the test has no payload.
+        """
+        if not test.payload:
+            return None
+        try:
+            # pydantic .json() returns a string, need to make JSON
+            return json.loads(test.payload.json())
+        except AttributeError:  # we got a plain python dict and not a pydantic model
+            return test.payload
+
+    @staticmethod
+    def _decode_json(content: bytes) -> str:
+        """Decode a JSON response body, detecting UTF-8/16/32 like requests does."""
+        return content.decode(guess_json_utf(content) or "utf-8")
+
+    @staticmethod
+    def _error_result(test: WatchdogTest, fetched: Fetched) -> WatchdogResult:
+        """
+        Build a failed result for a test whose request did not produce a usable
+        response. Every expectation is marked with the corresponding ResultError.
+        """
+        expectation_results = [
+            ExpectationResult(
+                expectation=expectation,
+                result=ResultError(fetched.status_code),
+                actual=None,
+            )
+            for expectation in [*test.expectations, *test.metric_expectations]
+        ]
+        return WatchdogResult(
+            test_name=test.name,
+            target=test.target,
+            success=False,
+            latency=fetched.latency,
+            response_bytes=fetched.response_bytes,
+            shared_request=fetched.shared_request,
+            attempts=fetched.attempts,
+            timings=fetched.timings,
+            timestamp=time.time(),
+            email_to=test.email_to,
+            payload=test.payload,
+            response=None,
+            results=expectation_results,
+        )
+
+    @staticmethod
+    def _skipped_result(test: WatchdogTest, fetched: Fetched) -> WatchdogResult:
+        """Build a failed result for a test whose request was not sent."""
+        return WatchdogResult(
+            test_name=test.name,
+            target=test.target,
+            success=False,
+            latency=fetched.latency,
+            skipped=fetched.skipped,
+            timestamp=time.time(),
+            email_to=test.email_to,
+            payload=test.payload,
+            response=None,
+            results=[
+                ExpectationResult(expectation=expectation, result="skipped", actual=None)
+                for expectation in [*test.expectations, *test.metric_expectations]
+            ],
+        )
+
+    def _evaluate_response(
+        self,
+        test: WatchdogTest,
+        fetched: Fetched,
+        response_text: str,
+        policy: RetentionPolicy,
+        timings: Timings,
+    ) -> WatchdogResult:
+        """
+        Check every expectation of a test against a JSON response.
+
+        The response text is handed to jq as is, so only the values returned
+        by the selectors are converted into python objects. All selectors of
+        the test are evaluated in a single pass over the document. With
+        fast_path, plain path selectors are evaluated in python on the parsed
+        document instead.
 
-        assert response is not None
+        The whole response is only parsed into python objects if it is needed
+        for the fast path or kept on the result by the retention policy.
+        """
+        with measure(timings, "parse"):
+            response_parsed = json.loads(response_text) if self.fast_path else None
+        with measure(timings, "select"):
+            selector_outputs = evaluate_selectors(
+                [expectation.selector for expectation in test.expectations],
+                response_text,
+                fast_path=self.fast_path,
+                document=response_parsed,
+            )
+        result = self._result_from_outputs(
+            test, fetched, selector_outputs, None, timings
+        )
+        if keeps_response(policy, result.success):
+            with measure(timings, "parse"):
+                result.response = (
+                    response_parsed if self.fast_path else json.loads(response_text)
+                )
+        return result
 
-        # grab the response in json format
-        response_parsed = response.json()
+    def _evaluate_stream(
+        self, test: WatchdogTest, fetched: Fetched, timings: Timings
+    ) -> WatchdogResult:
+        """
+        Check every expectation of a test against the projection of a
+        streamed response. The response itself is not kept on the result, and
+        it was parsed while it was downloaded.
+        """
+        with measure(timings, "select"):
+            selector_outputs = [
+                evaluate_path(path, fetched.document) for path in fetched.stream_paths
+            ]
+        return self._result_from_outputs(
+            test, fetched, selector_outputs, None, timings
+        )
 
+    def _result_from_outputs(
+        self,
+        test: WatchdogTest,
+        fetched: Fetched,
+        selector_outputs: List[Tuple[List[Any], bool]],
+        response: Any,
+        timings: Timings,
+    ) -> WatchdogResult:
         expectation_results = []
-        for expectation in test.expectations:
-            try:
-                for e in jq.compile(expectation.selector).input(
-                    response_parsed
-                ):
+        for expectation, (values, errored) in zip(test.expectations, selector_outputs):
+            for e in values:
+                with measure(timings, "validation"):
                     expectation_error = self.resolve_expectation(expectation, e)
-                    expectation_results.append(expectation_error)
-            except ValueError:
-                # jq internal error
+                expectation_results.append(expectation_error)
+            if errored:
+                # jq runtime error, eg. indexing an array with a string
                 expectation_results.append(
                     ExpectationResult(
                         expectation=expectation, result="jq-error", actual=None
                     )
                 )
+        expectation_results.extend(
+            self.resolve_metric_expectation(expectation, fetched, timings)
+            for expectation in test.metric_expectations
+        )
 
         success = all(
             [
@@ -139,11 +916,15 @@ class WatchdogRunner:
             test_name=test.name,
             target=test.target,
             success=success,
-            latency=latency,
+            latency=fetched.latency,
+            response_bytes=fetched.response_bytes,
+            shared_request=fetched.shared_request,
+            attempts=fetched.attempts,
+            timings=timings,
             timestamp=time.time(),
             email_to=test.email_to,
             payload=test.payload,
-            response=response_parsed,
+            response=response,
             results=expectation_results,
         )
 
@@ -152,10 +933,324 @@ class WatchdogRunner:
     def run_tests(
         self, tests: Iterable[WatchdogTest]
     ) -> Iterator[WatchdogResult]:
-        with concurrent.futures.ThreadPoolExecutor(
+        tests = list(tests)
+        self._check_metrics(tests)
+        groups = self._request_groups(tests)
+        if self.warm_up:
+            self._warm_up(tests, groups)
+        self._start_run()
+        scheduler = HostScheduler(self._host_limits(tests))
+        for indexes in groups:
+            scheduler.add(self._limit_key(tests[indexes[0]]), indexes)
+        # results, or evaluations in the process pool
+        results: List[Any] = [None] * len(tests)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        evaluation_pool = self._evaluation_pool()
+        try:
+
+            def run_group(indexes: List[int]) -> list:
+                fetched = self._fetch_group(tests, indexes, scheduler)
+                if evaluation_pool is None:
+                    return [self._evaluate(tests[i], fetched) for i in indexes]
+                # threads only send requests and read responses, handing
+                # evaluation off to the process pool
+                return [
+                    evaluation_pool.submit(
+                        evaluate_fetched,
+                        self._evaluation_settings(),
+                        tests[i],
+                        fetched,
+                    )
+                    for i in indexes
+                ]
+
+            running: Dict[concurrent.futures.Future, Tuple[LimitKey, List[int]]] = {}
+            while (scheduler.pending or running) and not self._expired():
+                delay = None
+                while len(running) < self._in_flight_limit():
+                    scheduled, delay = scheduler.next()
+                    if scheduled is None:
+                        break
+                    key, indexes = scheduled
+                    running[executor.submit(run_group, indexes)] = (key, indexes)
+                delay = self._until_deadline(delay)
+                if not running:
+                    # every pending host is waiting for tokens
+                    time.sleep(delay)
+                    continue
+                done, _ = concurrent.futures.wait(
+                    running,
+                    timeout=delay,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                for future in done:
+                    key, indexes = running.pop(future)
+                    scheduler.done(key)
+                    for i, output in zip(indexes, future.result()):
+                        results[i] = output
+
+            if evaluation_pool is not None:
+                evaluations = [e for e in results if e is not None]
+                concurrent.futures.wait(evaluations, timeout=self._until_deadline(None))
+                results = [
+                    e.result() if e is not None and e.done() else None
+                    for e in results
+                ]
+        finally:
+            # past the deadline, requests still in flight are abandoned: their
+            # socket timeouts were capped to the time that was left, and the
+            # bodies still being read are cut off
+            expired = self._expired()
+            if expired:
+                self._abort_reads()
+            executor.shutdown(wait=not expired, cancel_futures=True)
+            if evaluation_pool is not None:
+                evaluation_pool.shutdown(wait=not expired, cancel_futures=True)
+            self.close()
+        logger.debug(
+            f"jq program cache: {compile_selector.cache_info()},"
+            f" combined program cache: {compile_combined.cache_info()}"
+        )
+        if validation_cache() is not None:
+            logger.debug(f"validation cache: {validation_cache().info()}")
+        return iter(self._finish_run(tests, results))
+
+    def _start_run(self):
+        self._retry_budget.reset()
+        self._run_started = time.monotonic()
+        self._deadline_at = (
+            self._run_started + self.deadline if self.deadline is not None else None
+        )
+        self.concurrency = (
+            AdaptiveConcurrency(self._concurrency()) if self.adaptive else None
+        )
+
+    def _remaining(self) -> Optional[float]:
+        """Seconds left before the run deadline, or None without a deadline."""
+        if self._deadline_at is None:
+            return None
+        return self._deadline_at - time.monotonic()
+
+    def _expired(self) -> bool:
+        remaining = self._remaining()
+        return remaining is not None and remaining <= 0
+
+    def _until_deadline(self, delay: Optional[float]) -> Optional[float]:
+        """Shorten a wait so that it ends by the run deadline."""
+        remaining = self._remaining()
+        if remaining is None:
+            return delay
+        remaining = max(remaining, 0.0)
+        return remaining if delay is None else min(delay, remaining)
+
+    def _finish_run(
+        self, tests: List[WatchdogTest], results: List[Optional[WatchdogResult]]
+    ) -> List[WatchdogResult]:
+        """Mark the tests that did not finish before the deadline as timed out."""
+        unfinished = [i for i, result in enumerate(results) if result is None]
+        if unfinished:
+            logger.error(
+                f"Run deadline of {self.deadline}s exceeded,"
+                f" {len(unfinished)} tests did not finish"
+            )
+        waited = time.monotonic() - self._run_started
+        for i in unfinished:
+            results[i] = self._evaluate(
+                tests[i], Fetched(status_code=408, latency=waited)
+            )
+        if self.history is not None:
+            self._report_makespan(waited)
+            self.history.record(results)
+        return results
+
+    def _report_makespan(self, actual: float):
+        concurrency = self._concurrency()
+        self.predicted_makespan = predicted_makespan(
+            self._expected_durations, concurrency
+        )
+        self.actual_makespan = actual
+        alternatives = ", ".join(
+            f"{workers}: {predicted_makespan(self._expected_durations, workers):.1f}s"
+            for workers in (max(concurrency // 2, 1), concurrency * 2)
+        )
+        logger.info(
+            f"Makespan predicted {self.predicted_makespan:.1f}s with"
+            f" {concurrency} concurrent requests ({alternatives}), actual {actual:.1f}s"
+        )
+
+    def _warm_up_plan(
+        self, tests: List[WatchdogTest], groups: List[List[int]]
+    ) -> List[Tuple[WatchdogTest, int]]:
+        """
+        A test for every scheme, host and proxy of the run, with the number of
+        connections the run will have open to it at once.
+        """
+        requests_by_key: Dict[SessionKey, List[WatchdogTest]] = {}
+        for indexes in groups:
+            test = tests[indexes[0]]
+            requests_by_key.setdefault(self._session_key(test), []).append(test)
+        limits = self._host_limits(tests)
+        plan = []
+        for key_tests in requests_by_key.values():
+            test = key_tests[0]
+            connections = min(len(key_tests), self._concurrency())
+            max_concurrency = limits[self._limit_key(test)].max_concurrency
+            if max_concurrency is not None:
+                connections = min(connections, max_concurrency)
+            plan.append((test, connections))
+        return plan
+
+    def _warm_up(self, tests: List[WatchdogTest], groups: List[List[int]]):
+        """Open the connections of the run ahead of it, see warm_up."""
+        self._start_warm_up()
+        plan = [
+            (test, min(connections, self.pool_maxsize))
+            for test, connections in self._warm_up_plan(tests, groups)
+        ]
+        timer = Timer()
+        with timer, concurrent.futures.ThreadPoolExecutor(
             max_workers=self.max_workers
         ) as executor:
-            return executor.map(self.run_test, tests)
+            opening = [
+                [executor.submit(self._open_connection, test) for _ in range(connections)]
+                for test, connections in plan
+            ]
+        # connections only go back to their pool once all are open, so that
+        # none is handed out twice
+        warm_ups = []
+        for (test, _), futures in zip(plan, opening):
+            timings, errors = [], []
+            for future in futures:
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                    continue
+                pool, connection, connection_timings = future.result()
+                pool._put_conn(connection)
+                timings.append(connection_timings)
+            warm_ups.append(self._host_warm_up(test, timings, errors))
+        self._report_warm_up(warm_ups, timer.time)
+
+    def _open_connection(self, test: WatchdogTest) -> Tuple[Any, Any, Timings]:
+        """Open a connection of the pool a test will use, without using it."""
+        session = self._session(test)
+        settings = session.merge_environment_settings(test.target, {}, None, None, None)
+        adapter = session.get_adapter(test.target)
+        pool = adapter.get_connection(test.target, settings["proxies"])
+        adapter.cert_verify(pool, test.target, settings["verify"], settings["cert"])
+        # urllib3 has no public way to open a connection without a request,
+        # this mirrors HTTPConnectionPool.urlopen
+        tunnel = pool.proxy is not None and connection_requires_http_tunnel(
+            pool.proxy, pool.proxy_config, urlparse(test.target).scheme
+        )
+        connection = pool._get_conn()
+        connection.timeout = self._warm_up_timeout(test)
+        try:
+            with recording() as phases:
+                if connection.is_closed and tunnel:
+                    pool._prepare_proxy(connection)
+                elif connection.is_closed:
+                    connection.connect()
+        except Exception:
+            pool._put_conn(connection)
+            raise
+        return pool, connection, phases.timings()
+
+    def _start_warm_up(self):
+        """
+        Bound the warm-up by a deadline as long as the one of the run, instead
+        of whatever is left of the deadline of a previous run.
+        """
+        self._deadline_at = (
+            time.monotonic() + self.deadline if self.deadline is not None else None
+        )
+
+    def _warm_up_timeout(self, test: WatchdogTest) -> float:
+        """Connect timeout of a warm-up connection."""
+        return min(self._timeouts(test)[0], WARM_UP_CONNECT_TIMEOUT)
+
+    @staticmethod
+    def _host_warm_up(
+        test: WatchdogTest, timings: List[Timings], errors: List[BaseException]
+    ) -> WarmUp:
+        """Summarize the connections opened to the host of a test."""
+        url_parts = urlparse(test.target)
+        average = {}
+        for phase in ("dns", "connect", "tls"):
+            values = [getattr(t, phase) for t in timings if getattr(t, phase) is not None]
+            if values:
+                average[phase] = sum(values) / len(values)
+        return WarmUp(
+            target=f"{url_parts.scheme}://{url_parts.netloc}",
+            connections=len(timings),
+            timings=Timings(
+                **average,
+                unmeasured=timings[0].unmeasured if timings else [],
+            ),
+            error=str(errors[0]) if errors else None,
+        )
+
+    def _report_warm_up(self, warm_ups: List[WarmUp], elapsed: float):
+        self.warm_ups = warm_ups
+        self.warm_up_time = elapsed
+        logger.info(
+            f"Warm-up opened {sum(w.connections for w in warm_ups)} connections"
+            f" to {len(warm_ups)} hosts in {elapsed:.3f}s"
+        )
+        for warm_up in warm_ups:
+            if warm_up.error is not None:
+                logger.warning(f"[{warm_up.target}]: warm-up failed: {warm_up.error}")
+            cost = sum(
+                t for t in (warm_up.timings.dns, warm_up.timings.connect, warm_up.timings.tls)
+                if t is not None
+            )
+            logger.info(
+                f"[{warm_up.target}]: {warm_up.connections} warm connections,"
+                f" {cost:.3f}s to open one cold"
+            )
+
+    def _evaluation_pool(self) -> Optional[concurrent.futures.Executor]:
+        """
+        Process pool for the evaluation stage, or None when evaluation runs in
+        the request threads.
+        """
+        if not self.eval_workers:
+            return None
+        # workers validate the same way this process does
+        cache = validation_cache()
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.eval_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=configure_validation,
+            initargs=(
+                cache.maxsize if cache is not None else None,
+                validation_backend(),
+            ),
+        )
+
+    def _evaluation_settings(self) -> Dict[str, Any]:
+        """Runner settings that affect evaluation, for evaluate_fetched."""
+        return {
+            "fast_path": self.fast_path,
+            "retention": self.retention,
+        }
+
+    @staticmethod
+    def resolve_metric_expectation(
+        expectation: MetricExpectation, fetched: Fetched, timings: Timings
+    ) -> ExpectationResult:
+        """Check a threshold against what was measured of the request."""
+        if expectation.metric == Metric.LATENCY:
+            actual = fetched.latency
+        elif expectation.metric == Metric.RESPONSE_BYTES:
+            actual = fetched.response_bytes
+        else:
+            actual = getattr(timings, expectation.metric.value)
+        passed = actual is None or actual < expectation.max
+        return ExpectationResult(
+            expectation=expectation,
+            result="success" if passed else "value",
+            actual=actual,
+        )
 
     @staticmethod
     def resolve_expectation(
@@ -176,3 +1271,24 @@ class WatchdogRunner:
             return ExpectationResult(
                 expectation=expectation, result="value", actual=validated_elem
             )
+
+
+def configure_validation(
+    cache_size: Optional[int], backend: ValidationBackend
+):
+    """Set up validation in an evaluation worker process."""
+    if cache_size:
+        enable_validation_cache(cache_size)
+    set_validation_backend(backend)
+
+
+def evaluate_fetched(
+    settings: Dict[str, Any], test: WatchdogTest, fetched: Fetched
+) -> WatchdogResult:
+    """
+    Evaluate the response of a test in an evaluation worker process.
+
+    settings are the runner's _evaluation_settings(), used to build an
+    equivalent runner in the worker.
+    """
+    return WatchdogRunner(**settings)._evaluate(test, fetched)
@@ -0,0 +1,259 @@
+import functools
+import json
+import math
+import re
+import sys
+from typing import Any, Iterator, List, Literal, NamedTuple, Optional, Sequence, Tuple
+
+import jq
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_selector(selector: str):
+    """
+    Compile a jq selector, reusing the compiled program for repeated selectors.
+
+    Compiled programs are shared by every expectation (and every run) in the
+    process. Hit/miss counters are available from compile_selector.cache_info().
+
+    Raises ValueError if the selector is not a valid jq program.
+    """
+    return jq.compile(selector)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_combined(selectors: Tuple[str, ...]):
+    """
+    Compile several selectors into one jq program that walks the input once.
+
+    The program outputs a single array with one entry per selector. Each entry
+    is the list of that selector's outputs wrapped as {"value": ...}, followed
+    by {"error": ...} if the selector raised, so a failing selector does not
+    affect the others.
+
+    Raises ValueError if the combined program does not compile.
+    """
+    # the newline keeps a trailing comment in a selector from swallowing the
+    # closing parenthesis
+    parts = [
+        f'[try (({selector}\n) | {{"value": .}}) catch {{"error": .}}]'
+        for selector in selectors
+    ]
+    return jq.compile("[" + ", ".join(parts) + "]")
+
+
+def evaluate_selectors(
+    selectors: Sequence[str],
+    text: str,
+    fast_path: bool = False,
+    document: Any = None,
+) -> List[Tuple[List[Any], bool]]:
+    """
+    Evaluate every selector against a JSON document in a single jq pass.
+
+    Returns, for each selector, the list of values it produced and whether it
+    raised a jq error after producing them. Falls back to evaluating the
+    selectors one at a time if they cannot be combined into one program.
+
+    When fast_path is set, document must be the parsed text. Selectors that
+    are plain paths (see parse_path) are then evaluated on it directly in
+    python and only the remaining selectors are handed to jq.
+    """
+    paths = [
+        parse_path(selector) if fast_path else None for selector in selectors
+    ]
+    jq_outputs = iter(
+        _evaluate_jq(
+            [s for s, path in zip(selectors, paths) if path is None], text
+        )
+    )
+    return [
+        evaluate_path(path, document) if path is not None else next(jq_outputs)
+        for path in paths
+    ]
+
+
+def _evaluate_jq(
+    selectors: Sequence[str], text: str
+) -> List[Tuple[List[Any], bool]]:
+    if not selectors:
+        return []
+    try:
+        combined = compile_combined(tuple(selectors)).input_text(text).all()
+    except ValueError:
+        combined = None
+    if combined is None or len(combined) != 1:
+        # eg. a selector halts the program, which cannot be caught per selector
+        return [_evaluate_selector(selector, text) for selector in selectors]
+
+    outputs = []
+    for selector_output in combined[0]:
+        values = [x["value"] for x in selector_output if "value" in x]
+        errored = any("error" in x for x in selector_output)
+        outputs.append((values, errored))
+    return outputs
+
+
+def _evaluate_selector(selector: str, text: str) -> Tuple[List[Any], bool]:
+    values = []
+    try:
+        for value in compile_selector(selector).input_text(text):
+            values.append(value)
+    except ValueError:
+        return values, True
+    return values, False
+
+
+class PathStep(NamedTuple):
+    """One step of a plain path selector, eg. `.name`, `[0]` or `[]?`."""
+
+    kind: Literal["key", "index", "iterate"]
+    key: Any = None
+    optional: bool = False
+
+
+_STRING = r'"(?:[^"\\]|\\.)*"'
+_STEP = re.compile(
+    rf"""\s*(?:
+        \.(?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+      | \.(?P<field>{_STRING})
+      | (?P<dot>\.)?\[\s*(?:(?P<key>{_STRING})|(?P<index>-?[0-9]+))?\s*\]
+    )(?P<optional>\?)?""",
+    re.VERBOSE,
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_path(selector: str) -> Optional[Tuple[PathStep, ...]]:
+    """
+    Analyze a selector, returning its steps if it is a plain path.
+
+    A plain path is made only of field access (`.a`, `."a"`, `["a"]`),
+    integer indexing (`[0]`, `[-1]`) and iteration (`[]`), each optionally
+    suffixed with `?`, eg. `.message.knowledge_graph.nodes["MONDO:0005148"].name`.
+    Returns None for anything else, which must be evaluated by jq.
+    """
+    selector = selector.strip()
+    if selector == ".":
+        return ()
+    if not selector.startswith("."):
+        return None
+
+    steps = []
+    position = 0
+    while position < len(selector):
+        match = _STEP.match(selector, position)
+        if match is None:
+            return None
+        if position == 0 and match.group("ident") is None and \
+                match.group("field") is None and match.group("dot") is None:
+            return None
+        optional = match.group("optional") is not None
+        string = match.group("field") or match.group("key")
+        if match.group("ident") is not None:
+            steps.append(PathStep("key", match.group("ident"), optional))
+        elif string is not None:
+            if "\\(" in string:
+                # string interpolation
+                return None
+            try:
+                key = json.loads(string)
+            except ValueError:
+                return None
+            steps.append(PathStep("key", key, optional))
+        elif match.group("index") is not None:
+            steps.append(PathStep("index", int(match.group("index")), optional))
+        else:
+            steps.append(PathStep("iterate", None, optional))
+        position = match.end()
+    return tuple(steps)
+
+
+class _PathError(Exception):
+    """A path step was applied to a value of the wrong type."""
+
+
+def evaluate_path(
+    path: Tuple[PathStep, ...], document: Any
+) -> Tuple[List[Any], bool]:
+    """
+    Evaluate a plain path on a parsed JSON document with jq semantics.
+
+    Returns the same (values, errored) pair as evaluate_selectors.
+    """
+    values = []
+    try:
+        for value in _walk(path, document):
+            values.append(_jq_value(value))
+    except _PathError:
+        return values, True
+    return values, False
+
+
+def _walk(path: Tuple[PathStep, ...], value: Any) -> Iterator[Any]:
+    if not path:
+        yield value
+        return
+    step = path[0]
+    try:
+        children = _apply_step(step, value)
+    except _PathError:
+        if step.optional:
+            return
+        raise
+    for child in children:
+        yield from _walk(path[1:], child)
+
+
+def _apply_step(step: PathStep, value: Any) -> List[Any]:
+    if step.kind == "iterate":
+        if isinstance(value, list):
+            return value
+        if isinstance(value, dict):
+            return list(value.values())
+        raise _PathError
+    if value is None:
+        return [None]
+    if step.kind == "key" and isinstance(value, dict):
+        return [value.get(step.key)]
+    if step.kind == "index" and isinstance(value, list):
+        index = step.key + len(value) if step.key < 0 else step.key
+        return [value[index] if 0 <= index < len(value) else None]
+    raise _PathError
+
+
+def _jq_value(value: Any) -> Any:
+    """Convert a parsed JSON value into what jq would output for it."""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return _jq_number(value)
+    if isinstance(value, dict):
+        return {k: _jq_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_jq_value(v) for v in value]
+    return value
+
+
+# integral doubles up to this size are exact, larger ones do not come back
+# from jq as int(double)
+_EXACT_INTEGERS = 2 ** 53
+
+
+def _jq_number(value) -> Any:
+    # jq stores every number as a double, and integral doubles come back as ints
+    try:
+        number = float(value)
+    except OverflowError:
+        number = math.copysign(math.inf, value)
+    if math.isnan(number):
+        return None
+    if math.isinf(number):
+        return math.copysign(sys.float_info.max, number)
+    if not number.is_integer():
+        return number
+    if abs(number) > _EXACT_INTEGERS:
+        # jq prints large doubles with 17 significant digits, let it convert
+        # those rather than imitate its rounding
+        return compile_selector(".").input_text(json.dumps(value)).first()
+    return int(number)
@@ -0,0 +1,61 @@
+from argparse import ArgumentTypeError
+import hashlib
+import heapq
+from typing import List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    Parse a shard given as i/n, the i-th (counting from 1) of n shards.
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ArgumentTypeError(f"invalid shard {value!r}, expected i/n") from None
+    if not 1 <= index <= count:
+        raise ArgumentTypeError(f"invalid shard {value!r}, expected 1 <= i <= n")
+    return index, count
+
+
+def shard_hash(key: str) -> int:
+    """Hash of a key that is the same on every machine and Python process."""
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "big")
+
+
+def shard(
+    items: Sequence[T],
+    keys: Sequence[str],
+    index: int,
+    count: int,
+    weights: Optional[Sequence[float]] = None,
+) -> List[T]:
+    """
+    Items of the index-th (counting from 1) of count shards.
+
+    Without weights an item goes to the shard given by the hash of its key,
+    so it stays there when other items are added or removed. With weights
+    (eg. expected latencies), items are dealt heaviest first to the lightest
+    shard, so that the shards take about as long; ties are broken by key, so
+    every machine computes the same shards from the same keys and weights.
+    Items without a (positive) weight, such as tests missing from an empty
+    history, are hashed. Either way every item is in exactly one shard.
+    """
+    def hashed(i: int) -> bool:
+        return shard_hash(keys[i]) % count == index - 1
+
+    if weights is None:
+        return [items[i] for i in range(len(items)) if hashed(i)]
+    selected = [i for i in range(len(items)) if weights[i] <= 0 and hashed(i)]
+    order = sorted(
+        (i for i in range(len(items)) if weights[i] > 0),
+        key=lambda i: (-weights[i], shard_hash(keys[i]), keys[i]),
+    )
+    loads = [(0.0, shard_index) for shard_index in range(count)]
+    for i in order:
+        load, shard_index = heapq.heappop(loads)
+        if shard_index == index - 1:
+            selected.append(i)
+        heapq.heappush(loads, (load + weights[i], shard_index))
+    return [items[i] for i in sorted(selected)]
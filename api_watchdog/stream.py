@@ -0,0 +1,188 @@
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+from api_watchdog.selector import PathStep
+
+
+class _Node:
+    """
+    Node of a trie built from plain path selectors.
+
+    Each node describes which parts of a JSON value at that position are needed
+    by at least one selector.
+    """
+
+    def __init__(self):
+        self.keys: Dict[str, "_Node"] = {}
+        self.indexes: Dict[int, "_Node"] = {}
+        self.iterate: Optional["_Node"] = None
+        self.terminal = False
+
+
+# marker for a subtree that must be kept whole
+_ALL = _Node()
+# marker for a value that no selector can reach
+_SKIPPED = object()
+
+
+def _build_trie(paths: Sequence[Tuple[PathStep, ...]]) -> _Node:
+    root = _Node()
+    for path in paths:
+        node = root
+        for step in path:
+            if step.kind == "key":
+                node = node.keys.setdefault(step.key, _Node())
+            elif step.kind == "index":
+                node = node.indexes.setdefault(step.key, _Node())
+            else:
+                node.iterate = node.iterate or _Node()
+                node = node.iterate
+        node.terminal = True
+    return root
+
+
+class _Frame:
+    """An object or array that is being projected."""
+
+    def __init__(self, container, nodes: List[_Node]):
+        self.container = container
+        self.nodes = nodes
+        self.key = None
+        self.index = 0
+        # trailing array elements nobody can reach do not need placeholders
+        self.keep_until = max(
+            [i for node in nodes for i in node.indexes if i >= 0], default=-1
+        )
+
+    def child_nodes(self) -> List[_Node]:
+        if self.nodes is _ALL_NODES:
+            return _ALL_NODES
+        children = []
+        for node in self.nodes:
+            if isinstance(self.container, dict):
+                child = node.keys.get(self.key)
+                if child is not None:
+                    children.append(child)
+            else:
+                for index, child in node.indexes.items():
+                    # negative indexes are only resolved once the length is
+                    # known, so every element is kept for them
+                    if index == self.index or index < 0:
+                        children.append(child)
+            if node.iterate is not None:
+                children.append(node.iterate)
+        return children
+
+
+_ALL_NODES = [_ALL]
+
+
+class StreamProjector:
+    """
+    Incrementally parse a JSON document, keeping only what selectors need.
+
+    Feed the raw body in chunks, then call close() to get a projection of the
+    document: objects and arrays on the paths of the selectors keep their
+    type, subtrees selected by a path are kept whole, and everything else is
+    dropped (array elements before a selected index are replaced by null to
+    keep positions). Evaluating the same paths with selector.evaluate_path on
+    the projection gives the same result as on the full document, while
+    memory only grows with the selected data.
+
+    Requires ijson.
+    """
+
+    def __init__(self, paths: Sequence[Tuple[PathStep, ...]]):
+        if ijson is None:
+            raise ImportError("Streaming responses requires ijson to be installed.")
+        self._root = _build_trie(paths)
+        self._stack: List[_Frame] = []
+        self._skip_depth = 0
+        self._document = None
+        self._events = ijson.sendable_list()
+        self._parser = ijson.basic_parse_coro(self._events)
+
+    def feed(self, chunk: bytes):
+        self._parser.send(chunk)
+        self._process_events()
+
+    def close(self) -> Any:
+        self._parser.close()
+        self._process_events()
+        return self._document
+
+    def _process_events(self):
+        for event, value in self._events:
+            self._event(event, value)
+        del self._events[:]
+
+    def _event(self, event: str, value: Any):
+        if self._skip_depth:
+            if event in ("start_map", "start_array"):
+                self._skip_depth += 1
+            elif event in ("end_map", "end_array"):
+                self._skip_depth -= 1
+                if not self._skip_depth:
+                    self._emit(_SKIPPED)
+            return
+
+        if self._stack:
+            frame = self._stack[-1]
+            if event == "map_key":
+                frame.key = value
+                return
+            if event in ("end_map", "end_array"):
+                self._stack.pop()
+                self._emit(frame.container)
+                return
+            nodes = frame.child_nodes()
+        else:
+            nodes = [self._root]
+
+        if not nodes:
+            if event in ("start_map", "start_array"):
+                self._skip_depth = 1
+            else:
+                self._emit(_SKIPPED)
+        elif event == "start_map":
+            self._stack.append(_Frame({}, _ALL_NODES if _keep_all(nodes) else nodes))
+        elif event == "start_array":
+            self._stack.append(_Frame([], _ALL_NODES if _keep_all(nodes) else nodes))
+        elif isinstance(value, Decimal):
+            self._emit(float(value))
+        else:
+            self._emit(value)
+
+    def _emit(self, value: Any):
+        if not self._stack:
+            self._document = None if value is _SKIPPED else value
+            return
+        frame = self._stack[-1]
+        if isinstance(frame.container, dict):
+            if value is not _SKIPPED:
+                frame.container[frame.key] = value
+        else:
+            if value is not _SKIPPED:
+                frame.container.append(value)
+            elif frame.index <= frame.keep_until:
+                frame.container.append(None)
+            frame.index += 1
+
+
+def _keep_all(nodes: List[_Node]) -> bool:
+    return nodes is _ALL_NODES or any(node.terminal for node in nodes)
+
+
+def project_stream(
+    chunks: Iterable[bytes], paths: Sequence[Tuple[PathStep, ...]]
+) -> Any:
+    """Project a document read from an iterable of byte chunks."""
+    projector = StreamProjector(paths)
+    for chunk in chunks:
+        projector.feed(chunk)
+    return projector.close()
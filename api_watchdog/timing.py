@@ -0,0 +1,197 @@
+import contextlib
+import threading
+import time
+from typing import Iterator, Optional, Sequence
+
+from requests.adapters import HTTPAdapter
+from urllib3 import poolmanager
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from api_watchdog.core import Timings
+
+# phases of the request being sent by each thread
+_local = threading.local()
+
+# phases each HTTP client cannot tell apart from connect
+REQUESTS_UNMEASURED = ("dns",)
+AIOHTTP_UNMEASURED = ("tls",)
+
+
+class Phases:
+    """
+    Timing of the phases of a single request, with time.perf_counter.
+
+    dns, connect and tls accumulate durations as they are reported by the
+    HTTP client; headers is the moment the response headers arrived and end
+    the moment the body was read. unmeasured are the phases the HTTP client
+    does not report, rather than ones that did not happen.
+    """
+
+    def __init__(self, unmeasured: Sequence[str] = ()):
+        self.unmeasured = list(unmeasured)
+        self.start = time.perf_counter()
+        self.dns: Optional[float] = None
+        self.connect: Optional[float] = None
+        self.tls: Optional[float] = None
+        self.headers: Optional[float] = None
+        self.end: Optional[float] = None
+
+    def add(self, phase: str, seconds: float):
+        setattr(self, phase, (getattr(self, phase) or 0.0) + seconds)
+
+    def mark_headers(self):
+        # after a redirect, the last response counts
+        self.headers = time.perf_counter()
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    def timings(self) -> Timings:
+        ttfb = download = None
+        if self.headers is not None:
+            connecting = (self.dns or 0.0) + (self.connect or 0.0) + (self.tls or 0.0)
+            ttfb = max(self.headers - self.start - connecting, 0.0)
+            download = (self.end or self.headers) - self.headers
+        return Timings(
+            dns=self.dns,
+            connect=self.connect,
+            tls=self.tls,
+            ttfb=ttfb,
+            download=download,
+            unmeasured=self.unmeasured,
+        )
+
+
+@contextlib.contextmanager
+def recording() -> Iterator[Phases]:
+    """Record the phases of the request sent by this thread."""
+    phases = Phases(REQUESTS_UNMEASURED)
+    _local.phases = phases
+    try:
+        yield phases
+    finally:
+        _local.phases = None
+        phases.finish()
+
+
+def _record(phase: str, seconds: float):
+    phases = getattr(_local, "phases", None)
+    if phases is not None:
+        phases.add(phase, seconds)
+
+
+@contextlib.contextmanager
+def measure(timings: Timings, phase: str) -> Iterator[None]:
+    """Add the time spent in the block to a phase of timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(
+            timings,
+            phase,
+            (getattr(timings, phase) or 0.0) + time.perf_counter() - start,
+        )
+
+
+class _TimedConnect:
+    # the resolution of the host is part of opening the socket in urllib3,
+    # so connect includes DNS for the requests engine
+    def _new_conn(self):
+        start = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            self._connect_time = time.perf_counter() - start
+            _record("connect", self._connect_time)
+
+
+class TimedHTTPConnection(_TimedConnect, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnect, HTTPSConnection):
+    def connect(self):
+        self._connect_time = 0.0
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _record("tls", time.perf_counter() - start - self._connect_time)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+TIMED_POOL_CLASSES = {
+    "http": TimedHTTPConnectionPool,
+    "https": TimedHTTPSConnectionPool,
+}
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose new connections report how long they took to open."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = TIMED_POOL_CLASSES
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        # SOCKS proxies come with connection classes of their own
+        if manager.pool_classes_by_scheme is poolmanager.pool_classes_by_scheme:
+            manager.pool_classes_by_scheme = TIMED_POOL_CLASSES
+        return manager
+
+
+def record_headers(response, *args, **kwargs):
+    """requests response hook, called once the response headers are read."""
+    phases = getattr(_local, "phases", None)
+    if phases is not None:
+        phases.mark_headers()
+    return response
+
+
+def trace_config() -> "aiohttp.TraceConfig":
+    """
+    aiohttp tracing that fills the Phases passed as trace_request_ctx. The
+    TLS handshake is part of opening the connection, so tls is not set and
+    connect includes it.
+    """
+    config = aiohttp.TraceConfig()
+
+    async def on_dns_start(session, context, params):
+        context.dns_start = time.perf_counter()
+
+    async def on_dns_end(session, context, params):
+        context.trace_request_ctx.add("dns", time.perf_counter() - context.dns_start)
+
+    async def on_connect_start(session, context, params):
+        context.connect_start = time.perf_counter()
+        context.dns_before = context.trace_request_ctx.dns or 0.0
+
+    async def on_connect_end(session, context, params):
+        phases = context.trace_request_ctx
+        resolving = (phases.dns or 0.0) - context.dns_before
+        phases.add("connect", time.perf_counter() - context.connect_start - resolving)
+
+    async def on_request_end(session, context, params):
+        context.trace_request_ctx.mark_headers()
+
+    config.on_dns_resolvehost_start.append(on_dns_start)
+    config.on_dns_resolvehost_end.append(on_dns_end)
+    config.on_connection_create_start.append(on_connect_start)
+    config.on_connection_create_end.append(on_connect_end)
+    config.on_request_end.append(on_request_end)
+    return config
@@ -1,6 +1,16 @@
+import functools
+import hashlib
+import json
+import threading
+from collections import OrderedDict
 from enum import Enum
-from typing import Any
-from pydantic import ValidationError as PydanticValidationError
+from typing import Any, NamedTuple, Optional
+from pydantic import BaseModel, ValidationError as PydanticValidationError
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
 
 from api_watchdog.integrations import trapi
 
@@ -101,12 +111,231 @@ validation_registry = {
 }
 
 
+class ValidationBackend(Enum):
+    """
+    How trapi.* values are validated.
+
+    pydantic: build the reasoner_pydantic model with parse_obj.
+    schema: check the raw data against the model's JSON Schema, compiled once
+    with fastjsonschema, and only build the model when an equality comparison
+    needs it (see LazyModel).
+    """
+    Pydantic = "pydantic"
+    Schema = "schema"
+
+
+_validation_backend = ValidationBackend.Pydantic
+
+
+def set_validation_backend(backend: ValidationBackend):
+    """Select the backend used by every subsequent validate() call."""
+    global _validation_backend
+    backend = ValidationBackend(backend)
+    if backend is ValidationBackend.Schema and fastjsonschema is None:
+        raise ImportError(
+            "The schema validation backend requires fastjsonschema to be installed."
+        )
+    _validation_backend = backend
+
+
+def validation_backend() -> ValidationBackend:
+    return _validation_backend
+
+
+def _json_schema(schema: Any) -> Any:
+    """
+    Translate the OpenAPI style "nullable" markers that reasoner_pydantic puts
+    in its schemas into plain JSON Schema.
+    """
+    if isinstance(schema, list):
+        return [_json_schema(s) for s in schema]
+    if not isinstance(schema, dict):
+        return schema
+    schema = {k: _json_schema(v) for k, v in schema.items()}
+    if schema.pop("nullable", False):
+        return {"anyOf": [{"type": "null"}, schema]}
+    return schema
+
+
+@functools.lru_cache(maxsize=None)
+def compile_schema(cls) -> Optional[Any]:
+    """
+    Compile the JSON Schema of a TRAPI model class into a validator function.
+
+    Returns None for classes that do not describe a JSON object, which are
+    always validated by pydantic.
+    """
+    if not (isinstance(cls, type) and issubclass(cls, BaseModel)):
+        return None
+    schema = cls.schema()
+    if schema.get("type") != "object":
+        return None
+    return fastjsonschema.compile(_json_schema(schema))
+
+
+class LazyModel(dict):
+    """
+    A JSON object that passed schema validation for a TRAPI model class.
+
+    It behaves as the raw dict (and serializes as one), and compares equal to
+    an instance of the model, or another LazyModel, exactly as the model would.
+    The model is only built when the raw data alone cannot decide equality:
+    identical raw data always builds equal models.
+    """
+
+    def __init__(self, data: dict, model_class):
+        super().__init__(data)
+        self.model_class = model_class
+        self._model = None
+
+    def model(self):
+        if self._model is None:
+            self._model = self.model_class.parse_obj(dict(self))
+        return self._model
+
+    def __eq__(self, other):
+        if isinstance(other, LazyModel) and dict.__eq__(self, other):
+            return True
+        try:
+            if isinstance(other, LazyModel):
+                other = other.model()
+            return self.model() == other
+        except PydanticValidationError:
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        # reasoner_pydantic models compare by hash
+        try:
+            return hash(self.model())
+        except PydanticValidationError:
+            return id(self)
+
+
+def _validate_schema(x: Any, cls, validation_type: "ValidationType"):
+    validator = compile_schema(cls)
+    if validator is None:
+        return cls.parse_obj(x)
+    try:
+        validator(x)
+    except fastjsonschema.JsonSchemaException as e:
+        raise ValidationError(f"{x} is not a valid {validation_type}: {e.message}") from e
+    return LazyModel(x, cls)
+
+
+class ValidationCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class ValidationCache:
+    """
+    Bounded LRU memo of validate() results.
+
+    Entries are keyed by (validation_type, validation backend, hash of the
+    canonical JSON of the object), so validating a structure identical to one seen before costs one
+    serialization and hash instead of rebuilding the model. Failed validations
+    are remembered too. Cached objects are shared between callers and must
+    not be mutated.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def info(self) -> ValidationCacheInfo:
+        return ValidationCacheInfo(
+            self.hits, self.misses, self.maxsize, len(self._entries)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    @staticmethod
+    def key(x: Any, validation_type: "ValidationType") -> Optional[tuple]:
+        """Cache key for an object, or None if it is not plain JSON data."""
+        try:
+            canonical = json.dumps(
+                x, sort_keys=True, separators=(",", ":"), allow_nan=True
+            )
+        except (TypeError, ValueError):
+            return None
+        digest = hashlib.blake2b(canonical.encode(), digest_size=16).digest()
+        # the backends build different objects for the same trapi.* data
+        return (validation_type, _validation_backend, digest)
+
+    def validate(self, x: Any, validation_type: "ValidationType"):
+        key = self.key(x, validation_type)
+        if key is None:
+            return _validate(x, validation_type)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is None:
+            try:
+                entry = (True, _validate(x, validation_type))
+            except ValidationError as e:
+                entry = (False, str(e))
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+        valid, value = entry
+        if not valid:
+            raise ValidationError(value)
+        return value
+
+
+_validation_cache: Optional[ValidationCache] = None
+
+
+def enable_validation_cache(maxsize: int = 4096) -> ValidationCache:
+    """Memoize every subsequent validate() call in this process."""
+    global _validation_cache
+    _validation_cache = ValidationCache(maxsize)
+    return _validation_cache
+
+
+def disable_validation_cache():
+    global _validation_cache
+    _validation_cache = None
+
+
+def validation_cache() -> Optional[ValidationCache]:
+    """The active validation cache, if any."""
+    return _validation_cache
+
+
 def validate(x: Any, validation_type: ValidationType):
     """
     Convert object into corresponding type.
 
-    Raises ValidationError if the object fails to validate
+    Raises ValidationError if the object fails to validate.
+    Results are memoized when a validation cache is enabled.
     """
+    cache = _validation_cache
+    if cache is not None:
+        return cache.validate(x, validation_type)
+    return _validate(x, validation_type)
+
+
+def _validate(x: Any, validation_type: ValidationType):
     try:
         cls = validation_registry[validation_type]
     except KeyError as e:
@@ -114,6 +343,8 @@ def validate(x: Any, validation_type: ValidationType):
 
     try:
         if trapi.istrapi(cls):
+            if _validation_backend is ValidationBackend.Schema:
+                return _validate_schema(x, cls, validation_type)
             return cls.parse_obj(x)
         else:
             return cls(x) if x is not None else None
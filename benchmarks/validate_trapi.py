@@ -0,0 +1,96 @@
+"""
+Compare the pydantic and schema validation backends on a synthetic TRAPI
+response.
+
+    python -m benchmarks.validate_trapi --nodes 5000 --repeat 5
+"""
+from argparse import ArgumentParser
+import copy
+import timeit
+
+from api_watchdog.validate import (
+    compile_schema,
+    set_validation_backend,
+    validate,
+    validation_registry,
+    ValidationBackend,
+    ValidationType,
+)
+
+
+def make_response(n_nodes: int) -> dict:
+    nodes = {
+        f"MONDO:{i:07d}": {
+            "name": f"disease {i}",
+            "categories": ["biolink:Disease"],
+            "attributes": [
+                {"attribute_type_id": "biolink:synonym", "value": [f"d{i}"]}
+            ],
+        }
+        for i in range(n_nodes)
+    }
+    edges = {
+        f"e{i}": {
+            "subject": f"MONDO:{i:07d}",
+            "object": f"MONDO:{i + 1:07d}",
+            "predicate": "biolink:related_to",
+            "sources": [
+                {
+                    "resource_id": "infores:example",
+                    "resource_role": "primary_knowledge_source",
+                }
+            ],
+        }
+        for i in range(n_nodes - 1)
+    }
+    results = [
+        {
+            "node_bindings": {"n0": [{"id": f"MONDO:{i:07d}"}]},
+            "analyses": [
+                {
+                    "resource_id": "infores:example",
+                    "edge_bindings": {"e0": [{"id": f"e{i}"}]},
+                }
+            ],
+        }
+        for i in range(n_nodes - 1)
+    ]
+    return {
+        "message": {
+            "knowledge_graph": {"nodes": nodes, "edges": edges},
+            "results": results,
+        }
+    }
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    response = make_response(args.nodes)
+    compile_schema(validation_registry[ValidationType.TrapiResponse])
+
+    for backend in ValidationBackend:
+        set_validation_backend(backend)
+        # as the value of an expectation would be
+        expected = validate(copy.deepcopy(response), ValidationType.TrapiResponse)
+        validate_only = min(timeit.repeat(
+            lambda: validate(response, ValidationType.TrapiResponse),
+            number=1,
+            repeat=args.repeat,
+        ))
+        compare = min(timeit.repeat(
+            lambda: validate(response, ValidationType.TrapiResponse) == expected,
+            number=1,
+            repeat=args.repeat,
+        ))
+        print(
+            f"{backend.value:<10} validate {validate_only:8.3f}s"
+            f"  validate + compare {compare:8.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+
+from api_watchdog.adaptive import AdaptiveConcurrency, AdaptiveSemaphore
+from api_watchdog.core import WatchdogTest
+from api_watchdog.runner import WatchdogRunner
+
+
+def observe_window(controller, latency, failed=False):
+    for _ in range(controller.limit):
+        controller.observe(latency, failed)
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def test_slow_start_then_additive_increase(self):
+        controller = AdaptiveConcurrency(maximum=64)
+        limits = []
+        for _ in range(4):
+            observe_window(controller, 0.1)
+            limits.append(controller.limit)
+        self.assertEqual(limits, [2, 4, 8, 16])
+
+        observe_window(controller, 0.1, failed=True)
+        self.assertEqual(controller.limit, 8)
+        observe_window(controller, 0.1)
+        self.assertEqual(controller.limit, 9)
+        self.assertEqual(
+            [d.limit for d in controller.decisions], [2, 4, 8, 16, 8, 9]
+        )
+        self.assertIn("failed", controller.decisions[4].reason)
+
+    def test_latency_increase(self):
+        controller = AdaptiveConcurrency(maximum=64, initial=8)
+        observe_window(controller, 0.1)
+        self.assertEqual(controller.limit, 16)
+        observe_window(controller, 0.15)
+        self.assertEqual(controller.limit, 32)
+        observe_window(controller, 0.3)
+        self.assertEqual(controller.limit, 16)
+        self.assertIn("baseline", controller.decisions[-1].reason)
+
+    def test_bounds(self):
+        controller = AdaptiveConcurrency(maximum=3, minimum=2)
+        self.assertEqual(controller.limit, 2)
+        observe_window(controller, 0.1)
+        self.assertEqual(controller.limit, 3)
+        observe_window(controller, 0.1)
+        self.assertEqual(controller.limit, 3)
+        observe_window(controller, 0.1, failed=True)
+        self.assertEqual(controller.limit, 2)
+
+    def test_failed(self):
+        self.assertTrue(AdaptiveConcurrency.failed(503, reached=True))
+        self.assertTrue(AdaptiveConcurrency.failed(408, reached=False))
+        self.assertFalse(AdaptiveConcurrency.failed(500, reached=True))
+
+
+class TestAdaptiveSemaphore(unittest.TestCase):
+    def test_follows_limit(self):
+        controller = AdaptiveConcurrency(maximum=8, initial=2)
+        in_flight = []
+        peak = []
+
+        async def request(semaphore):
+            async with semaphore:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+                await asyncio.sleep(0.01)
+                in_flight.pop()
+
+        async def run():
+            semaphore = AdaptiveSemaphore(controller)
+            await asyncio.gather(*(request(semaphore) for _ in range(10)))
+
+        asyncio.run(run())
+        self.assertEqual(max(peak), 2)
+
+
+class TestRunnerAdaptive(unittest.TestCase):
+    @patch("requests.Session.request")
+    def test_run_tests_adaptive(self, mock_request):
+        def get_response_mock(method, url=None, json=None, timeout=None):
+            mock = MagicMock()
+            mock.status_code = 200
+            mock.content = b"{}"
+            return mock
+
+        mock_request.side_effect = get_response_mock
+        tests = [
+            WatchdogTest(
+                name=f"test {i}",
+                target="http://a.com/",
+                payload={"i": i},
+                expectations=[],
+            )
+            for i in range(20)
+        ]
+        runner = WatchdogRunner(max_workers=4, adaptive=True)
+        results = list(runner.run_tests(tests))
+
+        self.assertTrue(all(r.success for r in results))
+        self.assertEqual(runner.concurrency.limit, 4)
+        self.assertEqual([d.limit for d in runner.concurrency.decisions], [2, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,354 @@
+import asyncio
+import os
+import threading
+import unittest
+from unittest.mock import patch
+
+from api_watchdog.core import (
+    Expectation,
+    MetricExpectation,
+    RateLimit,
+    RetryPolicy,
+    WatchdogTest,
+)
+from api_watchdog.result_error import ResultError
+from api_watchdog.validate import ValidationType
+
+AIOHTTP_SKIP_MESSAGE = "aiohttp not installed"
+try:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    from api_watchdog.async_runner import AsyncWatchdogRunner
+
+    AIOHTTP_ENABLED = True
+except ImportError:
+    AIOHTTP_ENABLED = False
+
+
+@unittest.skipIf(not AIOHTTP_ENABLED, AIOHTTP_SKIP_MESSAGE)
+class TestAsyncWatchdogRunner(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        async def xor(request):
+            body = await request.json()
+            return web.json_response(
+                {"magic_number": 0xFEEDFACE ^ int(body["magic_number"])}
+            )
+
+        async def missing(request):
+            return web.Response(status=404)
+
+        self.in_flight = self.peak = 0
+
+        async def hang(request):
+            await asyncio.sleep(10)
+            return web.json_response({})
+
+        async def slow(request):
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            return web.json_response({})
+
+        self.sent = []
+
+        async def flaky(request):
+            self.sent.append(asyncio.get_running_loop().time())
+            return web.json_response({}, status=503 if len(self.sent) < 4 else 200)
+
+        app = web.Application()
+        app.router.add_post("/xor", xor)
+        app.router.add_post("/missing", missing)
+        app.router.add_post("/slow", slow)
+        app.router.add_post("/hang", hang)
+        app.router.add_post("/flaky", flaky)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.addAsyncCleanup(self.server.close)
+
+    async def test_run_tests_async(self):
+        """Test run_tests_async returns correct success parameter for each test."""
+        tests = [
+            WatchdogTest(
+                name="Bad Coffee",
+                target=str(self.server.make_url("/xor")),
+                payload={"magic_number": 0xBADC0FFEE},
+                expectations=[
+                    Expectation(selector=".magic_number", value=-1, validation_type=ValidationType.Int)  # incorrect value
+                ]
+            ),
+            WatchdogTest(
+                name="Bad Food",
+                target=str(self.server.make_url("/xor")),
+                payload={"magic_number": 0xBADF00D},
+                expectations=[
+                    Expectation(selector=".magic_number", value=0xFEEDFACE ^ 0xBADF00D, validation_type=ValidationType.Int)
+                ]
+            ),
+            WatchdogTest(
+                name="Missing",
+                target=str(self.server.make_url("/missing")),
+                payload={"magic_number": 0},
+                expectations=[
+                    Expectation(selector=".magic_number", value=0, validation_type=ValidationType.Int)
+                ]
+            ),
+        ]
+
+        runner = AsyncWatchdogRunner(max_in_flight=2)
+        results = await runner.run_tests_async(tests)
+
+        self.assertEqual([r.test_name for r in results], ["Bad Coffee", "Bad Food", "Missing"])
+        self.assertFalse(results[0].success)
+        self.assertTrue(results[1].success)
+        self.assertFalse(results[2].success)
+        self.assertEqual(results[2].results[0].result, ResultError.NotFound)
+
+    async def test_run_tests_async_coalesce(self):
+        """Test that identical requests share a response and keep test order."""
+        tests = [
+            WatchdogTest(
+                name=name,
+                target=str(self.server.make_url("/xor")),
+                payload={"magic_number": 0xBADF00D},
+                expectations=[
+                    Expectation(selector=".magic_number", value=value, validation_type=ValidationType.Int)
+                ]
+            )
+            for name, value in [("right", 0xFEEDFACE ^ 0xBADF00D), ("wrong", 0)]
+        ]
+
+        runner = AsyncWatchdogRunner(coalesce=True)
+        results = await runner.run_tests_async(tests)
+
+        self.assertEqual([r.test_name for r in results], ["right", "wrong"])
+        self.assertEqual([r.success for r in results], [True, False])
+        self.assertEqual(results[0].shared_request, results[1].shared_request)
+        self.assertIsNotNone(results[0].shared_request)
+
+
+    async def test_run_tests_async_host_concurrency(self):
+        """Test that the host concurrency cap holds for the async engine."""
+        tests = [
+            WatchdogTest(
+                name=str(n),
+                target=str(self.server.make_url("/slow")),
+                payload={"n": n},
+                expectations=[],
+            )
+            for n in range(8)
+        ]
+
+        runner = AsyncWatchdogRunner(rate_limit=RateLimit(max_concurrency=2))
+        results = await runner.run_tests_async(tests)
+
+        self.assertTrue(all(r.success for r in results))
+        self.assertEqual(self.peak, 2)
+
+
+    async def test_run_tests_async_retry_rate_limit(self):
+        """Test that every retry waits for a token of the host."""
+        tests = [
+            WatchdogTest(
+                name="flaky",
+                target=str(self.server.make_url("/flaky")),
+                payload={},
+                retry=RetryPolicy(max_attempts=4, backoff=0.001, jitter=False),
+                rate_limit=RateLimit(requests_per_second=10),
+                expectations=[],
+            )
+        ]
+
+        (result,) = await AsyncWatchdogRunner().run_tests_async(tests)
+
+        self.assertTrue(result.success)
+        self.assertEqual(len(result.attempts), 4)
+        for previous, attempt in zip(self.sent, self.sent[1:]):
+            self.assertGreaterEqual(attempt - previous, 0.09)
+
+    async def test_run_tests_async_breaker(self):
+        """Test that requests queued behind an unreachable host are skipped."""
+        tests = [
+            WatchdogTest(
+                name=str(n),
+                target="http://127.0.0.1:1/",
+                payload={"n": n},
+                expectations=[],
+            )
+            for n in range(5)
+        ]
+
+        runner = AsyncWatchdogRunner(
+            max_in_flight=1, breaker_threshold=2, breaker_reset=60
+        )
+        results = await runner.run_tests_async(tests)
+
+        self.assertEqual(
+            [r.skipped for r in results],
+            [None, None, "host unavailable", "host unavailable", "host unavailable"],
+        )
+        self.assertFalse(any(r.success for r in results))
+
+    async def test_run_tests_async_breaker_probe_cancelled(self):
+        """Test that a probe cancelled at the deadline does not block its host."""
+        test = WatchdogTest(
+            name="probe",
+            target=str(self.server.make_url("/hang")),
+            payload={},
+            expectations=[],
+        )
+        runner = AsyncWatchdogRunner(breaker_threshold=1, breaker_reset=0, deadline=0.2)
+        key = runner._limit_key(test)
+        runner._breaker.record(key, reached=False)
+
+        (result,) = await runner.run_tests_async([test])
+
+        self.assertIsNone(result.skipped)
+        self.assertTrue(runner._breaker.allow(key))
+
+    async def test_run_tests_async_deadline(self):
+        """Test that requests still in flight at the deadline are aborted."""
+        tests = [
+            WatchdogTest(
+                name=path,
+                target=str(self.server.make_url(path)),
+                payload={},
+                expectations=[
+                    Expectation(selector=".", value={}, validation_type=ValidationType.Object)
+                ],
+            )
+            for path in ("/slow", "/hang")
+        ]
+
+        runner = AsyncWatchdogRunner(deadline=0.5)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        done, hung = await runner.run_tests_async(tests)
+
+        self.assertLess(loop.time() - start, 2)
+        self.assertTrue(done.success)
+        self.assertFalse(hung.success)
+        self.assertEqual(hung.results[0].result, ResultError.RequestTimeout)
+
+    async def test_run_tests_async_timings(self):
+        """Test that the phases of a request are timed."""
+        tests = [
+            WatchdogTest(
+                name="Bad Food",
+                target=str(self.server.make_url("/xor")),
+                payload={"magic_number": 0xBADF00D},
+                expectations=[
+                    Expectation(selector=".magic_number", value=0xFEEDFACE ^ 0xBADF00D, validation_type=ValidationType.Int)
+                ]
+            )
+        ]
+
+        (result,) = await AsyncWatchdogRunner().run_tests_async(tests)
+
+        timings = result.timings
+        for phase in ("connect", "ttfb", "download", "parse", "select", "validation"):
+            self.assertIsNotNone(getattr(timings, phase), phase)
+        # aiohttp reports the TLS handshake as part of connect
+        self.assertEqual(timings.unmeasured, ["tls"])
+        self.assertLessEqual(timings.connect + timings.ttfb + timings.download, result.latency)
+
+    async def test_run_tests_async_unmeasured_metric(self):
+        """Test that a threshold on tls, folded into connect, is refused."""
+        test = WatchdogTest(
+            name="tls",
+            target=str(self.server.make_url("/xor")),
+            payload={"magic_number": 0},
+            expectations=[],
+            metric_expectations=[MetricExpectation(metric="tls", max="10ms")],
+        )
+
+        with self.assertRaisesRegex(ValueError, "tls is not measured"):
+            await AsyncWatchdogRunner().run_tests_async([test])
+
+    async def test_run_tests_async_warm_up(self):
+        """Test that tests run on the connections opened by the warm-up."""
+        tests = [
+            WatchdogTest(
+                name=str(n),
+                target=str(self.server.make_url("/slow")),
+                payload={"n": n},
+                expectations=[],
+            )
+            for n in range(3)
+        ]
+
+        runner = AsyncWatchdogRunner(
+            warm_up=True, rate_limit=RateLimit(max_concurrency=2)
+        )
+        results = await runner.run_tests_async(tests)
+
+        (warm_up,) = runner.warm_ups
+        self.assertEqual(warm_up.connections, 2)
+        self.assertIsNone(warm_up.error)
+        self.assertIsNotNone(warm_up.timings.connect)
+        self.assertTrue(all(r.success for r in results))
+        self.assertTrue(all(r.timings.connect is None for r in results))
+
+    async def test_run_tests_async_env_proxy(self):
+        """Test that HTTP_PROXY is used, for the warm-up and the requests."""
+        proxy = str(self.server.make_url("/"))
+        environ = {
+            "HTTP_PROXY": proxy,
+            "http_proxy": proxy,
+            "NO_PROXY": "",
+            "no_proxy": "",
+        }
+        tests = [
+            WatchdogTest(
+                name="proxied",
+                target="http://watchdog.invalid/slow",
+                payload={},
+                expectations=[],
+            )
+        ]
+
+        with patch.dict(os.environ, environ):
+            runner = AsyncWatchdogRunner(warm_up=True)
+            (result,) = await runner.run_tests_async(tests)
+
+        (warm_up,) = runner.warm_ups
+        self.assertIsNone(warm_up.error)
+        self.assertTrue(result.success)
+        # the request went over the connection opened by the warm-up
+        self.assertIsNone(result.timings.connect)
+
+    async def test_run_tests_async_evaluate_off_loop(self):
+        """Test that expectations are not evaluated on the event loop thread."""
+        tests = [
+            WatchdogTest(
+                name="Bad Coffee",
+                target=str(self.server.make_url("/xor")),
+                payload={"magic_number": 0xBADC0FFEE},
+                expectations=[
+                    Expectation(
+                        selector=".magic_number",
+                        value=0xBADC0FFEE ^ 0xFEEDFACE,
+                        validation_type=ValidationType.Int,
+                    )
+                ],
+            )
+        ]
+        runner = AsyncWatchdogRunner()
+        evaluate = runner._evaluate
+        threads = []
+
+        def record_thread(*args):
+            threads.append(threading.get_ident())
+            return evaluate(*args)
+
+        with patch.object(runner, "_evaluate", record_thread):
+            (result,) = await runner.run_tests_async(tests)
+
+        self.assertTrue(result.success)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from json import dumps
+from unittest.mock import MagicMock, patch
+
+from api_watchdog.bench import Bench
+from api_watchdog.core import Expectation, WatchdogTest
+from api_watchdog.runner import WatchdogRunner
+from api_watchdog.validate import ValidationType
+
+
+def make_test(name, target, value):
+    return WatchdogTest(
+        name=name,
+        target=target,
+        payload={"val": value},
+        expectations=[
+            Expectation(selector=".val", value=value, validation_type=ValidationType.Int)
+        ],
+    )
+
+
+def get_response_mock(method, url=None, json=None, timeout=None):
+    mock = MagicMock()
+    mock.status_code = 503 if "down" in url else 200
+    mock.content = dumps({"val": json["val"]}).encode()
+    return mock
+
+
+@patch("requests.Session.request")
+class TestBench(unittest.TestCase):
+    def test_iterations(self, mock_request):
+        mock_request.side_effect = get_response_mock
+        tests = [
+            make_test("1", "http://a.com/", 1),
+            make_test("2", "http://a.com/b", 2),
+            make_test("down", "http://b.com/down", 3),
+        ]
+
+        report = Bench(
+            WatchdogRunner(), iterations=20, concurrency=4, sample_rate=0.25
+        ).run(tests)
+
+        self.assertEqual(mock_request.call_count, 60)
+        self.assertEqual(report.stats.requests, 60)
+        self.assertEqual(report.stats.errors, 20)
+        self.assertEqual(report.stats.checked, 15)
+        self.assertEqual(report.stats.failed, 5)
+        # grouped like collect_results groups results
+        self.assertEqual(
+            [g.name for g in report.groups], ["http://a.com", "http://b.com/down"]
+        )
+        host_a = report.groups[0]
+        self.assertEqual(host_a.stats.requests, 40)
+        self.assertEqual(host_a.stats.errors, 0)
+        self.assertEqual([t.name for t in host_a.tests], ["1"])
+        self.assertEqual(
+            [(g.name, [t.name for t in g.tests]) for g in host_a.groups],
+            [("http://a.com/b", ["2"])],
+        )
+        test_stats = host_a.tests[0]
+        self.assertEqual(test_stats.requests, 20)
+        self.assertEqual(test_stats.checked, 5)
+        self.assertLessEqual(test_stats.p50, test_stats.p90)
+        self.assertLessEqual(test_stats.p99, test_stats.max)
+        self.assertGreater(test_stats.throughput, 0)
+
+    def test_rps(self, mock_request):
+        mock_request.side_effect = get_response_mock
+        tests = [make_test("1", "http://a.com/x", 1)]
+
+        report = Bench(WatchdogRunner(), iterations=6, rps=20).run(tests)
+
+        self.assertEqual(report.stats.requests, 6)
+        # a token every 50 ms after the first
+        self.assertGreaterEqual(report.duration, 0.25)
+
+    def test_duration(self, mock_request):
+        mock_request.side_effect = get_response_mock
+        tests = [make_test("1", "http://a.com/x", 1)]
+
+        report = Bench(WatchdogRunner(), duration=0.2, rps=50, sample_rate=0).run(tests)
+
+        self.assertGreater(report.stats.requests, 1)
+        self.assertEqual(report.stats.checked, 0)
+        self.assertGreaterEqual(report.duration, 0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from unittest.mock import patch
+
+from api_watchdog.breaker import CircuitBreaker
+
+
+@patch("time.monotonic")
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self, monotonic):
+        monotonic.return_value = 0.0
+        breaker = CircuitBreaker(threshold=2, reset_timeout=10)
+        breaker.record("a", reached=False)
+        breaker.record("a", reached=True)
+        breaker.record("a", reached=False)
+        self.assertTrue(breaker.allow("a"))
+
+        breaker.record("a", reached=False)
+        self.assertTrue(breaker.is_open("a"))
+        self.assertFalse(breaker.allow("a"))
+        self.assertTrue(breaker.allow("b"))
+
+    def test_half_open_probe(self, monotonic):
+        monotonic.return_value = 0.0
+        breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+        breaker.record("a", reached=False)
+
+        monotonic.return_value = 10.0
+        self.assertTrue(breaker.allow("a"))
+        # only one probe at a time
+        self.assertFalse(breaker.allow("a"))
+        breaker.record("a", reached=False)
+        self.assertFalse(breaker.allow("a"))
+
+        monotonic.return_value = 20.0
+        self.assertTrue(breaker.allow("a"))
+        breaker.record("a", reached=True)
+        self.assertFalse(breaker.is_open("a"))
+        self.assertTrue(breaker.allow("a"))
+        self.assertTrue(breaker.allow("a"))
+
+    def test_release_cancelled_probe(self, monotonic):
+        monotonic.return_value = 0.0
+        breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+        breaker.record("a", reached=False)
+
+        monotonic.return_value = 10.0
+        self.assertTrue(breaker.allow("a"))
+        # the probe was cancelled before it had an outcome
+        breaker.release("a")
+        self.assertTrue(breaker.allow("a"))
+        self.assertTrue(breaker.is_open("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
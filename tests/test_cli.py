@@ -2,11 +2,14 @@ import io
 import os
 from pathlib import Path
 import json
+from json import dumps
 import shutil
 import unittest
 from unittest.mock import patch, MagicMock, mock_open
 
-from api_watchdog.cli import discover
+from api_watchdog.cli import bench, cli, discover, merge
+from api_watchdog.collect import WatchdogResultGroup, collect_results
+from api_watchdog.core import WatchdogResult
 
 
 class TestCli(unittest.TestCase):
@@ -69,8 +72,9 @@ class TestCli(unittest.TestCase):
         )
 
     @patch("time.time", MagicMock(return_value=0.0))
+    @patch("time.perf_counter", MagicMock(return_value=0.0))
     @patch("builtins.open", new_callable=mock_open)
-    @patch("requests.request")
+    @patch("requests.Session.request")
     def test_discover_write_to_file(self, mock_request, mock_stdout):
         """Test that discover finds finds and writes them to file."""
         def get_response_mock(method, url=None, json=None, timeout=120):
@@ -82,6 +86,7 @@ class TestCli(unittest.TestCase):
                 return {"val": json["val"] + 1}
 
             mock.json = mock_read
+            mock.content = dumps(mock_read()).encode()
             return mock
 
         mock_request.side_effect = get_response_mock
@@ -90,6 +95,35 @@ class TestCli(unittest.TestCase):
         mocked_args.pattern = "*.watchdog.json"
         mocked_args.output_path = "some/random/path.json"
         mocked_args.email = False
+        mocked_args.engine = "thread"
+        mocked_args.fast_path = False
+        mocked_args.stream = False
+        mocked_args.max_response_bytes = None
+        mocked_args.retain = "all"
+        mocked_args.retain_bytes = None
+        mocked_args.spill_directory = None
+        mocked_args.eval_workers = None
+        mocked_args.validation_cache = None
+        mocked_args.coalesce = False
+        mocked_args.max_workers = 16
+        mocked_args.host_concurrency = None
+        mocked_args.host_rps = None
+        mocked_args.host_burst = None
+        mocked_args.limit_per_proxy = False
+        mocked_args.max_attempts = 1
+        mocked_args.retry_backoff = 1.0
+        mocked_args.retry_max_backoff = 60.0
+        mocked_args.retry_budget = None
+        mocked_args.breaker_threshold = None
+        mocked_args.breaker_reset = 30.0
+        mocked_args.connect_timeout = 120.0
+        mocked_args.read_timeout = 120.0
+        mocked_args.deadline = None
+        mocked_args.history = None
+        mocked_args.adaptive_concurrency = False
+        mocked_args.warm_up = False
+        mocked_args.shard = None
+        mocked_args.validation_backend = "pydantic"
 
         discover(mocked_args)
 
@@ -106,6 +140,23 @@ class TestCli(unittest.TestCase):
                   "target": "http://a.com/",
                   "success": true,
                   "latency": 0.0,
+                  "response_bytes": 10,
+                  "shared_request": null,
+                  "attempts": null,
+                  "skipped": null,
+                  "timings": {
+                    "dns": null,
+                    "connect": null,
+                    "tls": null,
+                    "ttfb": null,
+                    "download": null,
+                    "parse": 0.0,
+                    "select": 0.0,
+                    "validation": 0.0,
+                    "unmeasured": [
+                      "dns"
+                    ]
+                  },
                   "timestamp": "1970-01-01T00:00:00+00:00",
                   "email_to": null,
                   "payload": {
@@ -114,6 +165,8 @@ class TestCli(unittest.TestCase):
                   "response": {
                     "val": 2
                   },
+                  "response_ref": null,
+                  "retention": null,
                   "results": [
                     {
                       "expectation": {
@@ -137,6 +190,23 @@ class TestCli(unittest.TestCase):
                       "target": "http://a.com/b",
                       "success": true,
                       "latency": 0.0,
+                      "response_bytes": 10,
+                      "shared_request": null,
+                      "attempts": null,
+                      "skipped": null,
+                      "timings": {
+                        "dns": null,
+                        "connect": null,
+                        "tls": null,
+                        "ttfb": null,
+                        "download": null,
+                        "parse": 0.0,
+                        "select": 0.0,
+                        "validation": 0.0,
+                        "unmeasured": [
+                          "dns"
+                        ]
+                      },
                       "timestamp": "1970-01-01T00:00:00+00:00",
                       "email_to": null,
                       "payload": {
@@ -145,6 +215,8 @@ class TestCli(unittest.TestCase):
                       "response": {
                         "val": 3
                       },
+                      "response_ref": null,
+                      "retention": null,
                       "results": [
                         {
                           "expectation": {
@@ -169,6 +241,23 @@ class TestCli(unittest.TestCase):
                       "target": "http://a.com/c",
                       "success": true,
                       "latency": 0.0,
+                      "response_bytes": 10,
+                      "shared_request": null,
+                      "attempts": null,
+                      "skipped": null,
+                      "timings": {
+                        "dns": null,
+                        "connect": null,
+                        "tls": null,
+                        "ttfb": null,
+                        "download": null,
+                        "parse": 0.0,
+                        "select": 0.0,
+                        "validation": 0.0,
+                        "unmeasured": [
+                          "dns"
+                        ]
+                      },
                       "timestamp": "1970-01-01T00:00:00+00:00",
                       "email_to": null,
                       "payload": {
@@ -177,6 +266,8 @@ class TestCli(unittest.TestCase):
                       "response": {
                         "val": 4
                       },
+                      "response_ref": null,
+                      "retention": null,
                       "results": [
                         {
                           "expectation": {
@@ -202,5 +293,103 @@ class TestCli(unittest.TestCase):
         self.assertEqual(json.loads(mock_stdout().write.mock_calls[0][1][0]), json.loads(expected))
 
 
+    @patch("builtins.open", new_callable=mock_open)
+    @patch("requests.Session.request")
+    def test_bench_write_to_file(self, mock_request, mock_stdout):
+        """Test that bench replays the selected tests and writes a report."""
+        def get_response_mock(method, url=None, json=None, timeout=120):
+            mock = MagicMock()
+            mock.status_code = 200
+            mock.content = dumps({"val": json["val"] + 1}).encode()
+            return mock
+
+        mock_request.side_effect = get_response_mock
+        mocked_args = MagicMock()
+        vars(mocked_args)["search-directory"] = self.base_path
+        mocked_args.pattern = "*.watchdog.json"
+        mocked_args.test = "[12]"
+        mocked_args.output_path = "some/random/path.json"
+        mocked_args.iterations = 5
+        mocked_args.duration = None
+        mocked_args.rps = None
+        mocked_args.concurrency = 2
+        mocked_args.sample_rate = 1.0
+        mocked_args.fast_path = False
+        mocked_args.connect_timeout = 120.0
+        mocked_args.read_timeout = 120.0
+
+        bench(mocked_args)
+
+        mock_stdout.assert_called_once_with("some/random/path.json", "w")
+        report = json.loads(mock_stdout().write.mock_calls[0][1][0])
+        self.assertEqual(mock_request.call_count, 10)
+        self.assertEqual(report["stats"]["requests"], 10)
+        self.assertEqual(report["stats"]["checked"], 10)
+        self.assertEqual(report["stats"]["failed"], 0)
+        (host,) = report["groups"]
+        self.assertEqual(host["name"], "http://a.com")
+        self.assertEqual([t["name"] for t in host["tests"]], ["1"])
+        self.assertEqual([g["name"] for g in host["groups"]], ["http://a.com/b"])
+
+    def test_discover_retention_settings(self):
+        """Test that truncate and spill retention need their settings."""
+        for retain, message in (
+            ("truncate", "--retain truncate requires --retain-bytes"),
+            ("spill", "--retain spill requires --spill-directory"),
+        ):
+            argv = ["api-watchdog", "discover", str(self.base_path), "--retain", retain]
+            with self.subTest(retain=retain), patch("sys.argv", argv), patch(
+                "sys.stderr", new_callable=io.StringIO
+            ) as stderr, patch("api_watchdog.cli.discover") as mock_discover:
+                with self.assertRaises(SystemExit):
+                    cli()
+                self.assertIn(message, stderr.getvalue())
+                mock_discover.assert_not_called()
+
+    def test_merge(self):
+        """Test that merge regroups the results of several files."""
+        def make_result(name, target):
+            return WatchdogResult(
+                test_name=name,
+                target=target,
+                success=True,
+                latency=0.0,
+                timestamp=0.0,
+                payload=None,
+                response=None,
+                results=[],
+            )
+
+        shards = [
+            [make_result("1", "http://a.com/"), make_result("3", "http://b.com/")],
+            [make_result("2", "http://a.com/b")],
+        ]
+        paths = []
+        for i, results in enumerate(shards):
+            path = self.base_path / f"shard{i}.json"
+            path.write_text(collect_results(results).json())
+            paths.append(path)
+
+        mocked_args = MagicMock()
+        mocked_args.results = paths
+        mocked_args.output_path = self.base_path / "merged.json"
+        mocked_args.email = False
+        with patch("api_watchdog.cli.ResultGroupHookMailgun") as mock_hook:
+            merge(mocked_args)
+            mock_hook.assert_not_called()
+
+            merged = WatchdogResultGroup.parse_file(mocked_args.output_path)
+            self.assertEqual(
+                merged,
+                collect_results([r for results in shards for r in results]),
+            )
+            self.assertEqual([g.name for g in merged.groups], ["http://a.com", "http://b.com"])
+            self.assertEqual([g.name for g in merged.groups[0].groups], ["http://a.com/b"])
+
+            mocked_args.email = True
+            merge(mocked_args)
+            mock_hook.return_value.assert_called_once_with(merged)
+
+
 if __name__ == "__main__":
     unittest.main()
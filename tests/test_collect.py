@@ -1,6 +1,6 @@
 import unittest
 
-from api_watchdog.collect import collect_results, WatchdogResultGroup
+from api_watchdog.collect import collect_results, flatten_results, WatchdogResultGroup
 from api_watchdog.core import WatchdogResult
 
 
@@ -199,6 +199,29 @@ class TestCollect(unittest.TestCase):
         )
         self.assertEqual(result_group, expectation)
 
+    def test_flatten_results(self):
+        results = [
+            WatchdogResult(
+                test_name=name,
+                target=target,
+                payload=None,
+                results=[],
+                success=True,
+                latency=0.0,
+                timestamp=0.0,
+                response=None,
+            )
+            for name, target in [
+                ("1", "http://a.com/"),
+                ("2", "http://a.com/b"),
+                ("3", "http://b.com/c"),
+            ]
+        ]
+        result_group = collect_results(results)
+
+        self.assertEqual(flatten_results(result_group), results)
+        self.assertEqual(collect_results(flatten_results(result_group)), result_group)
+
 
 if __name__ == "__main__":
     unittest.main()
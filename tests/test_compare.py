@@ -0,0 +1,111 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from api_watchdog.compare import compare_runs, sign_test
+from api_watchdog.core import WatchdogResult
+from api_watchdog.history import RunHistory
+
+
+def make_result(name, latency, target):
+    return WatchdogResult(
+        test_name=name,
+        target=target,
+        success=True,
+        latency=latency,
+        timestamp=0.0,
+        payload=None,
+        response=None,
+        results=[],
+    )
+
+
+class TestCompareRuns(unittest.TestCase):
+    def setUp(self):
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        self.history = RunHistory(directory / "history.sqlite")
+        self.addCleanup(self.history.close)
+
+    def record(self, latencies):
+        return self.history.record(
+            make_result(name, latency, target)
+            for (name, target), latency in latencies.items()
+        )
+
+    def baseline(self, runs=10):
+        for i in range(runs):
+            jitter = 0.01 * (i % 3)
+            self.record({
+                ("stable", "http://a.com/"): 1.0 + jitter,
+                ("slow", "http://a.com/"): 1.0 + jitter,
+                **{(f"b{n}", "http://b.com/"): 0.5 + jitter for n in range(6)},
+            })
+
+    def test_test_regression(self):
+        self.baseline()
+        run = self.record({
+            ("stable", "http://a.com/"): 1.02,
+            ("slow", "http://a.com/"): 2.0,
+            **{(f"b{n}", "http://b.com/"): 0.5 for n in range(6)},
+        })
+
+        comparison = compare_runs(self.history)
+
+        self.assertEqual(comparison.run, run)
+        self.assertEqual(len(comparison.baseline_runs), 10)
+        self.assertEqual([t.name for t in comparison.tests], ["slow"])
+        change = comparison.tests[0]
+        self.assertEqual(change.target, "http://a.com/")
+        self.assertAlmostEqual(change.baseline, 1.01)
+        self.assertAlmostEqual(change.change, 2.0 / 1.01 - 1)
+        self.assertGreater(change.significance, 3.0)
+        self.assertEqual(change.samples, 10)
+        # a single slower test does not make its host regress
+        self.assertEqual(comparison.groups, [])
+
+    def test_group_regression(self):
+        self.baseline()
+        # every test of the host is a little slower, none enough on its own
+        # to stand out from its noise
+        self.record({
+            ("stable", "http://a.com/"): 1.0,
+            ("slow", "http://a.com/"): 1.0,
+            **{(f"b{n}", "http://b.com/"): 0.5 + 0.1 + 0.02 * n for n in range(6)},
+        })
+
+        comparison = compare_runs(self.history, threshold=100.0)
+
+        self.assertEqual(comparison.tests, [])
+        self.assertEqual([g.name for g in comparison.groups], ["http://b.com"])
+        group = comparison.groups[0]
+        self.assertEqual(group.samples, 6)
+        self.assertAlmostEqual(group.significance, 1 / 64)
+        self.assertGreater(group.change, 0.2)
+
+    def test_earlier_run_and_min_samples(self):
+        self.baseline(runs=3)
+        regressed = self.record({("slow", "http://a.com/"): 5.0})
+        self.record({("slow", "http://a.com/"): 1.0})
+
+        self.assertEqual(compare_runs(self.history).tests, [])
+        self.assertEqual(compare_runs(self.history, run=regressed).tests, [])
+        comparison = compare_runs(self.history, run=regressed, min_samples=3)
+        self.assertEqual(comparison.run, regressed)
+        self.assertEqual([t.name for t in comparison.tests], ["slow"])
+
+    def test_no_runs(self):
+        with self.assertRaises(ValueError):
+            compare_runs(self.history)
+
+
+class TestSignTest(unittest.TestCase):
+    def test_sign_test(self):
+        self.assertEqual(sign_test(0, 4), 1.0)
+        self.assertEqual(sign_test(4, 4), 1 / 16)
+        self.assertEqual(sign_test(3, 4), 5 / 16)
+
+
+if __name__ == "__main__":
+    unittest.main()
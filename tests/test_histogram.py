@@ -0,0 +1,51 @@
+import unittest
+
+from api_watchdog.histogram import LatencyHistogram
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = LatencyHistogram(digits=2)
+        # 10 microseconds to 1 second
+        for n in range(1, 100001):
+            histogram.record(n / 1e5)
+
+        self.assertEqual(histogram.count, 100000)
+        self.assertEqual(histogram.max, 1.0)
+        for percentile in (50, 90, 99):
+            self.assertAlmostEqual(
+                histogram.percentile(percentile), percentile / 100, delta=percentile / 100 * 0.01
+            )
+        self.assertEqual(histogram.percentile(100), 1.0)
+        self.assertAlmostEqual(histogram.mean, 0.500005)
+        # memory depends on the range of latencies, not the number of samples
+        self.assertLess(len(histogram._counts), 2000)
+
+    def test_exact_small_values(self):
+        histogram = LatencyHistogram(digits=2)
+        for microseconds in (3, 5, 7, 150):
+            histogram.record(microseconds / 1e6)
+        self.assertEqual(histogram.percentile(50), 5e-6)
+        self.assertEqual(histogram.percentile(75), 7e-6)
+
+    def test_merge(self):
+        first, second = LatencyHistogram(), LatencyHistogram()
+        first.record(0.1)
+        second.record(0.3)
+        second.record(0.2)
+        first.merge(second)
+
+        self.assertEqual(first.count, 3)
+        self.assertEqual((first.min, first.max), (0.1, 0.3))
+        self.assertAlmostEqual(first.percentile(50), 0.2, delta=0.002)
+        with self.assertRaises(ValueError):
+            first.merge(LatencyHistogram(digits=3))
+
+    def test_empty(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.mean)
+
+
+if __name__ == "__main__":
+    unittest.main()
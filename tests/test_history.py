@@ -0,0 +1,144 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from api_watchdog.core import WatchdogResult, WatchdogTest
+from api_watchdog.history import LatencyHistory, RunHistory, predicted_makespan
+from api_watchdog.runner import WatchdogRunner
+
+
+def make_test(name, target="http://a.com/"):
+    return WatchdogTest(name=name, target=target, payload={"name": name}, expectations=[])
+
+
+def make_result(name, latency, target="http://a.com/", skipped=None):
+    return WatchdogResult(
+        test_name=name,
+        target=target,
+        success=True,
+        latency=latency,
+        timestamp=0.0,
+        payload=None,
+        response=None,
+        results=[],
+        skipped=skipped,
+    )
+
+
+class TestLatencyHistory(unittest.TestCase):
+    def setUp(self):
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = directory / "history.sqlite"
+        self.history = LatencyHistory(self.path, alpha=0.5)
+        self.addCleanup(self.history.close)
+
+    def test_moving_average(self):
+        self.history.record([make_result("x", 10.0)])
+        self.history.record([make_result("x", 20.0), make_result("y", 1.0, skipped="host unavailable")])
+        self.assertEqual(self.history.known(), {("x", "http://a.com/"): 15.0})
+
+        self.history.close()
+        with LatencyHistory(self.path) as reopened:
+            self.assertEqual(reopened.known(), {("x", "http://a.com/"): 15.0})
+
+    def test_fallbacks(self):
+        self.history.record([
+            make_result("a1", 10.0),
+            make_result("a2", 20.0),
+            make_result("b1", 1.0, target="http://b.com/"),
+        ])
+        expected = self.history.expected([
+            make_test("a1"),
+            make_test("new", target="http://a.com/other"),
+            make_test("new", target="http://c.com/"),
+        ])
+        self.assertEqual(expected, [10.0, 15.0, 10.0])
+
+    def test_empty(self):
+        self.assertEqual(self.history.expected([make_test("x")]), [0.0])
+
+
+class TestRunHistory(unittest.TestCase):
+    def setUp(self):
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = directory / "history.sqlite"
+        self.history = RunHistory(self.path)
+        self.addCleanup(self.history.close)
+
+    def test_record(self):
+        first = self.history.record([make_result("x", 1.0), make_result("y", 2.0)])
+        second = self.history.record([
+            make_result("x", 3.0),
+            make_result("y", 0.0, skipped="host unavailable"),
+        ])
+        third = self.history.record([make_result("x", 5.0, target="http://b.com/")])
+
+        self.assertEqual(self.history.runs(10), [first, second, third])
+        self.assertEqual(self.history.runs(2), [second, third])
+        self.assertEqual(self.history.runs(10, before=second), [first, second])
+        self.assertEqual(
+            self.history.latencies([first, second]),
+            {
+                ("x", "http://a.com/"): {first: 1.0, second: 3.0},
+                ("y", "http://a.com/"): {first: 2.0},
+            },
+        )
+
+        self.history.close()
+        with RunHistory(self.path) as reopened:
+            self.assertEqual(
+                reopened.latencies([third]), {("x", "http://b.com/"): {third: 5.0}}
+            )
+
+    def test_shared_with_latency_history(self):
+        with LatencyHistory(self.path) as latency_history:
+            latency_history.record([make_result("x", 1.0)])
+            self.history.record([make_result("x", 1.0)])
+            self.assertEqual(latency_history.known(), {("x", "http://a.com/"): 1.0})
+        self.assertEqual(len(self.history.runs(10)), 1)
+
+
+class TestPredictedMakespan(unittest.TestCase):
+    def test_longest_first_is_shorter(self):
+        self.assertEqual(predicted_makespan([1, 1, 1, 1, 4], workers=2), 6)
+        self.assertEqual(predicted_makespan([4, 1, 1, 1, 1], workers=2), 4)
+        self.assertEqual(predicted_makespan([], workers=2), 0)
+
+
+class TestRunnerHistory(unittest.TestCase):
+    @patch("requests.Session.request")
+    def test_longest_expected_first(self, mock_request):
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        history = LatencyHistory(directory / "history.sqlite")
+        self.addCleanup(history.close)
+        history.record([make_result("fast", 1.0), make_result("slow", 90.0)])
+
+        def get_response_mock(method, url=None, json=None, timeout=None):
+            mock = MagicMock()
+            mock.status_code = 200
+            mock.content = b"{}"
+            return mock
+
+        mock_request.side_effect = get_response_mock
+
+        tests = [make_test("fast"), make_test("new", target="http://b.com/"), make_test("slow")]
+        runner = WatchdogRunner(max_workers=1, history=history)
+        results = list(runner.run_tests(tests))
+
+        self.assertEqual([r.test_name for r in results], ["fast", "new", "slow"])
+        self.assertEqual(
+            [c.kwargs["json"]["name"] for c in mock_request.call_args_list],
+            ["slow", "new", "fast"],
+        )
+        self.assertEqual(runner.predicted_makespan, 136.5)
+        self.assertIsNotNone(runner.actual_makespan)
+        self.assertEqual(len(history.known()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
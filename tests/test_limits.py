@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import patch
+
+from api_watchdog.core import RateLimit
+from api_watchdog.limits import HostScheduler, TokenBucket, merge_limits
+
+
+class TestTokenBucket(unittest.TestCase):
+    @patch("time.monotonic")
+    def test_burst_then_rate(self, monotonic):
+        monotonic.return_value = 100.0
+        bucket = TokenBucket(rate=2, burst=3)
+        self.assertEqual([bucket.try_acquire() for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.try_acquire(), 0.5)
+
+        monotonic.return_value = 100.5
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertAlmostEqual(bucket.try_acquire(), 0.5)
+
+        # tokens do not accumulate beyond burst
+        monotonic.return_value = 200.0
+        self.assertEqual([bucket.try_acquire() for _ in range(3)], [0, 0, 0])
+        self.assertGreater(bucket.try_acquire(), 0)
+
+
+class TestMergeLimits(unittest.TestCase):
+    def test_strictest(self):
+        merged = merge_limits([
+            None,
+            RateLimit(max_concurrency=4),
+            RateLimit(max_concurrency=2, requests_per_second=10),
+            RateLimit(requests_per_second=5, burst=3),
+        ])
+        self.assertEqual(
+            merged, RateLimit(max_concurrency=2, requests_per_second=5, burst=3)
+        )
+        self.assertEqual(merge_limits([None]), RateLimit())
+
+    def test_rejects_invalid(self):
+        with self.assertRaises(ValueError):
+            RateLimit(max_concurrency=0)
+        with self.assertRaises(ValueError):
+            RateLimit(requests_per_second=0)
+
+
+class TestHostScheduler(unittest.TestCase):
+    def test_concurrency_cap_does_not_block_other_hosts(self):
+        scheduler = HostScheduler({"a": RateLimit(max_concurrency=1)})
+        for key, item in [("a", 1), ("a", 2), ("b", 3), ("b", 4)]:
+            scheduler.add(key, item)
+
+        self.assertEqual(scheduler.next(), (("a", 1), None))
+        self.assertEqual(scheduler.next(), (("b", 3), None))
+        self.assertEqual(scheduler.next(), (("b", 4), None))
+        self.assertEqual(scheduler.next(), (None, None))
+        self.assertEqual(scheduler.pending, 1)
+
+        scheduler.done("a")
+        self.assertEqual(scheduler.next(), (("a", 2), None))
+        self.assertEqual(scheduler.pending, 0)
+
+    @patch("time.monotonic")
+    def test_waits_for_tokens(self, monotonic):
+        monotonic.return_value = 0.0
+        scheduler = HostScheduler({"a": RateLimit(requests_per_second=4)})
+        scheduler.add("a", 1)
+        scheduler.add("a", 2)
+
+        self.assertEqual(scheduler.next(), (("a", 1), None))
+        item, delay = scheduler.next()
+        self.assertIsNone(item)
+        self.assertAlmostEqual(delay, 0.25)
+
+        monotonic.return_value = 0.25
+        self.assertEqual(scheduler.next(), (("a", 2), None))
+
+    @patch("time.monotonic")
+    def test_take_token(self, monotonic):
+        monotonic.return_value = 0.0
+        scheduler = HostScheduler({"a": RateLimit(requests_per_second=4)})
+        scheduler.add("a", 1)
+
+        self.assertEqual(scheduler.next(), (("a", 1), None))
+        # a retry of the item needs a token of its own
+        self.assertAlmostEqual(scheduler.take_token("a"), 0.25)
+        monotonic.return_value = 0.25
+        self.assertEqual(scheduler.take_token("a"), 0.0)
+        self.assertEqual(scheduler.take_token("b"), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from pydantic import ValidationError
+
+from api_watchdog.collect import collect_results, WatchdogResultGroup
+from api_watchdog.core import (
+    RetentionMode,
+    RetentionPolicy,
+    WatchdogResult,
+    WatchdogTest,
+)
+from api_watchdog.formatters.result_group_html import html_from_result_group
+from api_watchdog.retention import apply_retention
+
+
+class TestApplyRetention(unittest.TestCase):
+    response_text = json.dumps({"message": {"results": list(range(100))}})
+
+    def setUp(self):
+        self.test = WatchdogTest(
+            name="a test/with slashes",
+            target="http://a.com/b",
+            payload={"query": "x" * 10},
+            expectations=[],
+        )
+
+    def make_result(self, success):
+        return WatchdogResult(
+            test_name=self.test.name,
+            target=self.test.target,
+            success=success,
+            latency=0.0,
+            timestamp=0.0,
+            payload=self.test.payload,
+            response=json.loads(self.response_text),
+            results=[],
+        )
+
+    def apply(self, policy, success=True):
+        return apply_retention(
+            policy, self.test, self.make_result(success), self.response_text
+        )
+
+    def test_all(self):
+        result = self.apply(RetentionPolicy())
+        self.assertEqual(result, self.make_result(True))
+        self.assertIsNone(result.retention)
+
+    def test_none(self):
+        result = self.apply(RetentionPolicy(mode="none"), success=False)
+        self.assertIsNone(result.payload)
+        self.assertIsNone(result.response)
+        self.assertEqual(result.retention, RetentionMode.NONE)
+
+    def test_failure(self):
+        policy = RetentionPolicy(mode="failure")
+        passed = self.apply(policy, success=True)
+        self.assertIsNone(passed.payload)
+        self.assertIsNone(passed.response)
+        failed = self.apply(policy, success=False)
+        self.assertEqual(failed.payload, self.test.payload)
+        self.assertEqual(failed.response, json.loads(self.response_text))
+
+    def test_truncate(self):
+        result = self.apply(RetentionPolicy(mode="truncate", max_bytes=50))
+        self.assertEqual(result.payload, self.test.payload)
+        self.assertEqual(result.response, self.response_text[:50])
+
+    def test_spill(self):
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+
+        result = self.apply(RetentionPolicy(mode="spill", directory=directory))
+        self.assertIsNone(result.payload)
+        self.assertIsNone(result.response)
+        self.assertEqual(Path(result.response_ref).parent, directory)
+        with open(result.response_ref) as fp:
+            self.assertEqual(
+                json.load(fp),
+                {
+                    "payload": self.test.payload,
+                    "response": json.loads(self.response_text),
+                },
+            )
+
+    def test_policy_requires_settings(self):
+        with self.assertRaises(ValidationError):
+            RetentionPolicy(mode="truncate")
+        with self.assertRaises(ValidationError):
+            RetentionPolicy(mode="spill")
+
+    def test_results_serialize_and_format_in_every_mode(self):
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        policies = [
+            RetentionPolicy(),
+            RetentionPolicy(mode="none"),
+            RetentionPolicy(mode="failure"),
+            RetentionPolicy(mode="truncate", max_bytes=10),
+            RetentionPolicy(mode="spill", directory=directory),
+        ]
+        results = [self.apply(policy) for policy in policies]
+        result_group = collect_results(results)
+
+        self.assertEqual(
+            WatchdogResultGroup.parse_raw(result_group.json()), result_group
+        )
+        self.assertIn(results[-1].response_ref, html_from_result_group(result_group))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import unittest
+from unittest.mock import patch
+
+from api_watchdog.core import RetryPolicy
+from api_watchdog.retry import RetryBudget, parse_retry_after, retry_delay
+
+
+class TestParseRetryAfter(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("120"), 120.0)
+        self.assertEqual(parse_retry_after(" 3 "), 3.0)
+
+    def test_http_date(self):
+        later = datetime.now(timezone.utc) + timedelta(seconds=30)
+        self.assertAlmostEqual(parse_retry_after(format_datetime(later)), 30, delta=2)
+        earlier = datetime.now(timezone.utc) - timedelta(seconds=30)
+        self.assertEqual(parse_retry_after(format_datetime(earlier)), 0.0)
+
+    def test_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after("-1"))
+
+
+class TestRetryDelay(unittest.TestCase):
+    def test_exponential_backoff(self):
+        policy = RetryPolicy(max_attempts=10, backoff=0.5, max_backoff=3, jitter=False)
+        self.assertEqual(
+            [retry_delay(policy, attempt) for attempt in range(1, 6)],
+            [0.5, 1, 2, 3, 3],
+        )
+
+    @patch("random.uniform")
+    def test_jitter(self, uniform):
+        uniform.side_effect = lambda a, b: b / 2
+        policy = RetryPolicy(backoff=2)
+        self.assertEqual(retry_delay(policy, 2), 2)
+        uniform.assert_called_once_with(0, 4)
+
+    def test_retry_after(self):
+        policy = RetryPolicy(max_backoff=10)
+        self.assertEqual(retry_delay(policy, 1, retry_after=7), 7)
+        self.assertIsNone(retry_delay(policy, 1, retry_after=11))
+
+
+class TestRetryBudget(unittest.TestCase):
+    def test_budget(self):
+        budget = RetryBudget(2)
+        self.assertEqual([budget.take() for _ in range(3)], [True, True, False])
+        budget.reset()
+        self.assertTrue(budget.take())
+        self.assertTrue(all(RetryBudget().take() for _ in range(100)))
+
+
+if __name__ == "__main__":
+    unittest.main()
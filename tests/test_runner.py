@@ -1,8 +1,26 @@
+from collections import Counter
+import io
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+import threading
+import time
 import unittest
 from unittest.mock import patch, MagicMock
+from urllib.parse import urlparse
 
-from api_watchdog.core import WatchdogTest, Expectation
-from api_watchdog.runner import WatchdogRunner
+import requests
+
+from api_watchdog.core import (
+    Expectation,
+    ExpectationLevel,
+    MetricExpectation,
+    RateLimit,
+    RetryPolicy,
+    Timings,
+    WatchdogTest,
+)
+from api_watchdog.result_error import ResultError
+from api_watchdog.runner import Fetched, WatchdogRunner
 from api_watchdog.validate import ValidationType
 
 TRAPI_SKIP_MESSAGE = "TRAPI exentsion not installed"
@@ -13,9 +31,17 @@ try:
 except ImportError:
     TRAPI_ENABLED = False
 
+IJSON_SKIP_MESSAGE = "ijson not installed"
+try:
+    import ijson
+
+    IJSON_ENABLED = True
+except ImportError:
+    IJSON_ENABLED = False
+
 
 class TestWatchdogRunner(unittest.TestCase):
-    @patch("requests.request")
+    @patch("requests.Session.request")
     def test_run_tests(self, mock_request):
         """Test run_tests returns correct success parameter for each test."""
 
@@ -34,6 +60,7 @@ class TestWatchdogRunner(unittest.TestCase):
                 }
 
             mock.json = mocked_read
+            mock.content = dumps(mocked_read()).encode()
             return mock
 
         mock_request.side_effect = get_response_mock
@@ -81,8 +108,566 @@ class TestWatchdogRunner(unittest.TestCase):
         self.assertTrue(results[2].success)
         self.assertTrue(results[3].success)
 
+    @unittest.skipIf(not IJSON_ENABLED, IJSON_SKIP_MESSAGE)
+    @patch("requests.Session.request")
+    def test_run_tests_stream(self, mock_request):
+        """Test that streamed tests are evaluated without keeping the response."""
+        body = dumps({"a": {"b": [1, 2, 3]}, "c": "x" * 1000}).encode()
+
+        def get_response_mock(method, url=None, json=None, timeout=120, stream=False):
+            mock = MagicMock()
+            mock.status_code = 200
+            mock.content = body
+            mock.iter_content.return_value = [body[i:i + 10] for i in range(0, len(body), 10)]
+            return mock
+
+        mock_request.side_effect = get_response_mock
+
+        tests = [
+            WatchdogTest(
+                name="Paths",
+                target="http://test.com",
+                payload={},
+                expectations=[
+                    Expectation(selector=".a.b[-1]", value=3, validation_type=ValidationType.Int),
+                    Expectation(selector=".a.b[]", value=2, validation_type=ValidationType.Int, level="info"),
+                ]
+            ),
+            WatchdogTest(
+                name="Not Paths",
+                target="http://test.com",
+                payload={},
+                expectations=[
+                    Expectation(selector=".a.b | length", value=3, validation_type=ValidationType.Int),
+                ]
+            ),
+        ]
+
+        runner = WatchdogRunner(max_workers=1, stream=True)
+        paths, not_paths = runner.run_tests(tests)
+
+        self.assertTrue(paths.success)
+        self.assertEqual([r.actual for r in paths.results], [3, 1, 2, 3])
+        self.assertIsNone(paths.response)
+        self.assertTrue(mock_request.call_args_list[0].kwargs["stream"])
+
+        self.assertTrue(not_paths.success)
+        self.assertIsNotNone(not_paths.response)
+        self.assertNotIn("stream", mock_request.call_args_list[1].kwargs)
+
+    @patch("requests.Session.request")
+    def test_run_tests_max_response_bytes(self, mock_request):
+        """Test that oversized responses are cut off and reported."""
+        body = dumps({"a": "x" * 1000}).encode()
+        declared = {}
+
+        def get_response_mock(method, url=None, json=None, timeout=120, stream=False):
+            mock = MagicMock()
+            mock.status_code = 200
+            mock.headers = dict(declared)
+            mock.iter_content.return_value = [body[i:i + 100] for i in range(0, len(body), 100)]
+            return mock
+
+        mock_request.side_effect = get_response_mock
+
+        def make_test(name, max_response_bytes=None):
+            return WatchdogTest(
+                name=name,
+                target="http://test.com",
+                payload={},
+                max_response_bytes=max_response_bytes,
+                expectations=[
+                    Expectation(selector=".a | length", value=1000, validation_type=ValidationType.Int),
+                ]
+            )
+
+        runner = WatchdogRunner(max_response_bytes=2000)
+        within, over = runner.run_tests([make_test("within"), make_test("over", 500)])
+
+        self.assertTrue(within.success)
+        self.assertEqual(within.response_bytes, len(body))
+        self.assertFalse(over.success)
+        self.assertEqual(over.results[0].result, ResultError.PayloadTooLarge)
+        self.assertEqual(over.response_bytes, 600)
+        self.assertIsNone(over.response)
+
+        declared["Content-Length"] = str(len(body))
+        (declared_over,) = runner.run_tests([make_test("declared", 500)])
+        self.assertEqual(declared_over.results[0].result, ResultError.PayloadTooLarge)
+        self.assertEqual(declared_over.response_bytes, 0)
+
+    @patch("requests.Session.request")
+    def test_run_tests_eval_workers(self, mock_request):
+        """Test that evaluating in a process pool gives the same results."""
+
+        def get_response_mock(method, url=None, json=None, timeout=120):
+            mock = MagicMock()
+            mock.status_code = 200 if json["n"] else 503
+            mock.content = dumps({"n": json["n"], "doubled": json["n"] * 2}).encode()
+            return mock
+
+        mock_request.side_effect = get_response_mock
+
+        tests = [
+            WatchdogTest(
+                name=str(n),
+                target="http://test.com",
+                payload={"n": n},
+                expectations=[
+                    Expectation(selector=".doubled", value=4, validation_type=ValidationType.Int),
+                ]
+            )
+            for n in range(4)
+        ]
+
+        in_threads = list(WatchdogRunner().run_tests(tests))
+        in_processes = list(WatchdogRunner(eval_workers=2).run_tests(tests))
+
+        self.assertEqual(
+            [r.dict(exclude={"timestamp", "latency", "timings"}) for r in in_processes],
+            [r.dict(exclude={"timestamp", "latency", "timings"}) for r in in_threads],
+        )
+        self.assertEqual([r.success for r in in_processes], [False, False, True, False])
+
+    @patch("requests.Session.request")
+    def test_run_tests_coalesce(self, mock_request):
+        """Test that identical requests are sent once and shared by their tests."""
+
+        def get_response_mock(method, url=None, json=None, timeout=120):
+            mock = MagicMock()
+            mock.status_code = 200
+            mock.content = dumps({"n": json["n"]}).encode()
+            return mock
+
+        mock_request.side_effect = get_response_mock
+
+        def make_test(name, n, value, target="http://test.com"):
+            return WatchdogTest(
+                name=name,
+                target=target,
+                payload={"n": n},
+                expectations=[
+                    Expectation(selector=".n", value=value, validation_type=ValidationType.Int),
+                ]
+            )
+
+        tests = [
+            make_test("a", 1, 1),
+            make_test("b", 2, 2),
+            make_test("c", 1, 2),
+            make_test("d", 1, 1, target="http://other.com"),
+        ]
+
+        results = list(WatchdogRunner(coalesce=True).run_tests(tests))
+
+        self.assertEqual(mock_request.call_count, 3)
+        self.assertEqual([r.test_name for r in results], ["a", "b", "c", "d"])
+        self.assertEqual([r.success for r in results], [True, True, False, True])
+        self.assertIsNotNone(results[0].shared_request)
+        self.assertEqual(results[0].shared_request, results[2].shared_request)
+        self.assertEqual(results[0].latency, results[2].latency)
+        self.assertIsNone(results[1].shared_request)
+        self.assertIsNone(results[3].shared_request)
+
+        mock_request.reset_mock()
+        list(WatchdogRunner().run_tests(tests))
+        self.assertEqual(mock_request.call_count, 4)
+
+    def test_request_key_settings(self):
+        """Test that tests fetched with other timeouts, retries or limits are not coalesced."""
+        runner = WatchdogRunner(coalesce=True)
+
+        def key(**settings):
+            return runner.request_key(
+                WatchdogTest(
+                    name="a", target="http://test.com", payload={}, expectations=[], **settings
+                )
+            )
+
+        self.assertEqual(key(), key())
+        self.assertEqual(key(), key(read_timeout=runner.read_timeout))
+        for settings in (
+            {"connect_timeout": 1.0},
+            {"read_timeout": 1.0},
+            {"retry": RetryPolicy(max_attempts=5)},
+            {"max_response_bytes": 10},
+        ):
+            with self.subTest(**settings):
+                self.assertNotEqual(key(), key(**settings))
+
+    @patch("requests.Session.request")
+    def test_run_tests_host_concurrency(self, mock_request):
+        """Test that a host concurrency cap holds without stalling other hosts."""
+        lock = threading.Lock()
+        in_flight = Counter()
+        peak = Counter()
+
+        def get_response_mock(method, url=None, json=None, timeout=120):
+            host = urlparse(url).netloc
+            with lock:
+                in_flight[host] += 1
+                peak[host] = max(peak[host], in_flight[host])
+            time.sleep(0.02)
+            with lock:
+                in_flight[host] -= 1
+            mock = MagicMock()
+            mock.status_code = 200
+            mock.content = b"{}"
+            return mock
+
+        mock_request.side_effect = get_response_mock
+
+        tests = [
+            WatchdogTest(
+                name=f"{host}{n}",
+                target=f"http://{host}.com",
+                payload={"n": n},
+                rate_limit=RateLimit(max_concurrency=1) if host == "fragile" else None,
+                expectations=[],
+            )
+            for n in range(6)
+            for host in ("fragile", "sturdy")
+        ]
+
+        results = list(
+            WatchdogRunner(max_workers=6, rate_limit=RateLimit(max_concurrency=3))
+            .run_tests(tests)
+        )
+
+        self.assertEqual([r.test_name for r in results], [t.name for t in tests])
+        self.assertEqual(peak["fragile.com"], 1)
+        self.assertEqual(peak["sturdy.com"], 3)
+
+    @patch("requests.Session.request")
+    def test_run_tests_retry_rate_limit(self, mock_request):
+        """Test that every retry waits for a token of the host."""
+        sent = []
+
+        def get_response_mock(method, url=None, json=None, timeout=120):
+            sent.append(time.monotonic())
+            mock = MagicMock()
+            mock.status_code = 503 if len(sent) < 4 else 200
+            mock.headers = {}
+            mock.content = b"{}"
+            return mock
+
+        mock_request.side_effect = get_response_mock
+        test = WatchdogTest(
+            name="flaky",
+            target="http://test.com",
+            payload={},
+            retry=RetryPolicy(max_attempts=4, backoff=0.001, jitter=False),
+            rate_limit=RateLimit(requests_per_second=10),
+            expectations=[],
+        )
+
+        (result,) = WatchdogRunner().run_tests([test])
+
+        self.assertTrue(result.success)
+        self.assertEqual(len(result.attempts), 4)
+        for previous, attempt in zip(sent, sent[1:]):
+            self.assertGreaterEqual(attempt - previous, 0.09)
+
+    @patch("time.sleep")
+    @patch("requests.Session.request")
+    def test_run_tests_retry(self, mock_request, mock_sleep):
+        """Test that failed requests are retried and every attempt is recorded."""
+        statuses = {}
+
+        def get_response_mock(method, url=None, json=None, timeout=120):
+            mock = MagicMock()
+            mock.status_code = statuses[json["name"]].pop(0)
+            mock.headers = {"Retry-After": "7"} if mock.status_code == 429 else {}
+            mock.content = dumps({"ok": True}).encode()
+            return mock
+
+        mock_request.side_effect = get_response_mock
+
+        def make_test(name, retry=None):
+            return WatchdogTest(
+                name=name,
+                target="http://test.com",
+                payload={"name": name},
+                retry=retry,
+                expectations=[
+                    Expectation(selector=".ok", value=True, validation_type=ValidationType.Bool),
+                ]
+            )
+
+        statuses.update(flaky=[503, 429, 200], down=[503, 503, 503], bad=[400], once=[503])
+        tests = [
+            make_test("flaky"),
+            make_test("down"),
+            make_test("bad"),
+            make_test("once", retry=RetryPolicy(max_attempts=1)),
+        ]
+        runner = WatchdogRunner(
+            max_workers=1, retry=RetryPolicy(max_attempts=3, backoff=2, jitter=False)
+        )
+        flaky, down, bad, once = runner.run_tests(tests)
+
+        self.assertTrue(flaky.success)
+        self.assertEqual([a.status_code for a in flaky.attempts], [503, 429, 200])
+        self.assertEqual(flaky.latency, flaky.attempts[-1].latency)
+        self.assertFalse(down.success)
+        self.assertEqual(len(down.attempts), 3)
+        self.assertEqual(down.results[0].result, ResultError.ServiceUnavailable)
+        self.assertIsNone(bad.attempts)
+        self.assertIsNone(once.attempts)
+        self.assertEqual(
+            [c.args[0] for c in mock_sleep.call_args_list], [2, 7, 2, 4]
+        )
+
+        # the budget is shared by the whole run
+        mock_request.reset_mock()
+        statuses.update(flaky=[503, 503, 200], down=[503, 503, 503])
+        runner = WatchdogRunner(
+            max_workers=1,
+            retry=RetryPolicy(max_attempts=3, jitter=False),
+            retry_budget=3,
+        )
+        flaky, down = runner.run_tests([make_test("flaky"), make_test("down")])
+        self.assertTrue(flaky.success)
+        self.assertEqual(len(down.attempts), 2)
+        self.assertEqual(mock_request.call_count, 5)
+
+    @patch("requests.Session.request")
+    def test_run_tests_circuit_breaker(self, mock_request):
+        """Test that tests against an unreachable host are skipped."""
+
+        def get_response_mock(method, url=None, json=None, timeout=120):
+            if "down" in url:
+                raise requests.ConnectionError("connection refused")
+            mock = MagicMock()
+            mock.status_code = 200
+            mock.content = b"{}"
+            return mock
+
+        mock_request.side_effect = get_response_mock
+
+        tests = [
+            WatchdogTest(
+                name=f"{host}{n}",
+                target=f"http://{host}.com",
+                payload={"n": n},
+                expectations=[
+                    Expectation(selector=".", value={}, validation_type=ValidationType.Object),
+                ]
+            )
+            for n in range(4)
+            for host in ("down", "up")
+        ]
+
+        runner = WatchdogRunner(max_workers=1, breaker_threshold=2, breaker_reset=60)
+        results = list(runner.run_tests(tests))
+
+        down = [r for r in results if r.test_name.startswith("down")]
+        up = [r for r in results if r.test_name.startswith("up")]
+        self.assertTrue(all(r.success and r.skipped is None for r in up))
+        self.assertEqual([r.skipped for r in down], [None, None, "host unavailable", "host unavailable"])
+        self.assertEqual(down[0].results[0].result, ResultError.ServiceUnavailable)
+        self.assertEqual(down[3].results[0].result, "skipped")
+        self.assertFalse(down[3].success)
+        self.assertEqual(mock_request.call_count, 6)
+
+    @patch("requests.Session.request")
+    def test_run_tests_timeouts_and_deadline(self, mock_request):
+        """Test per test timeouts, and that the run ends at its deadline."""
+
+        def get_response_mock(method, url=None, json=None, timeout=None, stream=False):
+            time.sleep(json["sleep"])
+            response = requests.Response()
+            response.status_code = 200
+            response.raw = io.BytesIO(b"{}")
+            return response
+
+        mock_request.side_effect = get_response_mock
+
+        def make_test(name, sleep, **kwargs):
+            return WatchdogTest(
+                name=name,
+                target="http://test.com",
+                payload={"sleep": sleep},
+                expectations=[
+                    Expectation(selector=".", value={}, validation_type=ValidationType.Object),
+                ],
+                **kwargs
+            )
+
+        runner = WatchdogRunner(max_workers=1, connect_timeout=5, read_timeout=30)
+        list(runner.run_tests([make_test("default", 0), make_test("own", 0, read_timeout=2)]))
+        self.assertEqual(
+            [c.kwargs["timeout"] for c in mock_request.call_args_list], [(5, 30), (5, 2)]
+        )
+
+        mock_request.reset_mock()
+        runner = WatchdogRunner(max_workers=1, read_timeout=30, deadline=0.3)
+        start = time.monotonic()
+        fast, slow, pending = runner.run_tests(
+            [make_test("fast", 0), make_test("slow", 1), make_test("pending", 0)]
+        )
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertTrue(fast.success)
+        self.assertEqual(slow.results[0].result, ResultError.RequestTimeout)
+        self.assertEqual(pending.results[0].result, ResultError.RequestTimeout)
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertLessEqual(mock_request.call_args_list[1].kwargs["timeout"][1], 0.3)
+        # with a deadline, responses are streamed so they can be cut off
+        self.assertTrue(mock_request.call_args_list[1].kwargs["stream"])
+
+    def test_run_tests_deadline_slow_body(self):
+        """Test that a body still arriving at the deadline is abandoned."""
+
+        class SlowHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                self.send_response(200)
+                self.send_header("Content-Length", "300")
+                self.end_headers()
+                for _ in range(30):
+                    time.sleep(0.1)
+                    try:
+                        self.wfile.write(b" " * 10)
+                    except OSError:
+                        return
+
+            def log_message(self, format, *args):
+                pass
+
+        # closing after the response, and keeping the connection alive
+        for protocol_version in ("HTTP/1.0", "HTTP/1.1"):
+            with self.subTest(protocol_version=protocol_version):
+                SlowHandler.protocol_version = protocol_version
+                server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                self.addCleanup(server.server_close)
+                self.addCleanup(server.shutdown)
+
+                test = WatchdogTest(
+                    name="slow",
+                    target=f"http://127.0.0.1:{server.server_port}/",
+                    payload={"n": 1},
+                    expectations=[
+                        Expectation(selector=".", value={}, validation_type=ValidationType.Object),
+                    ],
+                )
+                before = set(threading.enumerate())
+                start = time.monotonic()
+                (result,) = WatchdogRunner(max_workers=1, deadline=0.5).run_tests([test])
+                self.assertLess(time.monotonic() - start, 1.0)
+                self.assertEqual(result.results[0].result, ResultError.RequestTimeout)
+                self.assertFalse(result.success)
+                # the abandoned worker stops reading soon after the deadline
+                for thread in set(threading.enumerate()) - before:
+                    if thread.name.startswith("ThreadPoolExecutor"):
+                        thread.join(timeout=3)
+                        self.assertFalse(thread.is_alive())
+                self.assertLess(time.monotonic() - start, 1.0)
+
+    @patch("requests.Session.request")
+    def test_run_tests_metric_expectations(self, mock_request):
+        """Test that latency and size thresholds are checked with their level."""
+
+        def get_response_mock(method, url=None, json=None, timeout=120):
+            mock = MagicMock()
+            mock.status_code = 200 if json["size"] else 503
+            mock.content = dumps("x" * json["size"]).encode()
+            return mock
+
+        mock_request.side_effect = get_response_mock
+
+        def make_test(size, level):
+            return WatchdogTest(
+                name=f"{size} {level}",
+                target="http://test.com",
+                payload={"size": size},
+                expectations=[],
+                metric_expectations=[
+                    MetricExpectation(metric="latency", max="100s"),
+                    MetricExpectation(metric="response_bytes", max="1KiB", level=level),
+                    MetricExpectation(metric="connect", max=0),
+                ],
+            )
+
+        small, large_warning, large_critical, failed = WatchdogRunner(max_workers=1).run_tests(
+            [
+                make_test(10, "critical"),
+                make_test(2000, "warning"),
+                make_test(2000, "critical"),
+                make_test(0, "critical"),
+            ]
+        )
+
+        self.assertTrue(small.success)
+        self.assertEqual([r.result for r in small.results], ["success"] * 3)
+        self.assertEqual(small.results[1].actual, 12)
+        # connect was not measured on the mocked session
+        self.assertIsNone(small.results[2].actual)
+        self.assertTrue(large_warning.success)
+        self.assertEqual(large_warning.results[1].result, "value")
+        self.assertEqual(large_warning.results[1].expectation.level, ExpectationLevel.WARNING)
+        self.assertFalse(large_critical.success)
+        self.assertEqual(large_critical.results[1].result, "value")
+        self.assertEqual(large_critical.results[1].actual, 2002)
+        self.assertEqual(
+            [r.result for r in failed.results], [ResultError.ServiceUnavailable] * 3
+        )
+
+    def test_metric_expectation_boundary(self):
+        """Test that a metric must stay below max, and unmeasured ones are refused."""
+        fetched = Fetched(status_code=200, latency=1.0, response_bytes=12)
+        for max_, result in ((12, "value"), (13, "success")):
+            resolved = WatchdogRunner.resolve_metric_expectation(
+                MetricExpectation(metric="response_bytes", max=max_), fetched, Timings()
+            )
+            self.assertEqual(resolved.result, result)
+
+        test = WatchdogTest(
+            name="dns",
+            target="http://test.com",
+            payload={},
+            expectations=[],
+            metric_expectations=[MetricExpectation(metric="dns", max="10ms")],
+        )
+        runner = WatchdogRunner(max_workers=1)
+        with self.assertRaisesRegex(ValueError, "dns is not measured"):
+            list(runner.run_tests([test]))
+        with self.assertRaisesRegex(ValueError, "dns is not measured"):
+            runner.run_test(test)
+
+    def test_metric_expectation_units(self):
+        """Test that thresholds may be given with a unit matching their metric."""
+        self.assertEqual(MetricExpectation(metric="latency", max="250ms").max, 0.25)
+        self.assertEqual(MetricExpectation(metric="ttfb", max=2).max, 2)
+        self.assertEqual(MetricExpectation(metric="response_bytes", max="50MB").max, 50e6)
+        self.assertEqual(MetricExpectation(metric="response_bytes", max="2 KiB").max, 2048)
+        for metric, threshold in (("latency", "5MB"), ("response_bytes", "1s"), ("latency", "fast")):
+            with self.assertRaises(ValueError):
+                MetricExpectation(metric=metric, max=threshold)
+
+    def test_sessions_pooled_per_host_and_proxy(self):
+        """Test that tests share a session only when scheme, host and proxy match."""
+
+        def make_test(target, proxy=None):
+            return WatchdogTest(
+                name=target, target=target, proxy=proxy, payload={}, expectations=[]
+            )
+
+        runner = WatchdogRunner(max_workers=4)
+        a = runner._session(make_test("http://a.com/x"))
+        self.assertIs(a, runner._session(make_test("http://a.com/y")))
+        self.assertIsNot(a, runner._session(make_test("https://a.com/x")))
+        self.assertIsNot(a, runner._session(make_test("http://b.com/x")))
+        proxied = runner._session(make_test("http://a.com/x", proxy="http://proxy:3128"))
+        self.assertIsNot(a, proxied)
+        self.assertEqual(proxied.proxies["https"], "http://proxy:3128")
+        self.assertEqual(a.get_adapter("http://a.com/")._pool_maxsize, 4)
+
+        runner.close()
+        self.assertEqual(runner._sessions, {})
+
     @unittest.skipIf(not TRAPI_ENABLED, TRAPI_SKIP_MESSAGE)
-    @patch("requests.request")
+    @patch("requests.Session.request")
     def test_run_tests_trapi_validation(self, mock_request):
         """
         Test run_tests returns correct success parameter for each test when
@@ -121,6 +706,7 @@ class TestWatchdogRunner(unittest.TestCase):
                 }
 
             mock.json = mocked_read
+            mock.content = dumps(mocked_read()).encode()
             return mock
 
         mock_request.side_effect = get_response_mock
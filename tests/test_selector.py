@@ -0,0 +1,220 @@
+import unittest
+
+from pydantic import ValidationError
+
+from api_watchdog.core import Expectation, WatchdogTest
+import json
+
+from api_watchdog.selector import (
+    compile_selector,
+    evaluate_path,
+    evaluate_selectors,
+    parse_path,
+)
+from api_watchdog.validate import ValidationType
+
+
+class TestCompileSelector(unittest.TestCase):
+    def test_compiled_programs_are_reused(self):
+        """Test that repeated selectors hit the shared program cache."""
+        compile_selector.cache_clear()
+        for _ in range(3):
+            Expectation(selector=".a.b", value=1, validation_type=ValidationType.Int)
+        info = compile_selector.cache_info()
+        self.assertEqual(info.misses, 1)
+        self.assertEqual(info.hits, 2)
+        self.assertIs(compile_selector(".a.b"), compile_selector(".a.b"))
+
+    def test_invalid_selector_rejected_at_load_time(self):
+        """Test that a selector that does not compile fails test parsing."""
+        with self.assertRaises(ValidationError):
+            WatchdogTest.parse_obj(
+                {
+                    "name": "broken",
+                    "target": "http://a.com/",
+                    "payload": {},
+                    "expectations": [
+                        {"selector": ".a[", "value": 1, "validation_type": "int"}
+                    ],
+                }
+            )
+
+
+class TestEvaluateSelectors(unittest.TestCase):
+    document = '{"a": [1, 2], "b": {"c": 3}}'
+
+    def test_matches_individual_evaluation(self):
+        """Test that single pass evaluation matches running each selector alone."""
+        selectors = [
+            ".a[]",
+            ".b.c # trailing comment",
+            ".a | length",
+            "def f: .b; f",
+            ".missing",
+            '.a[] | if . == 2 then error("two") else . end',
+            ".b[] | .x",
+        ]
+        expected = []
+        for selector in selectors:
+            values = []
+            try:
+                for value in compile_selector(selector).input_text(self.document):
+                    values.append(value)
+                expected.append((values, False))
+            except ValueError:
+                expected.append((values, True))
+
+        self.assertEqual(evaluate_selectors(selectors, self.document), expected)
+
+    def test_falls_back_when_program_halts(self):
+        """Test that an uncatchable halt only affects its own selector."""
+        self.assertEqual(
+            evaluate_selectors([".b.c", "halt_error"], self.document),
+            [([3], False), ([], False)],
+        )
+
+
+class TestPathFastPath(unittest.TestCase):
+    """Compare the python path evaluator with jq over a corpus of selectors."""
+
+    documents = [
+        """
+        {
+          "message": {
+            "knowledge_graph": {
+              "nodes": {
+                "MONDO:0005148": {"name": "type 2 diabetes mellitus", "categories": ["biolink:Disease"]},
+                "NCBIGene:3630": {"name": "INS", "categories": ["biolink:Gene", "biolink:Protein"]}
+              },
+              "edges": {}
+            },
+            "results": [
+              {"score": 1.0, "node_bindings": {"n0": [{"id": "MONDO:0005148"}]}},
+              {"score": 0.25, "node_bindings": {"n0": [{"id": "NCBIGene:3630"}]}},
+              {"score": null, "node_bindings": {}}
+            ],
+            "logs": null
+          },
+          "status": "Success",
+          "big": 100000000000000000001,
+          "bigger": 12345678901234567890,
+          "negative big": -12345678901234567890,
+          "big float": 1.2345678901234568e19,
+          "exact": 9007199254740993,
+          "huge": 1e400,
+          "integral": 2.0,
+          "weird key": {"a.b": true},
+          "mixed": [1, "a", null, {"x": 1}, [2]],
+          "dupe": 1, "dupe": 2
+        }
+        """,
+        '[{"a": 1}, 5, {"a": 2}, null, [3]]',
+        "null",
+        '"string"',
+        "3.5",
+    ]
+
+    selectors = [
+        ".",
+        ".message",
+        ".status",
+        ".missing",
+        ".missing.deeper",
+        ".message.knowledge_graph.nodes[\"MONDO:0005148\"].name",
+        ".message.knowledge_graph.nodes.\"NCBIGene:3630\".categories[]",
+        ".message.knowledge_graph.nodes[].categories[0]",
+        ".message.knowledge_graph.nodes[].categories[-1]",
+        ".message.knowledge_graph.nodes[].categories[5]",
+        ".message.knowledge_graph.edges[]",
+        ".message.results[].score",
+        ".message.results[-1].node_bindings",
+        ".message.results[0].node_bindings.n0[0].id",
+        ".message.logs[]",
+        ".message.logs[]?",
+        ".message.logs[0]",
+        ".status[0]",
+        ".status[0]?",
+        ".status.x",
+        ".status.x?.y",
+        ".big",
+        ".bigger",
+        '."negative big"',
+        '."big float"',
+        ".exact",
+        ".huge",
+        ".integral",
+        '."weird key"["a.b"]',
+        ".mixed[]",
+        ".mixed[].x",
+        ".mixed[].x?",
+        ".mixed[][0]?",
+        ".dupe",
+        ".[]",
+        ".[]?",
+        ".[0]",
+        ".[-1]",
+        ".[].a",
+        ".[].a?",
+        ".[]?.a",
+        ".a",
+        ".a?",
+        ".[0].a",
+        " .message .status ",
+    ]
+
+    def test_paths_recognized(self):
+        """Test that every corpus selector is recognized as a plain path."""
+        for selector in self.selectors:
+            with self.subTest(selector=selector):
+                self.assertIsNotNone(parse_path(selector))
+
+    def test_non_paths_rejected(self):
+        """Test that anything beyond a plain path is left to jq."""
+        for selector in [
+            "[0]",
+            "..",
+            ".a | .b",
+            ".a, .b",
+            ".[1.5]",
+            ".[.a]",
+            '.["a\\(.b)"]',
+            ".a // 1",
+            "length",
+            ".a[1:2]",
+        ]:
+            with self.subTest(selector=selector):
+                self.assertIsNone(parse_path(selector))
+
+    def test_python_matches_jq(self):
+        """Test that the python evaluator produces exactly what jq produces."""
+        for document in self.documents:
+            parsed = json.loads(document)
+            for selector in self.selectors:
+                with self.subTest(document=document[:20], selector=selector):
+                    values = []
+                    errored = False
+                    try:
+                        for value in compile_selector(selector).input_text(document):
+                            values.append(value)
+                    except ValueError:
+                        errored = True
+                    actual = evaluate_path(parse_path(selector), parsed)
+                    self.assertEqual(actual, (values, errored))
+                    self.assertEqual(
+                        [type(v) for v in actual[0]], [type(v) for v in values]
+                    )
+
+    def test_evaluate_selectors_mixes_engines(self):
+        """Test that fast path and jq selectors keep their order."""
+        document = '{"a": [1, 2], "b": {"c": 3}}'
+        selectors = [".a[]", ".a | length", ".b.c"]
+        self.assertEqual(
+            evaluate_selectors(
+                selectors, document, fast_path=True, document=json.loads(document)
+            ),
+            evaluate_selectors(selectors, document),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
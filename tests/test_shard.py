@@ -0,0 +1,72 @@
+from argparse import ArgumentTypeError
+import unittest
+
+from api_watchdog.shard import parse_shard, shard
+
+
+class TestShard(unittest.TestCase):
+    def setUp(self):
+        self.keys = [f"tests/{n}.watchdog.json" for n in range(100)]
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("1/3"), (1, 3))
+        self.assertEqual(parse_shard("3/3"), (3, 3))
+        for value in ("0/3", "4/3", "1", "a/b", "1/2/3"):
+            with self.subTest(value=value), self.assertRaises(ArgumentTypeError):
+                parse_shard(value)
+
+    def test_hashed(self):
+        shards = [shard(self.keys, self.keys, i, 4) for i in range(1, 5)]
+
+        # every item in exactly one shard, in the original order
+        self.assertEqual(sorted(k for s in shards for k in s), sorted(self.keys))
+        for s in shards:
+            self.assertEqual(s, [k for k in self.keys if k in s])
+            self.assertGreater(len(s), 10)
+        # the same on every call, whatever the order of the items
+        self.assertEqual(shard(self.keys[::-1], self.keys[::-1], 1, 4), shards[0][::-1])
+        # items stay in their shard when others are added
+        added = self.keys + ["tests/new.watchdog.json"]
+        self.assertEqual(
+            [k for k in shard(added, added, 2, 4) if k in self.keys], shards[1]
+        )
+
+    def test_weighted(self):
+        weights = [10.0 if n < 4 else 1.0 for n in range(100)]
+        shards = [
+            shard(list(range(100)), self.keys, i, 4, weights=weights)
+            for i in range(1, 5)
+        ]
+
+        self.assertEqual(sorted(n for s in shards for n in s), list(range(100)))
+        # one heavy item per shard and the same total weight
+        for s in shards:
+            self.assertEqual(len([n for n in s if n < 4]), 1)
+            self.assertEqual(sum(weights[n] for n in s), 34.0)
+        self.assertEqual(
+            shard(list(range(100)), self.keys, 1, 4, weights=weights), shards[0]
+        )
+
+    def test_zero_weights(self):
+        items = list(range(100))
+        hashed = [shard(items, self.keys, i, 3) for i in range(1, 4)]
+
+        # eg. an empty history, where every test is expected to take 0 s
+        zero = [shard(items, self.keys, i, 3, weights=[0.0] * 100) for i in range(1, 4)]
+        self.assertEqual(zero, hashed)
+
+        # tests new to the history are hashed, the others balanced
+        weights = [0.0 if n % 2 else 1.0 for n in items]
+        shards = [shard(items, self.keys, i, 3, weights=weights) for i in range(1, 4)]
+        self.assertEqual(sorted(n for s in shards for n in s), items)
+        for s, hashed_shard in zip(shards, hashed):
+            self.assertEqual([n for n in s if n % 2], [n for n in hashed_shard if n % 2])
+            self.assertIn(sum(weights[n] for n in s), (16.0, 17.0))
+
+    def test_single_shard(self):
+        self.assertEqual(shard(self.keys, self.keys, 1, 1), self.keys)
+        self.assertEqual(shard(self.keys, self.keys, 1, 1, weights=[0.0] * 100), self.keys)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import unittest
+
+from api_watchdog.selector import evaluate_path, parse_path
+
+IJSON_SKIP_MESSAGE = "ijson not installed"
+try:
+    import ijson
+
+    from api_watchdog.stream import project_stream
+
+    IJSON_ENABLED = True
+except ImportError:
+    IJSON_ENABLED = False
+
+
+@unittest.skipIf(not IJSON_ENABLED, IJSON_SKIP_MESSAGE)
+class TestProjectStream(unittest.TestCase):
+    document = """
+    {
+      "message": {
+        "knowledge_graph": {
+          "nodes": {
+            "MONDO:0005148": {"name": "type 2 diabetes mellitus", "categories": ["biolink:Disease"]},
+            "NCBIGene:3630": {"name": "INS", "categories": ["biolink:Gene", "biolink:Protein"]}
+          },
+          "edges": {"e0": {"subject": "NCBIGene:3630", "object": "MONDO:0005148"}}
+        },
+        "results": [
+          {"score": 1.5, "node_bindings": {"n0": [{"id": "MONDO:0005148"}]}},
+          {"score": 0.25, "node_bindings": {"n0": [{"id": "NCBIGene:3630"}]}},
+          {"score": null, "node_bindings": {}}
+        ]
+      },
+      "status": "Success",
+      "big": 100000000000000000001,
+      "mixed": [1, "a", null, {"x": 1}, [2]]
+    }
+    """
+
+    selectors = [
+        ".",
+        ".status",
+        ".missing.deeper",
+        ".message.knowledge_graph.nodes[\"MONDO:0005148\"].name",
+        ".message.knowledge_graph.nodes[].categories[-1]",
+        ".message.knowledge_graph.edges",
+        ".message.results[].score",
+        ".message.results[1].node_bindings.n0[0].id",
+        ".message.results[-1]",
+        ".message.results[7]",
+        ".status[0]",
+        ".status.x?",
+        ".big",
+        ".mixed[].x",
+        ".mixed[].x?",
+        ".mixed[3]",
+    ]
+
+    def chunks(self, size=7):
+        data = self.document.encode()
+        return [data[i:i + size] for i in range(0, len(data), size)]
+
+    def test_projection_matches_full_document(self):
+        """Test that selectors give the same results on the projection."""
+        parsed = json.loads(self.document)
+        paths = [parse_path(selector) for selector in self.selectors]
+        together = project_stream(self.chunks(), paths)
+        for selector, path in zip(self.selectors, paths):
+            with self.subTest(selector=selector):
+                expected = evaluate_path(path, parsed)
+                self.assertEqual(evaluate_path(path, together), expected)
+                alone = project_stream(self.chunks(), [path])
+                self.assertEqual(evaluate_path(path, alone), expected)
+
+    def test_projection_drops_unselected_data(self):
+        """Test that only the selected subtrees are materialized."""
+        projection = project_stream(
+            self.chunks(), [parse_path(".message.results[1].score")]
+        )
+        self.assertEqual(projection, {"message": {"results": [None, {"score": 0.25}]}})
+
+    def test_invalid_json_raises(self):
+        """Test that a malformed body raises instead of projecting."""
+        with self.assertRaises(ijson.JSONError):
+            project_stream([b'{"a": [1, 2'], [parse_path(".a")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from api_watchdog.core import Expectation, Timings, WatchdogTest
+from api_watchdog.runner import WatchdogRunner
+from api_watchdog.timing import Phases, measure
+from api_watchdog.validate import ValidationType
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        content = json.dumps({"echo": json.loads(body)}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestPhases(unittest.TestCase):
+    def test_timings(self):
+        phases = Phases()
+        phases.start = 10.0
+        phases.add("connect", 0.5)
+        phases.add("tls", 1.0)
+        phases.headers = 14.0
+        phases.end = 16.0
+        self.assertEqual(
+            phases.timings(),
+            Timings(connect=0.5, tls=1.0, ttfb=2.5, download=2.0),
+        )
+
+    def test_no_response(self):
+        phases = Phases()
+        phases.add("connect", 0.5)
+        phases.finish()
+        self.assertEqual(phases.timings(), Timings(connect=0.5))
+
+    def test_measure(self):
+        timings = Timings()
+        for _ in range(2):
+            with measure(timings, "parse"):
+                pass
+        self.assertGreater(timings.parse, 0)
+        self.assertIsNone(timings.select)
+
+
+class TestRunnerTimings(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_phases(self):
+        target = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        tests = [
+            WatchdogTest(
+                name=str(n),
+                target=target,
+                payload={"n": n},
+                expectations=[
+                    Expectation(selector=".echo.n", value=n, validation_type=ValidationType.Int)
+                ],
+            )
+            for n in range(2)
+        ]
+        first, second = WatchdogRunner(max_workers=1).run_tests(tests)
+
+        self.assertTrue(first.success and second.success)
+        for result in (first, second):
+            timings = result.timings
+            for phase in ("ttfb", "download", "parse", "select", "validation"):
+                self.assertIsNotNone(getattr(timings, phase), phase)
+            self.assertIsNone(timings.tls)
+            # requests reports the DNS lookup as part of connect
+            self.assertEqual(timings.unmeasured, ["dns"])
+            self.assertLessEqual(
+                (timings.connect or 0) + timings.ttfb + timings.download, result.latency
+            )
+        # the second request reuses the connection of the first
+        self.assertIsNotNone(first.timings.connect)
+        self.assertIsNone(second.timings.connect)
+
+    def test_warm_up(self):
+        target = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        tests = [
+            WatchdogTest(name=str(n), target=target, payload={"n": n}, expectations=[])
+            for n in range(3)
+        ]
+        runner = WatchdogRunner(max_workers=2, warm_up=True)
+        results = list(runner.run_tests(tests))
+
+        (warm_up,) = runner.warm_ups
+        self.assertEqual(warm_up.target, target.rstrip("/"))
+        self.assertEqual(warm_up.connections, 2)
+        self.assertIsNone(warm_up.error)
+        self.assertIsNotNone(warm_up.timings.connect)
+        self.assertEqual(warm_up.timings.unmeasured, ["dns"])
+        self.assertGreaterEqual(runner.warm_up_time, warm_up.timings.connect)
+        # every test ran on a connection opened by the warm-up
+        self.assertTrue(all(r.timings.connect is None for r in results))
+
+    def test_warm_up_deadline(self):
+        target = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        test = WatchdogTest(name="1", target=target, payload={"n": 1}, expectations=[])
+        runner = WatchdogRunner(warm_up=True, connect_timeout=120, deadline=0.2)
+        self.assertEqual(runner._warm_up_timeout(test), 10.0)
+
+        list(runner.run_tests([test]))
+        # the deadline of the first run has passed when the second warms up
+        time.sleep(0.3)
+        (result,) = runner.run_tests([test])
+
+        (warm_up,) = runner.warm_ups
+        self.assertIsNone(warm_up.error)
+        self.assertEqual(warm_up.connections, 1)
+        self.assertTrue(result.success)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import json
+import unittest
+
+from api_watchdog.core import Expectation, ExpectationResult
+from api_watchdog.validate import (
+    compile_schema,
+    disable_validation_cache,
+    enable_validation_cache,
+    fastjsonschema,
+    LazyModel,
+    set_validation_backend,
+    validate,
+    ValidationBackend,
+    ValidationCache,
+    ValidationError,
+    validation_registry,
+    ValidationType,
+)
+
+FASTJSONSCHEMA_SKIP_MESSAGE = "fastjsonschema not installed"
+
+
+class TestValidationCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ValidationCache(maxsize=2)
+
+    def test_hits_identical_content(self):
+        first = self.cache.validate({"a": [1, 2], "b": "c"}, ValidationType.Object)
+        second = self.cache.validate({"b": "c", "a": [1, 2]}, ValidationType.Object)
+        self.assertIs(first, second)
+        self.assertEqual(self.cache.info(), (1, 1, 2, 1))
+
+    def test_keys_include_type(self):
+        self.assertEqual(self.cache.validate(1, ValidationType.Float), 1.0)
+        self.assertEqual(self.cache.validate(1, ValidationType.String), "1")
+        self.assertIsInstance(self.cache.validate(1.0, ValidationType.Int), int)
+        self.assertEqual(self.cache.info().misses, 3)
+
+    def test_caches_failures(self):
+        for _ in range(2):
+            with self.assertRaises(ValidationError):
+                self.cache.validate([1], ValidationType.Int)
+        self.assertEqual(self.cache.info().hits, 1)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.validate(1, ValidationType.Int)
+        self.cache.validate(2, ValidationType.Int)
+        self.cache.validate(1, ValidationType.Int)
+        self.cache.validate(3, ValidationType.Int)
+        self.assertIsNone(self.cache._entries.get(self.cache.key(2, ValidationType.Int)))
+        self.assertIsNotNone(self.cache._entries.get(self.cache.key(1, ValidationType.Int)))
+        self.assertEqual(self.cache.info().currsize, 2)
+
+    def test_bypasses_non_json_values(self):
+        value = object()
+        self.assertIsNone(self.cache.key(value, ValidationType.String))
+        self.assertEqual(self.cache.validate(value, ValidationType.String), str(value))
+        self.assertEqual(self.cache.info().currsize, 0)
+
+
+class TestValidateWithCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = enable_validation_cache(maxsize=16)
+        self.addCleanup(disable_validation_cache)
+
+    def test_validate_uses_cache(self):
+        self.assertEqual(validate("3", ValidationType.Int), 3)
+        self.assertEqual(validate("3", ValidationType.Int), 3)
+        self.assertEqual(self.cache.info().hits, 1)
+
+    def test_expectation_values_use_cache(self):
+        for _ in range(3):
+            Expectation(selector=".a", value={"x": 1}, validation_type="object")
+        self.assertEqual(self.cache.info().hits, 2)
+
+
+@unittest.skipIf(fastjsonschema is None, FASTJSONSCHEMA_SKIP_MESSAGE)
+class TestSchemaBackend(unittest.TestCase):
+    knowledge_graph = {
+        "nodes": {
+            "MONDO:0005148": {
+                "name": "type 2 diabetes mellitus",
+                "categories": ["biolink:Disease"],
+                "attributes": None,
+            }
+        },
+        "edges": {},
+    }
+
+    def setUp(self):
+        set_validation_backend(ValidationBackend.Schema)
+        self.addCleanup(set_validation_backend, ValidationBackend.Pydantic)
+
+    def validate(self, x, backend=ValidationBackend.Schema):
+        set_validation_backend(backend)
+        try:
+            return validate(x, ValidationType.TrapiKnowledgeGraph)
+        finally:
+            set_validation_backend(ValidationBackend.Schema)
+
+    def test_does_not_build_model(self):
+        validated = self.validate(self.knowledge_graph)
+        self.assertIsInstance(validated, LazyModel)
+        self.assertEqual(validated, self.validate(json.loads(json.dumps(self.knowledge_graph))))
+        self.assertIsNone(validated._model)
+
+    def test_equality_matches_pydantic(self):
+        other = {"nodes": {"MONDO:0005148": {"name": "diabetes"}}, "edges": {}}
+        for a in (self.knowledge_graph, other):
+            for b in (self.knowledge_graph, other):
+                expected = self.validate(a, ValidationBackend.Pydantic) == self.validate(
+                    b, ValidationBackend.Pydantic
+                )
+                self.assertEqual(self.validate(a) == self.validate(b), expected)
+                self.assertEqual(
+                    self.validate(a) == self.validate(b, ValidationBackend.Pydantic),
+                    expected,
+                )
+                self.assertEqual(
+                    self.validate(a, ValidationBackend.Pydantic) == self.validate(b),
+                    expected,
+                )
+
+    def test_rejects_invalid_data(self):
+        for bad in ({"nodes": {"x": {"categories": "biolink:Disease"}}, "edges": {}}, {"edges": {}}, [1]):
+            with self.assertRaises(ValidationError):
+                self.validate(bad, ValidationBackend.Pydantic)
+            with self.assertRaises(ValidationError):
+                self.validate(bad)
+
+    def test_cache_keys_include_backend(self):
+        enable_validation_cache()
+        self.addCleanup(disable_validation_cache)
+        self.assertIsInstance(self.validate(self.knowledge_graph), LazyModel)
+        self.assertNotIsInstance(
+            self.validate(self.knowledge_graph, ValidationBackend.Pydantic), LazyModel
+        )
+        self.assertIsInstance(self.validate(self.knowledge_graph), LazyModel)
+
+    def test_only_object_models_are_compiled(self):
+        self.assertIsNotNone(compile_schema(validation_registry[ValidationType.TrapiNode]))
+        self.assertIsNone(compile_schema(validation_registry[ValidationType.TrapiBiolinkEntity]))
+        self.assertIsNone(compile_schema(validation_registry[ValidationType.TrapiLogLevel]))
+
+    def test_serializes_as_raw_data(self):
+        result = ExpectationResult(
+            expectation=Expectation(
+                selector=".", value=self.knowledge_graph, validation_type="trapi.knowledge_graph"
+            ),
+            result="success",
+            actual=self.validate(self.knowledge_graph),
+        )
+        self.assertEqual(json.loads(result.json())["actual"], self.knowledge_graph)
+        self.assertEqual(ExpectationResult.parse_raw(result.json()), result)
+
+
+if __name__ == "__main__":
+    unittest.main()